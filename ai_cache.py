@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from kv_store import LRUStore, SQLiteStore, TieredStore
+
+# ==============================================================================
+# AI 助教回覆快取 (Response Cache for /ask_gemini)
+# ==============================================================================
+# 同一班學生常對同一題問幾乎一樣的問題 (例如「什麼是餘式定理?」)，
+# 每次都呼叫 model.generate_content 要等好幾秒。
+# key = (技能名稱, 正規化後的題目, 正規化後的問題)；
+# 「觀念題」(什麼是…、定義…) 跟題目本身無關，只用 (技能名稱, 問題) 當 key，整個技能共用。
+
+# 出現這些字眼就當作是「觀念題」
+CONCEPT_PATTERNS = ('什麼是', '是什麼', '什麼叫', '定義', '觀念', '概念', '意思', '公式')
+# 出現這些字眼代表在問「這一題」，就算也有上面的字眼也不當觀念題
+QUESTION_SPECIFIC_PATTERNS = ('這題', '此題', '本題', '答案', '詳解', '下一步', '第一步')
+# 句尾可以省略的標點 (NFKC 之後的半形)
+SENTENCE_END = '?!.。~'
+
+def normalize_text(text):
+    """
+    正規化：全形轉半形 (NFKC)、英文轉小寫、去掉空白和句尾的問號句號。
+    其他標點 (正負號、括號) 都要留著：'-x + 2y = 5' 和 'x + 2y = 5' 是不同的題目，不能共用回覆。
+    """
+    text = unicodedata.normalize('NFKC', str(text or '')).casefold()
+    return re.sub(r'\s+', '', text).rstrip(SENTENCE_END)
+
+def is_conceptual_question(prompt):
+    normalized = normalize_text(prompt)
+    if any(pattern in normalized for pattern in QUESTION_SPECIFIC_PATTERNS):
+        return False
+    return any(pattern in normalized for pattern in CONCEPT_PATTERNS)
+
+class ResponseCache:
+    def __init__(self, store, ttl=None):
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counters = {'concept_hits': 0, 'question_hits': 0, 'misses': 0, 'stores': 0}
+
+    def make_key(self, skill_name, question, prompt):
+        if is_conceptual_question(prompt):
+            parts = ['concept', normalize_text(skill_name), normalize_text(prompt)]
+        else:
+            parts = ['question', normalize_text(skill_name), normalize_text(question), normalize_text(prompt)]
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, skill_name, question, prompt):
+        key = self.make_key(skill_name, question, prompt)
+        reply = self.store.get(key)
+        with self._lock:
+            if reply is None:
+                self._counters['misses'] += 1
+            elif is_conceptual_question(prompt):
+                self._counters['concept_hits'] += 1
+            else:
+                self._counters['question_hits'] += 1
+        return reply
+
+    def set(self, skill_name, question, prompt, reply):
+        self.store.set(self.make_key(skill_name, question, prompt), reply, self.ttl)
+        with self._lock:
+            self._counters['stores'] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        hits = counters['concept_hits'] + counters['question_hits']
+        total = hits + counters['misses']
+        counters['hit_rate'] = (hits / total) if total else None
+        counters['tiers'] = self.store.stats()
+        return counters
+
+def create_response_cache(instance_path, ttl_seconds, memory_size=2000):
+    """記憶體 LRU (含 TTL) + instance/ai_cache.db (重開機後仍保留)"""
+    memory = LRUStore(maxsize=memory_size, ttl=ttl_seconds)
+    disk = SQLiteStore(os.path.join(instance_path, 'ai_cache.db'), table='ai_responses', ttl=ttl_seconds)
+    return ResponseCache(TieredStore(memory, disk), ttl=ttl_seconds)
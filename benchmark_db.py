@@ -0,0 +1,139 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from sqlalchemy import (Boolean, Column, Integer, MetaData, String, Table, UniqueConstraint,
+                        create_engine, text)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import scoped_session, sessionmaker
+from db_config import engine_options, install_sqlite_pragmas
+from progress_service import ProgressService
+
+# ==============================================================================
+# 比較不同資料庫設定下，同時讀寫的吞吐量與 "database is locked" 次數
+#   sqlite-default : 原本的設定 (rollback journal，沒有 pragma)
+#   sqlite-tuned   : db_config.py 的設定 (WAL、busy_timeout、mmap ...)
+#   postgresql     : 有設定 DATABASE_URL 才會跑 (在暫時的 schema bench_db 裡，跑完就刪掉)
+# 寫入 = ProgressService.record_attempt (和 /check_answer 一樣)；讀取 = 單元列表的進度查詢
+# 執行方式: python benchmark_db.py
+# ==============================================================================
+
+DURATION_SECONDS = 3.0
+WRITER_THREADS = 8
+READER_THREADS = 8
+USERS = 50
+SKILLS = ['remainder-theorem', 'factor-theorem', 'linear-eq-substitution', 'linear-eq-addition', 'linear-ineq-region']
+PG_SCHEMA = 'bench_db'
+
+metadata = MetaData()
+Table('skill', metadata, Column('id', Integer, primary_key=True), Column('name', String(100), unique=True))
+Table('user_progress', metadata, Column('id', Integer, primary_key=True),
+      Column('user_id', Integer, nullable=False), Column('skill_id', Integer, nullable=False),
+      Column('consecutive_correct', Integer, default=0), Column('total_correct', Integer, default=0),
+      Column('total_attempted', Integer, default=0), Column('consecutive_incorrect', Integer, default=0),
+      UniqueConstraint('user_id', 'skill_id'))
+Table('attempt', metadata, Column('id', Integer, primary_key=True),
+      Column('user_id', Integer, nullable=False), Column('skill_id', Integer, nullable=False),
+      Column('ts', Integer, nullable=False), Column('correct', Boolean, nullable=False),
+      Column('seed', Integer), Column('latency_ms', Integer))
+Table('daily_activity', metadata, Column('id', Integer, primary_key=True),
+      Column('user_id', Integer, nullable=False), Column('skill_id', Integer, nullable=False),
+      Column('day', String(10), nullable=False), Column('attempted', Integer, nullable=False, default=0),
+      Column('correct', Integer, nullable=False, default=0), UniqueConstraint('user_id', 'skill_id', 'day'))
+
+READ_SQL = text("SELECT skill_id, consecutive_correct, total_attempted FROM user_progress WHERE user_id = :user_id")
+
+def make_engine(mode, workdir):
+    if mode == 'sqlite-default':
+        return create_engine('sqlite:///' + os.path.join(workdir, 'default.db'))
+    if mode == 'sqlite-tuned':
+        uri = 'sqlite:///' + os.path.join(workdir, 'tuned.db')
+        engine = create_engine(uri, **engine_options(uri))
+        install_sqlite_pragmas(engine)
+        return engine
+    uri = os.environ['DATABASE_URL'].replace('postgres://', 'postgresql://', 1)
+    with create_engine(uri).begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {PG_SCHEMA}"))
+    return create_engine(uri, connect_args={'options': f'-csearch_path={PG_SCHEMA}'}, **engine_options(uri))
+
+def run(mode, workdir):
+    engine = make_engine(mode, workdir)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(metadata.tables['skill'].insert(), [{'name': slug} for slug in SKILLS])
+    session_factory = scoped_session(sessionmaker(bind=engine))
+    service = ProgressService(session_factory, {slug: None for slug in SKILLS})
+    counts = {'writes': 0, 'reads': 0, 'locked': 0}
+    write_latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + DURATION_SECONDS
+
+    def writer():
+        rng = random.Random()
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    service.record_attempt(rng.randint(1, USERS), rng.choice(SKILLS), rng.random() < 0.6,
+                                           seed=rng.randint(0, 2 ** 31), latency_ms=rng.randint(1000, 60000))
+                except OperationalError:
+                    session_factory().rollback()
+                    with lock:
+                        counts['locked'] += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                with lock:
+                    counts['writes'] += 1
+                    write_latencies.append(elapsed)
+        finally:
+            session_factory.remove()
+
+    def reader():
+        rng = random.Random()
+        try:
+            while time.perf_counter() < deadline:
+                session = session_factory()
+                try:
+                    session.execute(READ_SQL, {'user_id': rng.randint(1, USERS)}).all()
+                    session.rollback()  # 結束讀取交易，不要一直佔著 snapshot
+                except OperationalError:
+                    session.rollback()
+                    with lock:
+                        counts['locked'] += 1
+                    continue
+                with lock:
+                    counts['reads'] += 1
+        finally:
+            session_factory.remove()
+
+    threads = ([threading.Thread(target=writer) for _ in range(WRITER_THREADS)] +
+               [threading.Thread(target=reader) for _ in range(READER_THREADS)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if mode == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {PG_SCHEMA} CASCADE"))
+    engine.dispose()
+    write_latencies.sort()
+    p95 = write_latencies[int(len(write_latencies) * 0.95)] * 1000 if write_latencies else float('nan')
+    print(f"{mode:<16}{counts['writes'] / DURATION_SECONDS:>10.0f}{counts['reads'] / DURATION_SECONDS:>10.0f}"
+          f"{p95:>12.1f}{counts['locked']:>8}")
+
+if __name__ == "__main__":
+    modes = ['sqlite-default', 'sqlite-tuned']
+    if os.environ.get('DATABASE_URL', '').startswith(('postgres://', 'postgresql')):
+        modes.append('postgresql')
+    print(f"{WRITER_THREADS} 個寫入執行緒 + {READER_THREADS} 個讀取執行緒，每種設定跑 {DURATION_SECONDS} 秒")
+    print(f"{'設定':<16}{'寫入/秒':>10}{'讀取/秒':>10}{'寫入p95(ms)':>12}{'鎖定錯誤':>8}")
+    workdir = tempfile.mkdtemp()
+    try:
+        for mode in modes:
+            run(mode, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, create_engine, text
+from sqlalchemy.orm import sessionmaker
+from db_config import install_sqlite_pragmas
+from import_data import PREREQ_COLUMN, SHEET_NAME, TARGET_COLUMN, import_links, read_links, slugify
+
+# ==============================================================================
+# 知識點鏈結匯入：舊的逐行 N+1 寫法 vs import_data.py 的整批比對寫入
+# 產生一個 100k 條依賴關係的假活頁簿 (隨機 DAG)，在暫時的 SQLite 資料庫裡量：
+#   - 讀取活頁簿 (pandas)
+#   - 第一次匯入 (空的資料庫)、原封不動再匯入一次、改掉 1% 的依賴關係後再匯入
+#   - 舊寫法：技能全部跑完；依賴關係 (每條查兩次 Skill + 查一次 SkillDependency) 只跑前 LEGACY_EDGES 條再換算
+# 執行方式: python benchmark_import.py
+# ==============================================================================
+
+SKILLS = 20000
+EDGES = 100000
+CHANGED_FRACTION = 0.01
+LEGACY_EDGES = 2000
+
+metadata = MetaData()
+Table('skill', metadata, Column('id', Integer, primary_key=True), Column('name', String(100), unique=True, nullable=False),
+      Column('display_name', String(100), nullable=False), Column('description', String(255)),
+      Column('main_unit', String(100)), Column('school_type', String(20)), Column('grade_level', String(20)))
+Table('skill_dependency', metadata, Column('id', Integer, primary_key=True),
+      Column('prerequisite_id', Integer, nullable=False), Column('target_id', Integer, nullable=False),
+      Index('unique_dependency', 'prerequisite_id', 'target_id', unique=True))
+Table('curriculum_version', metadata, Column('id', Integer, primary_key=True),
+      Column('version', Integer, nullable=False), Column('updated_at', Integer))
+
+def synthetic_links(rng, skill_count, edge_count):
+    """隨機 DAG：每條依賴都從編號小的技能連到編號大的技能"""
+    names = np.array([f"{'國中_' if i % 5 == 0 else ''}單元{i:05d} (第 {i % 12 + 1} 章)" for i in range(skill_count)])
+    targets = rng.integers(1, skill_count, size=edge_count * 2)
+    prerequisites = (rng.random(len(targets)) * targets).astype(np.int64)
+    pairs = np.unique(np.stack([prerequisites, targets], axis=1), axis=0)
+    pairs = pairs[rng.permutation(len(pairs))[:edge_count]]
+    return pd.DataFrame({PREREQ_COLUMN: names[pairs[:, 0]], TARGET_COLUMN: names[pairs[:, 1]]})
+
+def make_session(workdir, name):
+    engine = create_engine('sqlite:///' + os.path.join(workdir, name))
+    install_sqlite_pragmas(engine)
+    metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)()
+
+def legacy_skills(session, links):
+    """舊的 import_data.py 步驟 2：每個技能先查一次 display_name (沒有索引) 再新增"""
+    for name in pd.unique(pd.concat([links['prerequisite'], links['target']]).dropna()):
+        if session.execute(text("SELECT id FROM skill WHERE display_name = :name"), {'name': name}).first() is None:
+            session.execute(text("INSERT INTO skill (name, display_name) VALUES (:slug, :name)"),
+                            {'slug': slugify(name), 'name': name})
+    session.commit()
+
+def legacy_edges(session, links):
+    """舊的 import_data.py 步驟 3：每條依賴查兩次 Skill、再查一次 SkillDependency"""
+    for prerequisite, target in links.dropna().itertuples(index=False):
+        prerequisite_id = session.execute(text("SELECT id FROM skill WHERE display_name = :name"),
+                                          {'name': prerequisite}).scalar()
+        target_id = session.execute(text("SELECT id FROM skill WHERE display_name = :name"), {'name': target}).scalar()
+        exists = session.execute(text("SELECT id FROM skill_dependency WHERE prerequisite_id = :p AND target_id = :t"),
+                                 {'p': prerequisite_id, 't': target_id}).first()
+        if exists is None:
+            session.execute(text("INSERT INTO skill_dependency (prerequisite_id, target_id) VALUES (:p, :t)"),
+                            {'p': prerequisite_id, 't': target_id})
+    session.commit()
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"  {label:<34}{time.perf_counter() - start:>8.2f} 秒")
+    return result
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp()
+    try:
+        workbook = os.path.join(workdir, 'synthetic.xlsx')
+        frame = synthetic_links(rng, SKILLS, EDGES)
+        print(f"產生假活頁簿: {SKILLS} 個技能、{len(frame)} 條依賴關係")
+        timed("寫入 xlsx (只是準備資料)", frame.to_excel, workbook, sheet_name=SHEET_NAME, index=False)
+        links = timed("讀取活頁簿 (read_links)", read_links, workbook)
+
+        print("import_data.py (整批比對寫入):")
+        engine, session = make_session(workdir, 'bulk.db')
+        timed("第一次匯入 (空的資料庫)", import_links, session, links)
+        timed("原封不動再匯入一次", import_links, session, links)
+        changed = links.copy()
+        rows = rng.choice(len(changed), size=int(len(changed) * CHANGED_FRACTION), replace=False)
+        changed.loc[rows, 'prerequisite'] = changed.loc[rows, 'target'].str.replace('單元', '新單元', regex=False)
+        timed(f"改掉 {CHANGED_FRACTION:.0%} 的依賴關係後再匯入", import_links, session, changed)
+        session.close()
+        engine.dispose()
+
+        print(f"舊寫法 (逐行 N+1；依賴關係只跑前 {LEGACY_EDGES} 條再換算):")
+        engine, session = make_session(workdir, 'legacy.db')
+        timed("建立技能 (全部)", legacy_skills, session, links)
+        start = time.perf_counter()
+        legacy_edges(session, links.dropna().iloc[:LEGACY_EDGES])
+        edges_seconds = (time.perf_counter() - start) * len(links.dropna()) / LEGACY_EDGES
+        print(f"  {'建立依賴關係 (換算成全部)':<34}{edges_seconds:>8.2f} 秒 (估計)")
+        session.close()
+        engine.dispose()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
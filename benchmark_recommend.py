@@ -0,0 +1,46 @@
+import time
+import numpy as np
+from knowledge_graph import KnowledgeGraph
+from recommender import recommend
+
+# ==============================================================================
+# 推薦計算 (recommender.score_skills + top_skills) 在不同課綱大小、班級人數下要多久
+# 用隨機產生的 DAG (每個技能連到幾個編號比較小的技能) 和隨機的進度矩陣，不需要資料庫
+# 執行方式: python benchmark_recommend.py
+# ==============================================================================
+
+SKILL_COUNTS = [66, 1000, 5000]
+STUDENT_COUNTS = [1, 40, 500]
+PREREQS_PER_SKILL = 3
+MASTERED_AT = 5
+REPEATS = 20
+
+def random_graph(rng, skill_count):
+    targets = np.repeat(np.arange(1, skill_count), PREREQS_PER_SKILL)
+    prerequisites = (rng.random(len(targets)) * targets).astype(np.int64)  # 只連到比自己小的，不會有循環
+    return KnowledgeGraph(range(1, skill_count + 1), zip(prerequisites + 1, targets + 1))
+
+def random_progress(rng, student_count, skill_count):
+    consecutive = rng.integers(0, MASTERED_AT * 2, size=(student_count, skill_count), dtype=np.int32)
+    consecutive[rng.random(consecutive.shape) < 0.5] = 0  # 一半的技能還沒練過
+    attempted = consecutive + rng.integers(0, 3, size=consecutive.shape, dtype=np.int32)
+    return consecutive, attempted
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"每個技能 {PREREQS_PER_SKILL} 個先備技能，每種組合跑 {REPEATS} 次取中位數")
+    print(f"{'技能數':>8}{'依賴數':>10}{'載入(ms)':>10}{'學生數':>8}{'推薦(ms)':>10}{'每人(us)':>10}")
+    for skill_count in SKILL_COUNTS:
+        start = time.perf_counter()
+        graph = random_graph(rng, skill_count)
+        load_ms = (time.perf_counter() - start) * 1000
+        for student_count in STUDENT_COUNTS:
+            consecutive, attempted = random_progress(rng, student_count, skill_count)
+            timings = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                recommend(graph, consecutive, attempted, MASTERED_AT)
+                timings.append(time.perf_counter() - start)
+            median_ms = float(np.median(timings)) * 1000
+            print(f"{skill_count:>8}{graph.edge_count:>10}{load_ms:>10.1f}{student_count:>8}"
+                  f"{median_ms:>10.2f}{median_ms * 1000 / student_count:>10.1f}")
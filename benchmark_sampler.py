@@ -0,0 +1,90 @@
+import ast
+import os
+import random
+import subprocess
+import time
+from question_generators import (generate_addition_subtraction_question, generate_check_point_in_system_question,
+                                 generate_factor_theorem_question, generate_inequality_region_question,
+                                 generate_remainder_theorem_question, generate_substitution_question)
+
+# ==============================================================================
+# 比較「舊的拒絕抽樣 (while 迴圈)」與「列舉後直接抽索引」每道題平均要抽幾次亂數
+# 舊的生成器用 git show 從 BASELINE_COMMIT (改成參數抽樣引擎之前) 的 app.py 取出來執行，
+# 新的從 question_generators.py 匯入，兩邊都不用載入整個網站。
+# 執行方式: python benchmark_sampler.py (要在 git checkout 裡執行)
+# ==============================================================================
+
+QUESTIONS_PER_SKILL = 20000
+BASELINE_COMMIT = '8203017'
+BASELINE_FILE = 'app.py'
+BASELINE_PREFIXES = ('generate_', 'format_', 'validate_', 'check_')  # 舊的生成器和它們用到的函式
+
+# 技能 -> (舊的 app.py 裡的函式名稱, 新的生成器)
+GENERATORS = {
+    'remainder-theorem': ('generate_remainder_theorem_question', generate_remainder_theorem_question),
+    'factor-theorem': ('generate_factor_theorem_question', generate_factor_theorem_question),
+    'linear-eq-substitution': ('generate_substitution_question', generate_substitution_question),
+    'linear-eq-addition': ('generate_addition_subtraction_question', generate_addition_subtraction_question),
+    'linear-ineq-region': ('generate_inequality_region_question', generate_inequality_region_question),
+    'linear-ineq-check-point': ('generate_check_point_in_system_question', generate_check_point_in_system_question),
+}
+
+class DrawCounter:
+    """ 暫時包住 random.randint / random.choice，計算被呼叫幾次 """
+    def __init__(self):
+        self.count = 0
+        self._originals = {}
+
+    def __enter__(self):
+        for func_name in ('randint', 'choice'):
+            original = getattr(random, func_name)
+            self._originals[func_name] = original
+            setattr(random, func_name, self._wrap(original))
+        return self
+
+    def __exit__(self, *exc):
+        for func_name, original in self._originals.items():
+            setattr(random, func_name, original)
+
+    def _wrap(self, func):
+        def counted(*args, **kwargs):
+            self.count += 1
+            return func(*args, **kwargs)
+        return counted
+
+def load_baseline(commit=BASELINE_COMMIT, path=BASELINE_FILE):
+    """
+    從 git 取出 commit 版本的 app.py，只執行裡面的題目生成器和它們用到的函式 (不含路由、Flask、資料庫)，
+    回傳 {函式名稱: 函式}。舊的生成器只用到 random 模組。
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    source = subprocess.run(['git', 'show', f'{commit}:{path}'], cwd=root, capture_output=True, text=True,
+                            check=True).stdout
+    functions = [node for node in ast.parse(source).body
+                 if isinstance(node, ast.FunctionDef) and node.name.startswith(BASELINE_PREFIXES)
+                 and not node.decorator_list]  # 略過 @app.route 的 check_answer 之類
+    namespace = {'random': random}
+    exec(compile(ast.Module(body=functions, type_ignores=[]), f'{commit}:{path}', 'exec'), namespace)
+    return namespace
+
+def measure(generator):
+    with DrawCounter() as counter:
+        start = time.perf_counter()
+        for _ in range(QUESTIONS_PER_SKILL):
+            generator()
+        elapsed = time.perf_counter() - start
+    return counter.count / QUESTIONS_PER_SKILL, elapsed / QUESTIONS_PER_SKILL * 1e6
+
+if __name__ == "__main__":
+    try:
+        baseline = load_baseline()
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"無法用 git show 取出 {BASELINE_COMMIT}:{BASELINE_FILE} ({e})，請在 git checkout 裡執行。")
+        raise SystemExit(1)
+    random.seed(0)
+    print(f"每個技能生成 {QUESTIONS_PER_SKILL} 題 (前 = {BASELINE_COMMIT} 的 {BASELINE_FILE})")
+    print(f"{'技能':<26}{'抽樣次數(前)':>12}{'抽樣次數(後)':>12}{'us/題(前)':>12}{'us/題(後)':>12}")
+    for skill_id, (baseline_name, generator) in GENERATORS.items():
+        before_draws, before_us = measure(baseline[baseline_name])
+        after_draws, after_us = measure(generator)
+        print(f"{skill_id:<26}{before_draws:>12.2f}{after_draws:>12.2f}{before_us:>12.1f}{after_us:>12.1f}")
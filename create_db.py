@@ -1,15 +1,16 @@
+import os
+os.environ.setdefault('MIGRATE_ON_STARTUP', '0')  # 由這裡明確執行升級
+
 from app import app, db
+from migrations import LATEST_VERSION, current_version, upgrade
 
 # 這會載入 app.py 裡的設定
 with app.app_context():
-    print("正在刪除舊資料庫 (如果存在的話)...")
-    # 為了安全起見，我們先 drop 掉舊的 (雖然您已經刪了)
-    db.drop_all() 
-
-    print("正在根據 app.py 裡的新模型建立資料庫...")
-    # 根據您在 app.py 裡修改好的模型 (包含 school_type) 建立新表格
-    db.create_all()
+    # 不再 drop_all()：已經有的資料表 (包含學生的 UserProgress) 會保留，只補上缺少的表、索引和限制
+    print(f"目前資料庫版本: {current_version(db.engine)} (最新: {LATEST_VERSION})")
+    print("正在根據 app.py 裡的模型建立 / 升級資料庫...")
+    upgrade(db.engine, db.metadata)
 
     print("="*30)
-    print("成功！ 新的 kumon_math.db 資料庫已建立！")
-    print("="*30)
\ No newline at end of file
+    print("成功！ kumon_math.db 資料庫已是最新版本！")
+    print("="*30)
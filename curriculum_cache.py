@@ -0,0 +1,179 @@
+import re
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from sqlalchemy import text
+from knowledge_graph import KnowledgeGraph
+
+# ==============================================================================
+# 課綱樹快取 (Curriculum Cache)
+# ==============================================================================
+# 課綱 (年級 -> 大單元 -> 小單元) 只有在執行匯入程式時才會改變，
+# dashboard / 年級頁 / 單元頁卻每次都要對 skill 表做 DISTINCT 或篩選查詢。
+# 這裡一次讀出整張 skill 表，建成不可修改的樹放在記憶體裡，三個頁面直接取用 (不查資料庫)。
+# 匯入程式寫完後呼叫 bump_curriculum_version()，背景執行緒發現 curriculum_version 變了，
+# 就重建一棵新的樹再整棵換掉 (請求拿到的永遠是完整的一棵，不會看到改到一半的狀態)。
+# 知識圖譜 (skill_dependency，見 knowledge_graph.py) 也是匯入時才會變，跟著課綱樹一起重建 (tree.graph)。
+
+SkillEntry = namedtuple('SkillEntry', 'id name display_name description main_unit grade_level school_type')
+
+SELECT_SKILLS_SQL = text("""
+    SELECT id, name, display_name, description, main_unit, grade_level, school_type
+    FROM skill ORDER BY id
+""")
+SELECT_VERSION_SQL = text("SELECT version FROM curriculum_version WHERE id = 1")
+SELECT_DEPENDENCIES_SQL = text("SELECT prerequisite_id, target_id FROM skill_dependency")
+
+CHINESE_DIGITS = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+SCHOOL_OFFSETS = {'國小': 0, '國中': 6, '高中': 9, '高': 9, '國': 6}
+
+def chinese_number(numeral):
+    """'七' -> 7, '十' -> 10, '十一' -> 11, '二十' -> 20；看不懂回傳 None"""
+    if numeral.isdigit():
+        return int(numeral)
+    if not numeral or any(ch not in CHINESE_DIGITS and ch != '十' for ch in numeral):
+        return None
+    if '十' not in numeral:
+        return CHINESE_DIGITS.get(numeral) if len(numeral) == 1 else None
+    tens, _, ones = numeral.partition('十')
+    return (CHINESE_DIGITS.get(tens, 1) if tens else 1) * 10 + (CHINESE_DIGITS.get(ones, 0) if ones else 0)
+
+def grade_sort_key(grade):
+    """
+    年級的排序 key：'七年級' < '十年級' < '十一年級' < '十二年級'，'國一' = 七年級、'高二' = 十一年級。
+    認不出來的年級排在最後 (依名稱排序)。
+    """
+    match = re.fullmatch(r'(.+?)年級', grade)
+    if match:
+        number = chinese_number(match.group(1))
+        if number is not None:
+            return (0, number, grade)
+    for prefix, offset in SCHOOL_OFFSETS.items():
+        if grade.startswith(prefix):
+            number = chinese_number(grade[len(prefix):])
+            if number is not None:
+                return (0, offset + number, grade)
+    return (1, 0, grade)
+
+class CurriculumTree:
+    """不可修改的課綱樹；要更新就建一棵新的"""
+    def __init__(self, skills, version, graph=None):
+        self.version = version
+        self.graph = graph
+        self.skill_count = len(skills)
+        units_by_grade = {}
+        skills_by_unit = {}
+        skill_ids_by_grade = {}
+        for skill in skills:  # skills 依 id 排序：大單元的順序 = 匯入時第一次出現的順序
+            if skill.grade_level is not None and skill.main_unit is not None:
+                units = units_by_grade.setdefault(skill.grade_level, [])
+                if skill.main_unit not in units:
+                    units.append(skill.main_unit)
+                skill_ids_by_grade.setdefault(skill.grade_level, []).append(skill.id)
+            if skill.main_unit is not None:
+                skills_by_unit.setdefault(skill.main_unit, []).append(skill)
+        self.grades = tuple(sorted(units_by_grade, key=grade_sort_key))
+        self.units_by_grade = MappingProxyType({grade: tuple(units) for grade, units in units_by_grade.items()})
+        self.skills_by_unit = MappingProxyType({unit: tuple(entries) for unit, entries in skills_by_unit.items()})
+        self.skill_ids_by_grade = MappingProxyType({grade: tuple(ids) for grade, ids in skill_ids_by_grade.items()})
+        self.skills_by_id = MappingProxyType({skill.id: skill for skill in skills})
+
+    def main_units(self, grade):
+        return self.units_by_grade.get(grade, ())
+
+    def skills(self, main_unit):
+        return self.skills_by_unit.get(main_unit, ())
+
+def read_curriculum_version(session):
+    """curriculum_version 表的版本號 (表或資料列不存在時是 0)"""
+    try:
+        return session.execute(SELECT_VERSION_SQL).scalar() or 0
+    except Exception:
+        session.rollback()
+        return 0
+
+def bump_curriculum_version(session, commit=True):
+    """
+    匯入程式改完 skill 表之後呼叫，讓各個 process 的快取重建。
+    commit=False 時由呼叫的人負責 commit (和課綱的修改放在同一個交易裡)。
+    """
+    updated = session.execute(text("UPDATE curriculum_version SET version = version + 1, updated_at = :now "
+                                   "WHERE id = 1"), {'now': int(time.time())}).rowcount
+    if not updated:
+        session.execute(text("INSERT INTO curriculum_version (id, version, updated_at) VALUES (1, 1, :now)"),
+                        {'now': int(time.time())})
+    if commit:
+        session.commit()
+
+class CurriculumCache:
+    def __init__(self, session_factory, check_interval=30, app_context=None, extra_edges=(), practicable=None):
+        """
+        session_factory: 回傳 SQLAlchemy session 的函式 (例如 lambda: db.session)
+        check_interval : 背景執行緒多久檢查一次 curriculum_version (秒)
+        app_context    : 回傳 context manager 的函式 (背景執行緒要用 app.app_context 才能碰資料庫)
+        extra_edges    : 程式裡定義的依賴關係 [(先備技能代號, 目標技能代號), ...]，和 skill_dependency 合併
+        practicable    : 可以直接練習的技能代號 (降級只會退到這些技能)
+        """
+        self.session_factory = session_factory
+        self.check_interval = check_interval
+        self.app_context = app_context
+        self.extra_edges = list(extra_edges)
+        self.practicable = practicable
+        self._tree = None
+        self._build_lock = threading.Lock()
+        self._counters = {'builds': 0, 'checks': 0, 'last_build_ms': None}
+        if app_context is not None:
+            threading.Thread(target=self._watcher, name='curriculum-watcher', daemon=True).start()
+
+    def get(self):
+        """目前的課綱樹；第一次呼叫時建立"""
+        tree = self._tree
+        if tree is None:
+            tree = self.refresh()
+        return tree
+
+    def refresh(self, force=False):
+        """版本號變了 (或 force) 就重建並換掉整棵樹，回傳目前的樹"""
+        with self._build_lock:
+            session = self.session_factory()
+            version = read_curriculum_version(session)
+            self._counters['checks'] += 1
+            if self._tree is not None and self._tree.version == version and not force:
+                return self._tree
+            start = time.perf_counter()
+            skills = [SkillEntry(*row) for row in session.execute(SELECT_SKILLS_SQL)]
+            tree = CurriculumTree(skills, version, self._build_graph(session, skills))
+            self._tree = tree  # 換掉參照是原子操作；正在用舊樹的請求不受影響
+            self._counters['builds'] += 1
+            self._counters['last_build_ms'] = (time.perf_counter() - start) * 1000
+            print(f"課綱快取已重建: 第 {version} 版, {tree.skill_count} 個小單元, {len(tree.grades)} 個年級, "
+                  f"{tree.graph.edge_count} 條依賴關係")
+            return tree
+
+    def _build_graph(self, session, skills):
+        ids_by_name = {skill.name: skill.id for skill in skills}
+        edges = session.execute(SELECT_DEPENDENCIES_SQL).all()
+        edges += [(ids_by_name[prerequisite], ids_by_name[target]) for prerequisite, target in self.extra_edges
+                  if prerequisite in ids_by_name and target in ids_by_name]
+        graph = KnowledgeGraph([skill.id for skill in skills], edges,
+                               names={skill.id: skill.name for skill in skills},
+                               practicable=self.practicable, strict=False)
+        if graph.dropped_edges:
+            print(f"警告: 知識圖譜有循環依賴，已忽略 {len(graph.dropped_edges)} 條依賴關係: {graph.dropped_edges[:10]}")
+        return graph
+
+    def _watcher(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                with self.app_context():
+                    self.refresh()
+            except Exception as e:
+                print(f"檢查課綱版本時發生錯誤: {e}")
+
+    def stats(self):
+        tree = self._tree
+        return dict(self._counters, version=tree.version if tree else None,
+                    skills=tree.skill_count if tree else 0, grades=list(tree.grades) if tree else [],
+                    graph=tree.graph.stats() if tree and tree.graph else None)
@@ -0,0 +1,41 @@
+import time
+
+# ==============================================================================
+# 本機假模型 (Fake Model)
+# ==============================================================================
+# 介面和 genai.GenerativeModel 一樣有 generate_content() (也支援 stream=True)，但不連網、不花額度。
+# 設定環境變數 GEMINI_FAKE_MODEL=1 就會用它取代 Gemini，方便離線開發與測試。
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    def __init__(self, latency=0.5, chunk_size=4, chunk_latency=0.05):
+        self.latency = latency              # 模擬 API 的延遲 (秒)
+        self.chunk_size = chunk_size        # 串流模式每段幾個字
+        self.chunk_latency = chunk_latency  # 串流模式每段之間的延遲 (秒)
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False):
+        self.calls += 1
+        time.sleep(self.latency)
+        reply = self._reply_for(contents)
+        if stream:
+            return self._stream(reply)
+        return FakeResponse(reply)
+
+    def _stream(self, reply):
+        for i in range(0, len(reply), self.chunk_size):
+            if i > 0:
+                time.sleep(self.chunk_latency)
+            yield FakeResponse(reply[i:i + self.chunk_size])
+
+    def _reply_for(self, contents):
+        parts = contents if isinstance(contents, list) else [contents]
+        prompt = "".join(part for part in parts if isinstance(part, str))
+        if '解區域' in prompt:
+            return "CORRECT: 畫得很好！解區域完全正確。"
+        if '手寫計算過程' in prompt:
+            return "CORRECT: 計算正確！"
+        return "(本機測試模式) 你覺得第一步該怎麼做呢？"
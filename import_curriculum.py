@@ -2,6 +2,9 @@ import pandas as pd  # <--- 使用 pandas
 import re
 import os
 from app import app, db, Skill, SkillDependency # 匯入 app 和所有模型
+from migrations import upgrade
+from curriculum_cache import bump_curriculum_version
+from ingest_workbooks import CURRICULUM_HEADER
 
 def slugify(text):
     """ 簡單將中文轉為英文 ID """
@@ -11,6 +14,35 @@ def slugify(text):
     text = re.sub(r'\W+', '', text.replace('_', 'TEMP_UNDERSCORE')).replace('TEMP_UNDERSCORE', '_')
     return text or 'skill'
 
+def apply_curriculum(session, df):
+    """
+    把課綱的每一列 upsert 到 Skill (以 slugify 後的小單元名稱對應；已存在的就更新，id 不變)。
+    不會 commit；回傳 (新增數, 內容真的有變的更新數)。
+    """
+    existing_skills = {skill.name: skill for skill in Skill.query.all()}
+    created = updated = 0
+    for index, row in df.iterrows():
+        try:
+            name = slugify(row['小單元'])  # 自動產生英文 ID
+            fields = dict(
+                display_name = row['小單元'].strip(),
+                description = row['內容'].strip() if pd.notna(row['內容']) else "...", # 處理內容為空的情況
+                grade_level = row['年級'].strip(),
+                main_unit = row['大單元'].strip()
+            )
+            skill = existing_skills.get(name)
+            if skill is None:
+                skill = existing_skills[name] = Skill(name=name, **fields)
+                session.add(skill)
+                created += 1
+            else:
+                for key, value in fields.items():
+                    setattr(skill, key, value)
+                updated += session.is_modified(skill)
+        except Exception as e:
+            print(f"處理行 {index} ( {row['小單元']} ) 時出錯: {e}")
+    return created, updated
+
 def import_curriculum():
     print("開始匯入新課綱資料 (使用 Pandas 讀取 XLSX)...")
     
@@ -29,10 +61,14 @@ def import_curriculum():
     try:
         # <--- 修改：使用 pd.read_excel ---
         df = pd.read_excel(excel_filename, sheet_name=sheet_name)
+        missing = [column for column in CURRICULUM_HEADER if column not in df.columns]
+        if missing:
+            print(f"錯誤：工作表缺少欄位 {missing} (需要 {list(CURRICULUM_HEADER)})")
+            return
         
         # 關鍵步驟：填補 Excel 合併儲存格造成的空值
-        df['年級'].ffill(inplace=True)
-        df['大單元'].ffill(inplace=True)
+        # (要整個欄位指定回去；pandas 3 的 copy-on-write 下 df['年級'].ffill(inplace=True) 不會改到 df)
+        df[['年級', '大單元']] = df[['年級', '大單元']].ffill()
         
         # 移除「小單元」欄位為空的無效資料
         df.dropna(subset=['小單元'], inplace=True)
@@ -51,36 +87,23 @@ def import_curriculum():
 
     print(f"從 Excel 中讀取到 {len(df)} 筆「小單元」資料。")
 
-    # === 步驟 2: 清空並重建資料庫 ===
-    # (這一段和前一個教學完全相同)
-    print("正在清空並重建資料庫表格 (包含新的 main_unit 欄位)...")
+    # === 步驟 2: 確認資料庫結構是最新的 ===
+    # 不再 drop_all() 重建 (會把所有學生的 UserProgress 一起清掉)，只補上缺少的表和索引
     try:
-        db.drop_all() # 刪除所有舊表格
-        db.create_all() # 根據 app.py (含 main_unit) 建立新表格
-        print("資料庫表格已成功重建。")
+        upgrade(db.engine, db.metadata)
     except Exception as e:
-        print(f"重建資料庫時發生錯誤: {e}")
+        print(f"升級資料庫時發生錯誤: {e}")
         return
 
-    # === 步驟 3: 將所有「小單元」作為 Skill 存入資料庫 ===
-    # (這一段和前一個教學完全相同)
+    # === 步驟 3: 將所有「小單元」存入 Skill (已存在的就更新，id 不變，學生進度也還在) ===
     print("正在匯入所有「小單元」...")
-    for index, row in df.iterrows():
-        try:
-            new_skill = Skill(
-                display_name = row['小單元'].strip(),
-                name = slugify(row['小單元']), # 自動產生英文 ID
-                description = row['內容'].strip() if pd.notna(row['內容']) else "...", # 處理內容為空的情況
-                grade_level = row['年級'].strip(),
-                main_unit = row['大單元'].strip()
-            )
-            db.session.add(new_skill)
-        except Exception as e:
-            print(f"處理行 {index} ( {row['小單元']} ) 時出錯: {e}")
+    created, updated = apply_curriculum(db.session, df)
 
     try:
+        # 課綱版本號和 Skill 的修改一起 commit，網站的課綱快取會在下一次檢查時重建
+        bump_curriculum_version(db.session, commit=False)
         db.session.commit()
-        print(f"=== 成功！ {len(df)} 筆「小單元」已全部匯入 Skill 資料表 ===")
+        print(f"=== 成功！ {len(df)} 筆「小單元」已匯入 Skill 資料表 (新增 {created}，更新 {updated}) ===")
     except Exception as e:
         db.session.rollback()
         print(f"存入 Skill 時發生錯誤: {e}")
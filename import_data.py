@@ -1,7 +1,48 @@
-import pandas as pd  # <--- 使用 pandas
-import re
+import argparse
 import os
-from app import app, db, Skill, SkillDependency
+import re
+import time
+import numpy as np
+import pandas as pd  # <--- 使用 pandas
+from sqlalchemy import text
+from curriculum_cache import bump_curriculum_version
+
+# ==============================================================================
+# 匯入知識點鏈結 (先備知識 -> 學習目標) 到 Skill / SkillDependency
+# ==============================================================================
+# 以前：先刪掉所有 Skill 和 SkillDependency (學生進度跟著不見)，再 df.iterrows() 一行一行處理，
+# 每條依賴關係都要查兩次 Skill、再查一次 SkillDependency 是否存在 (N+1 查詢)。
+# 現在：
+#   1. 用 pandas 的欄位運算整理 Excel (去空白、去空值、去重複)，不逐行處理
+#   2. 一次讀出目前的 skill / skill_dependency，技能名稱全部在記憶體裡的對照表解析
+#   3. 用內容雜湊 (pd.util.hash_pandas_object) 和資料庫比對，算出要新增 / 更新 / 刪除哪些資料
+#   4. 整批 (executemany) 寫入，全部在同一個交易裡，連同課綱版本號一起 commit
+# 技能用 display_name 對應 (找不到再用 slugify 後的 name)，已存在的技能 id 不變，學生進度也還在。
+# 只有「沒有大單元 (main_unit) 的技能」算是知識點鏈結建立的，才會被更新；課綱匯入的技能不會被改動。
+# SKILL_ENGINE 的技能 (protected_names) 由 app.py 的 initialize_skills 管理，也不算知識點鏈結的。
+# 依賴關係以這次讀到的所有活頁簿為準：兩端都是知識點鏈結技能的依賴關係，資料庫裡有、活頁簿裡沒有的
+# 會刪掉 (--keep-missing 可以保留)；碰到課綱或 SKILL_ENGINE 技能的依賴關係不會被刪。
+# 執行方式: python import_data.py [活頁簿 ...] [--dry-run] [--keep-missing]
+
+PREREQ_COLUMN = '來源節點 (先備知識)'
+TARGET_COLUMN = '目標節點 (學習目標)'
+SHEET_NAME = '工作表1'
+LINK_FOLDER = '知識點鏈結'
+LINK_WORKBOOKS = ['多項式知識點鏈結.xlsx', '三角函數知識點鏈結.xlsx']
+LINK_FIELDS = ['description', 'school_type', 'grade_level']  # 知識點鏈結負責的欄位 (內容雜湊也只看這些)
+
+SELECT_SKILLS_SQL = text("SELECT id, name, display_name, description, school_type, grade_level, main_unit FROM skill")
+SELECT_DEPENDENCIES_SQL = text("SELECT id, prerequisite_id, target_id FROM skill_dependency")
+INSERT_SKILL_SQL = text("""
+    INSERT INTO skill (name, display_name, description, school_type, grade_level)
+    VALUES (:name, :display_name, :description, :school_type, :grade_level)
+""")
+UPDATE_SKILL_SQL = text("""
+    UPDATE skill SET description = :description, school_type = :school_type, grade_level = :grade_level
+    WHERE id = :id
+""")
+INSERT_DEPENDENCY_SQL = text("INSERT INTO skill_dependency (prerequisite_id, target_id) VALUES (:prerequisite_id, :target_id)")
+DELETE_DEPENDENCY_SQL = text("DELETE FROM skill_dependency WHERE id = :id")
 
 def slugify(text):
     """ 簡單將中文轉為英文 ID """
@@ -11,144 +52,188 @@ def slugify(text):
     text = re.sub(r'\W+', '', text.replace('_', 'TEMP_UNDERSCORE')).replace('TEMP_UNDERSCORE', '_')
     return text or 'skill'
 
-def import_skills_and_dependencies():
-    print("開始匯入資料 (使用 Pandas)...")
-    
-    # --- vvv ---
-    # 檔案路徑設定
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    excel_folder = '知識點鏈結' # 您的子資料夾名稱
-    excel_file = '多項式知識點鏈結.xlsx' # 您的 Excel 檔案名稱
-    excel_filename = os.path.join(basedir, excel_folder, excel_file)
-    
-    # 工作表名稱 (從您的 .csv 檔名推測)
-    sheet_name = '工作表1' 
-    # --- ^^^ ---
-    
-    print(f"正在嘗試讀取 Excel: {excel_filename}")
-    print(f"正在嘗試讀取工作表: {sheet_name}")
-
-    # 儲存所有技能的字典 { "中文名稱": SkillObject }
-    skill_map = {}
-    # 儲存所有依賴關係的列表 [ (prerequisite_name, target_name) ]
-    dependencies = []
-    # 儲存所有不重複的技能名稱
-    skill_names = set()
-
-    # === 步驟 1: 使用 Pandas 讀取 Excel 並找出所有技能 ===
+def clean_links(df):
+    """
+    Excel 的資料 -> DataFrame[prerequisite, target] (去掉前後空白、空字串變成 NaN、去掉重複的列)。
+    只有一邊有值的列也保留 (那個技能還是要建立)。
+    """
+    if PREREQ_COLUMN not in df.columns or TARGET_COLUMN not in df.columns:
+        raise ValueError(f"Excel 中找不到 '{PREREQ_COLUMN}' 或 '{TARGET_COLUMN}' 欄位")
+    links = df[[PREREQ_COLUMN, TARGET_COLUMN]].astype('string')
+    links.columns = ['prerequisite', 'target']
+    links = links.apply(lambda column: column.str.strip()).replace({'': pd.NA, 'nan': pd.NA})
+    return links.dropna(how='all').drop_duplicates(ignore_index=True)
+
+def read_links(path, sheet_name=SHEET_NAME):
+    df = pd.read_excel(path, sheet_name=sheet_name, dtype=str)
+    return clean_links(df)
+
+def link_skill_fields(display_names):
+    """知識點鏈結建立的技能要填的欄位 (名稱有「國中」的是國中技能，其他當作高一)"""
+    junior = display_names.str.contains('國中', regex=False).to_numpy(dtype=bool)
+    return pd.DataFrame({
+        'display_name': display_names.to_numpy(),
+        'description': ('關於「' + display_names + '」的練習').to_numpy(),
+        'school_type': np.where(junior, '共同', '普高'),
+        'grade_level': np.where(junior, '國中', '高一')
+    })
+
+def content_hash(frame, columns):
+    """每一列的內容雜湊 (uint64)，空值當作空字串"""
+    return pd.util.hash_pandas_object(frame[columns].astype('string').fillna(''), index=False).to_numpy()
+
+def unique_slugs(slugs, taken):
+    """slugify 之後撞名 (彼此撞名或和資料庫裡的 name 撞名) 的加上 _2、_3 ..."""
+    slugs = pd.Series(slugs, dtype='string')
+    ordinal = slugs.groupby(slugs).cumcount() + slugs.isin(taken).astype(int)
+    return slugs.where(ordinal == 0, slugs + '_' + (ordinal + 1).astype('string')).to_numpy()
+
+def read_database(session):
+    skills = pd.DataFrame(session.execute(SELECT_SKILLS_SQL).all(),
+                          columns=['id', 'name', 'display_name', 'description', 'school_type', 'grade_level', 'main_unit'])
+    dependencies = pd.DataFrame(session.execute(SELECT_DEPENDENCIES_SQL).all(),
+                                columns=['id', 'prerequisite_id', 'target_id'])
+    return skills, dependencies
+
+def plan_import(links, skills, dependencies, delete_missing=True, protected_names=()):
+    """
+    比對活頁簿 (links) 和資料庫目前的內容 (skills / dependencies)，回傳要做的修改：
+      new_skills     : 要新增的技能 (name, display_name, description, school_type, grade_level)
+      changed_skills : 要更新的技能 (id + LINK_FIELDS)
+      new_edges      : 要新增的依賴關係 (prerequisite / target 是技能的 name)
+      deleted_edges  : 要刪除的 skill_dependency.id (只限兩端都是知識點鏈結技能的)
+    protected_names: 不歸知識點鏈結管的技能 name (SKILL_ENGINE 的技能)
+    """
+    link_owned = skills['main_unit'].isna() & ~skills['name'].isin(list(protected_names))
+    names = pd.unique(pd.concat([links['prerequisite'], links['target']]).dropna())
+    wanted = link_skill_fields(pd.Series(names, dtype='string'))
+
+    # 先用 display_name 找，找不到再用 slugify 後的 name 找
+    by_display = skills.drop_duplicates('display_name').set_index('display_name')['id']
+    by_name = skills.set_index('name')['id']
+    slugs = wanted['display_name'].map(slugify)
+    wanted['id'] = wanted['display_name'].map(by_display).fillna(slugs.map(by_name))
+
+    new_skills = wanted[wanted['id'].isna()].drop(columns='id')
+    new_skills.insert(0, 'name', unique_slugs(slugs[wanted['id'].isna()], set(skills['name'])))
+
+    existing = wanted.dropna(subset=['id']).astype({'id': 'int64'})
+    current = skills.set_index('id').loc[existing['id']].reset_index()
+    changed = (content_hash(existing, LINK_FIELDS) != content_hash(current, LINK_FIELDS)) & \
+        current['id'].map(link_owned.set_axis(skills['id'])).to_numpy(dtype=bool)
+    changed_skills = existing.loc[changed, ['id'] + LINK_FIELDS]
+
+    # 依賴關係都換成技能的 name (資料庫裡唯一) 再比對雜湊
+    name_of_display = pd.concat([
+        pd.Series(skills.set_index('id').loc[existing['id'], 'name'].to_numpy(), index=existing['display_name']),
+        pd.Series(new_skills['name'].to_numpy(), index=new_skills['display_name'])])
+    edges = links.dropna()
+    edges = pd.DataFrame({'prerequisite': edges['prerequisite'].map(name_of_display).to_numpy(),
+                          'target': edges['target'].map(name_of_display).to_numpy()})
+    self_loops = edges['prerequisite'] == edges['target']
+    edges = edges[~self_loops].drop_duplicates(ignore_index=True)
+    name_of_id = skills.set_index('id')['name']
+    current_edges = pd.DataFrame({'id': dependencies['id'].to_numpy(),
+                                  'prerequisite': dependencies['prerequisite_id'].map(name_of_id).to_numpy(),
+                                  'target': dependencies['target_id'].map(name_of_id).to_numpy()})
+    wanted_hash = content_hash(edges, ['prerequisite', 'target'])
+    current_hash = content_hash(current_edges, ['prerequisite', 'target'])
+    new_edges = edges[~np.isin(wanted_hash, current_hash)]
+    owned_ids = skills.loc[link_owned, 'id']
+    in_scope = (dependencies['prerequisite_id'].isin(owned_ids) & dependencies['target_id'].isin(owned_ids)).to_numpy()
+    deleted_edges = current_edges.loc[~np.isin(current_hash, wanted_hash) & in_scope, 'id'].to_numpy() \
+        if delete_missing else np.zeros(0, dtype=np.int64)
+    return {
+        'new_skills': new_skills,
+        'changed_skills': changed_skills,
+        'new_edges': new_edges,
+        'deleted_edges': deleted_edges,
+        'skills': len(names),
+        'edges': len(edges),
+        'self_loops': int(self_loops.sum())
+    }
+
+def apply_plan(session, plan):
+    """在同一個交易裡整批寫入 (連同課綱版本號)；失敗的話全部 rollback"""
     try:
-        # 讀取 Excel 檔案
-        df = pd.read_excel(excel_filename, sheet_name=sheet_name)
-        
-        # 取得關鍵欄位
-        prereq_col = '來源節點 (先備知識)'
-        target_col = '目標節點 (學習目標)'
-        
-        if prereq_col not in df.columns or target_col not in df.columns:
-            print(f"錯誤：Excel 中找不到 '{prereq_col}' 或 '{target_col}' 欄位。")
-            print(f"請檢查 Excel 欄位名稱是否完全正確。")
-            return
-            
-        # 迭代 Excel 的每一行
-        for index, row in df.iterrows():
-            # .strip() 是為了去除前後空白
-            prereq_name = str(row[prereq_col]).strip() if pd.notna(row[prereq_col]) else None
-            target_name = str(row[target_col]).strip() if pd.notna(row[target_col]) else None
-            
-            if prereq_name and prereq_name != 'nan':
-                skill_names.add(prereq_name)
-            if target_name and target_name != 'nan':
-                skill_names.add(target_name)
-            
-            if prereq_name and target_name and prereq_name != 'nan' and target_name != 'nan':
-                dependencies.append((prereq_name, target_name))
-    
-    except FileNotFoundError:
-        print(f"錯誤：在以下路徑找不到檔案 '{excel_filename}'")
-        print(f"請確認 '{excel_folder}' 資料夾存在，且內含 '{excel_file}' 檔案。")
-        return
-    except Exception as e:
-        # 可能是 '工作表1' 名稱錯誤
-        if "No sheet named" in str(e):
-            print(f"錯誤：在 Excel 中找不到名為 '{sheet_name}' 的工作表。")
-            print("請檢查 Excel 中的工作表名稱是否完全正確。")
-        else:
-            print(f"讀取 Excel 時發生錯誤: {e}")
-        return
-
-    print(f"從 Excel 中找到了 {len(skill_names)} 個不重複的單元。")
-
-    # === 步驟 2: 將所有技能存入資料庫 ===
-    # ( ... 這一段程式碼和之前完全一樣 ... )
-    for name in skill_names:
-        if not name:
-            continue
-        existing_skill = Skill.query.filter_by(display_name=name).first()
-        if not existing_skill:
-            new_skill = Skill(
-                display_name=name,
-                name=slugify(name), 
-                description=f"關於「{name}」的練習"
-            )
-            if '國中' in name:
-                new_skill.school_type = '共同'
-                new_skill.grade_level = '國中'
+        if len(plan['new_skills']):
+            session.execute(INSERT_SKILL_SQL, plan['new_skills'].to_dict('records'))
+        if len(plan['changed_skills']):
+            session.execute(UPDATE_SKILL_SQL, plan['changed_skills'].to_dict('records'))
+        if len(plan['deleted_edges']):
+            session.execute(DELETE_DEPENDENCY_SQL, [{'id': int(dep_id)} for dep_id in plan['deleted_edges']])
+        if len(plan['new_edges']):
+            id_of_name = pd.Series(dict(session.execute(text("SELECT name, id FROM skill")).all()))
+            rows = pd.DataFrame({'prerequisite_id': plan['new_edges']['prerequisite'].map(id_of_name).to_numpy(),
+                                 'target_id': plan['new_edges']['target'].map(id_of_name).to_numpy()})
+            session.execute(INSERT_DEPENDENCY_SQL, rows.astype('int64').to_dict('records'))
+        bump_curriculum_version(session)  # 會 commit；網站的課綱快取會在下一次檢查時重建
+    except Exception:
+        session.rollback()
+        raise
+
+def summarize(plan):
+    return (f"活頁簿裡有 {plan['skills']} 個技能、{plan['edges']} 條依賴關係 "
+            f"(略過 {plan['self_loops']} 條自己連到自己的)；"
+            f"新增技能 {len(plan['new_skills'])}，更新技能 {len(plan['changed_skills'])}，"
+            f"新增依賴 {len(plan['new_edges'])}，刪除依賴 {len(plan['deleted_edges'])}")
+
+def is_empty(plan):
+    return not (len(plan['new_skills']) or len(plan['changed_skills']) or len(plan['new_edges'])
+                or len(plan['deleted_edges']))
+
+def import_links(session, links, delete_missing=True, dry_run=False, protected_names=()):
+    """比對並寫入已經讀好的知識點鏈結 (DataFrame[prerequisite, target])，回傳 plan"""
+    skills, dependencies = read_database(session)
+    plan = plan_import(links, skills, dependencies, delete_missing=delete_missing, protected_names=protected_names)
+    print(summarize(plan))
+    if dry_run:
+        print("(--dry-run：沒有寫入資料庫)")
+    elif is_empty(plan):
+        print("資料庫已經是最新的，不需要修改。")
+    else:
+        apply_plan(session, plan)
+        print("=== 成功！已在同一個交易裡寫入資料庫 ===")
+    return plan
+
+def import_skills_and_dependencies(session, paths, sheet_name=SHEET_NAME, delete_missing=True, dry_run=False,
+                                   protected_names=()):
+    print("開始匯入資料 (使用 Pandas)...")
+    frames = []
+    for path in paths:
+        print(f"正在讀取 Excel: {path} (工作表: {sheet_name})")
+        try:
+            frames.append(read_links(path, sheet_name))
+        except FileNotFoundError:
+            print(f"錯誤：在以下路徑找不到檔案 '{path}'")
+            return None
+        except Exception as e:
+            if "not found" in str(e) or "No sheet named" in str(e):
+                print(f"錯誤：在 Excel 中找不到名為 '{sheet_name}' 的工作表。")
             else:
-                new_skill.school_type = '普高'
-                new_skill.grade_level = '高一'
-            db.session.add(new_skill)
-            print(f"  [建立 Skill]: {name}")
-            skill_map[name] = new_skill
-        else:
-            print(f"  [Skill 已存在]: {name}")
-            skill_map[name] = existing_skill
-    try:
-        db.session.commit()
-        print("=== 所有 Skill 已成功存入資料庫 (並取得 ID) ===")
-    except Exception as e:
-        db.session.rollback()
-        print(f"存入 Skill 時發生錯誤: {e}")
-        return
-        
-    # === 步驟 3: 建立依賴關係 ===
-    # ( ... 這一段程式碼和之前完全一樣 ... )
-    print("正在建立技能依賴關係...")
-    dependency_count = 0
-    for prereq_name, target_name in dependencies:
-        prereq_skill = Skill.query.filter_by(display_name=prereq_name).first()
-        target_skill = Skill.query.filter_by(display_name=target_name).first()
-        if prereq_skill and target_skill:
-            existing_dep = SkillDependency.query.filter_by(
-                prerequisite_id=prereq_skill.id,
-                target_id=target_skill.id
-            ).first()
-            if not existing_dep:
-                new_dep = SkillDependency(
-                    prerequisite_id=prereq_skill.id,
-                    target_id=target_skill.id
-                )
-                db.session.add(new_dep)
-                dependency_count += 1
-    try:
-        db.session.commit()
-        print(f"=== 成功！建立了 {dependency_count} 條新的依賴關係 ===")
-    except Exception as e:
-        db.session.rollback()
-        print(f"存入依賴關係時發生錯誤: {e}")
-        return
+                print(f"讀取 Excel 時發生錯誤: {e}")
+            return None
+    links = pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+    return import_links(session, links, delete_missing=delete_missing, dry_run=dry_run,
+                        protected_names=protected_names)
 
 # --- 主程式 ---
 if __name__ == "__main__":
-    with app.app_context():
-        # ... 清空舊資料的程式碼 (完全一樣) ...
-        print("正在清空舊的 Skills 和 Dependencies...")
-        try:
-            db.session.query(SkillDependency).delete()
-            db.session.query(Skill).delete()
-            db.session.commit()
-            print("舊資料已清空。")
-        except Exception as e:
-            db.session.rollback()
-            print(f"清空舊資料時出錯: {e}")
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    parser = argparse.ArgumentParser(description="匯入知識點鏈結活頁簿 (比對後整批寫入)")
+    parser.add_argument('workbooks', nargs='*',
+                        default=[os.path.join(basedir, LINK_FOLDER, name) for name in LINK_WORKBOOKS])
+    parser.add_argument('--sheet', default=SHEET_NAME)
+    parser.add_argument('--dry-run', action='store_true', help="只印出要做的修改，不寫入資料庫")
+    parser.add_argument('--keep-missing', action='store_true', help="不要刪除活頁簿裡已經沒有的依賴關係")
+    args = parser.parse_args()
 
-        import_skills_and_dependencies()
\ No newline at end of file
+    from app import SKILL_ENGINE, app, db
+    from migrations import upgrade
+    with app.app_context():
+        upgrade(db.engine, db.metadata)  # 不再清空舊資料，只補上缺少的表和索引
+        start = time.perf_counter()
+        import_skills_and_dependencies(db.session, args.workbooks, args.sheet,
+                                       delete_missing=not args.keep_missing, dry_run=args.dry_run,
+                                       protected_names=SKILL_ENGINE.keys())
+        print(f"花了 {time.perf_counter() - start:.2f} 秒")
@@ -0,0 +1,175 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import openpyxl
+import pandas as pd
+from import_data import LINK_FOLDER, PREREQ_COLUMN, SHEET_NAME, TARGET_COLUMN, apply_plan, clean_links, \
+    is_empty, plan_import, read_database, summarize
+
+# ==============================================================================
+# 一次匯入「知識點鏈結」資料夾裡所有的活頁簿
+# ==============================================================================
+# 以前 import_curriculum.py 只讀 課綱.xlsx、import_data.py 只讀 多項式知識點鏈結.xlsx，
+# 而且都用 pd.read_excel 把整個檔案載入。這裡：
+#   1. 找出資料夾裡所有的 .xlsx (略過 Excel 開檔時留下的 ~$ 鎖定檔)
+#   2. 每個檔案交給一個 process，用 openpyxl 的 read_only 模式一列一列讀 (不建整個工作表的物件)，
+#      看標題列決定是課綱 (年級 / 大單元 / 小單元 / 內容) 還是知識點鏈結 (先備知識 / 學習目標)
+#   3. 全部讀完後合併成一份課綱 + 一份依賴關係，在同一個交易裡寫入 (連同課綱版本號一起 commit)
+# 每個檔案印出讀取時間和每秒幾列。
+# 執行方式: python ingest_workbooks.py [資料夾] [--dry-run] [--keep-missing] [--workers N]
+
+CURRICULUM_HEADER = ('年級', '大單元', '小單元', '內容')
+LINK_HEADER = (PREREQ_COLUMN, TARGET_COLUMN)
+LOCK_FILE_PREFIX = '~$'
+
+def discover_workbooks(folder):
+    """資料夾裡的 .xlsx (依檔名排序，略過 ~$ 開頭的鎖定檔)"""
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.lower().endswith('.xlsx') and not name.startswith(LOCK_FILE_PREFIX)]
+
+def parse_workbook(path, sheet_name=SHEET_NAME):
+    """
+    (在子 process 裡執行) 一列一列讀一個活頁簿，回傳 dict：
+      kind    : 'curriculum' / 'links' / None (認不出來的格式)
+      columns : 欄位名稱；rows : [tuple, ...] (只留需要的欄位)
+      seconds : 讀取花的時間
+    課綱的「年級」「大單元」是合併儲存格 (read_only 模式下只有第一格有值)，讀的時候就往下補。
+    """
+    start = time.perf_counter()
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name in workbook.sheetnames else workbook.active
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        if all(column in header for column in CURRICULUM_HEADER):
+            kind, columns, fill_down = 'curriculum', CURRICULUM_HEADER, ('年級', '大單元')
+        elif all(column in header for column in LINK_HEADER):
+            kind, columns, fill_down = 'links', LINK_HEADER, ()
+        else:
+            return {'path': path, 'kind': None, 'columns': header, 'rows': [], 'seconds': time.perf_counter() - start}
+        positions = [header.index(column) for column in columns]
+        fill_positions = [columns.index(column) for column in fill_down]
+        last = [None] * len(columns)
+        parsed = []
+        for row in rows:
+            values = [row[i] if i < len(row) else None for i in positions]
+            if all(value is None for value in values):
+                continue
+            for i in fill_positions:
+                if values[i] is None:
+                    values[i] = last[i]
+            last = values
+            parsed.append(tuple(values))
+    finally:
+        workbook.close()
+    return {'path': path, 'kind': kind, 'columns': list(columns), 'rows': parsed,
+            'seconds': time.perf_counter() - start}
+
+def parse_all(paths, workers=None, sheet_name=SHEET_NAME):
+    """
+    用 process pool 平行讀取，依完成的順序印出每個檔案的時間；回傳和 paths 一樣順序的結果。
+    讀取失敗的檔案也會有一筆 kind = None 的結果 (多一個 'error' 欄位)。
+    """
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    results = {}
+    print(f"{'檔案':<28}{'類型':<12}{'列數':>8}{'秒':>8}{'列/秒':>10}")
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {pool.submit(parse_workbook, path, sheet_name): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"{os.path.basename(path):<28}讀取失敗: {e}")
+                # 留下失敗的紀錄 (kind = None)，ingest 才知道有檔案沒讀到，不會把它的依賴關係當成已刪除
+                results[path] = {'path': path, 'kind': None, 'columns': [], 'rows': [], 'seconds': 0.0,
+                                 'error': str(e)}
+                continue
+            results[path] = result
+            rate = len(result['rows']) / result['seconds'] if result['seconds'] else 0
+            print(f"{os.path.basename(path):<28}{result['kind'] or '(認不出來)':<12}{len(result['rows']):>8}"
+                  f"{result['seconds']:>8.2f}{rate:>10.0f}")
+    return [results[path] for path in paths]
+
+def merge_results(results):
+    """所有課綱合併成一個 DataFrame、所有知識點鏈結合併成一個 DataFrame[prerequisite, target]"""
+    curriculum = [pd.DataFrame(result['rows'], columns=result['columns'], dtype='string')
+                  for result in results if result['kind'] == 'curriculum']
+    links = [pd.DataFrame(result['rows'], columns=result['columns'], dtype='string')
+             for result in results if result['kind'] == 'links']
+    curriculum = pd.concat(curriculum, ignore_index=True).dropna(subset=['小單元']) if curriculum else None
+    links = clean_links(pd.concat(links, ignore_index=True)) if links \
+        else pd.DataFrame({'prerequisite': [], 'target': []}, dtype='string')
+    return curriculum, links
+
+def ingest(session, results, apply_curriculum, delete_missing=True, dry_run=False, protected_names=()):
+    """
+    先 upsert 課綱 (apply_curriculum 來自 import_curriculum.py)，再比對知識點鏈結，
+    兩者在同一個交易裡寫入。dry_run 時全部 rollback。
+    只要有任何一個活頁簿讀取失敗或認不出格式就整個中止 (ValueError)，什麼都不寫：
+    少了一個檔案的依賴關係，delete_missing 會把它們全部當成「活頁簿裡已經沒有」而刪掉。
+    """
+    skipped = [result for result in results if result['kind'] is None]
+    if skipped:
+        names = ", ".join(os.path.basename(result['path']) for result in skipped)
+        raise ValueError(f"有 {len(skipped)} 個活頁簿讀取失敗或認不出格式 ({names})，請修正或移出資料夾後再匯入")
+    curriculum, links = merge_results(results)
+    created = updated = 0
+    try:
+        if curriculum is not None:
+            created, updated = apply_curriculum(session, curriculum)
+            print(f"課綱: {len(curriculum)} 個小單元 (新增 {created}，更新 {updated})")
+        session.flush()  # 新的小單元要先有 id，知識點鏈結才找得到
+        skills, dependencies = read_database(session)
+        plan = plan_import(links, skills, dependencies, delete_missing=delete_missing, protected_names=protected_names)
+        print(f"知識點鏈結: {summarize(plan)}")
+        if dry_run:
+            session.rollback()
+            print("(--dry-run：沒有寫入資料庫)")
+        elif not created and not updated and is_empty(plan):
+            session.rollback()
+            print("資料庫已經是最新的，不需要修改。")
+        else:
+            apply_plan(session, plan)  # 同一個交易，最後連同課綱版本號一起 commit
+            print("=== 成功！課綱與知識點鏈結已在同一個交易裡寫入資料庫 ===")
+    except Exception:
+        session.rollback()
+        raise
+    return plan
+
+# --- 主程式 ---
+if __name__ == "__main__":
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    parser = argparse.ArgumentParser(description="平行讀取資料夾裡所有的活頁簿，合併後一次寫入課綱與知識圖譜")
+    parser.add_argument('folder', nargs='?', default=os.path.join(basedir, LINK_FOLDER))
+    parser.add_argument('--sheet', default=SHEET_NAME)
+    parser.add_argument('--workers', type=int, default=None, help="process 數 (預設 = min(檔案數, CPU 數))")
+    parser.add_argument('--dry-run', action='store_true', help="只印出要做的修改，不寫入資料庫")
+    parser.add_argument('--keep-missing', action='store_true', help="不要刪除活頁簿裡已經沒有的依賴關係")
+    args = parser.parse_args()
+
+    paths = discover_workbooks(args.folder)
+    if not paths:
+        print(f"在 {args.folder} 裡找不到任何 .xlsx 檔案。")
+        raise SystemExit(1)
+    start = time.perf_counter()
+    results = parse_all(paths, args.workers, args.sheet)
+    parse_seconds = time.perf_counter() - start
+    total_rows = sum(len(result['rows']) for result in results)
+    print(f"讀取 {len(results)} 個檔案、{total_rows} 列，共 {parse_seconds:.2f} 秒 "
+          f"(各檔案加總 {sum(result['seconds'] for result in results):.2f} 秒)")
+
+    from app import SKILL_ENGINE, app, db  # 放在這裡：子 process 不用載入整個網站
+    from import_curriculum import apply_curriculum
+    from migrations import upgrade
+    with app.app_context():
+        upgrade(db.engine, db.metadata)
+        start = time.perf_counter()
+        try:
+            ingest(db.session, results, apply_curriculum, delete_missing=not args.keep_missing, dry_run=args.dry_run,
+                   protected_names=SKILL_ENGINE.keys())
+        except ValueError as e:
+            print(f"匯入中止: {e}")
+            raise SystemExit(1)
+        print(f"寫入資料庫花了 {time.perf_counter() - start:.2f} 秒")
@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from kv_store import LRUStore
+
+# ==============================================================================
+# 背景工作佇列 (Job Queue)
+# ==============================================================================
+# 手寫辨識要等 Gemini 視覺模型好幾秒，如果在 Flask worker 裡同步等待，
+# 幾個同時送出的請求就會把 worker 佔滿，連 /check_answer 都要排隊。
+# 這裡把工作丟進有上限的執行緒池，馬上回傳 job_id，前端再用輪詢或 SSE 取得結果。
+#
+# 工作狀態 (不含要執行的函式) 以 JSON 存在 kv_store 裡 (job_id 當 key)：
+#   - 用 SQLiteStore 時多個 worker process 共用，輪詢打到別的 process 也查得到
+#   - 同一個 process 的 SSE 用 threading.Event 馬上叫醒；別的 process 的工作就每隔 poll_interval 秒查一次
+#   - 執行工作的 process 重新啟動 (或當掉) 時工作本身就沒了：排隊 / 執行中超過 stale_after 秒
+#     沒有更新的工作一律回報為 error，前端不會一直等下去
+#   - 擁有工作的 process 每隔 stale_after / 3 秒幫自己還沒完成的工作更新 updated_at (heartbeat)，
+#     所以排隊排很久的工作不會被誤判為中斷；只有 process 不見了，updated_at 才會停住
+# 執行緒池和排隊上限 (max_pending) 還是每個 process 各自計算。
+
+FINISHED = ('done', 'error')
+INTERRUPTED_ERROR = "工作中斷 (伺服器可能重新啟動了)，請重新送出。"
+
+class JobQueueFull(Exception):
+    """佇列已滿 (同時排隊/執行中的工作太多)"""
+
+class JobQueue:
+    def __init__(self, max_workers=4, max_pending=32, result_ttl=600, store=None, stale_after=300,
+                 poll_interval=0.5, sweep_interval=300):
+        """
+        store         : 存工作狀態的 kv_store (None = 只放這個 process 的記憶體)
+        result_ttl    : 完成的結果保留幾秒
+        stale_after   : 排隊 / 執行中的工作超過幾秒沒有更新 (heartbeat) 就當作中斷
+        poll_interval : 等待別的 process 的工作時，每隔幾秒查一次 store
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending    # 排隊 + 執行中的工作上限
+        self.result_ttl = result_ttl
+        self.store = store if store is not None else LRUStore(maxsize=10000)
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._events = {}                 # 這個 process 還沒完成的工作 job_id -> threading.Event
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 讀出-修改-寫回 store 時用 (heartbeat 不能蓋掉剛完成的結果)
+        self._heartbeat = None
+        self._pending = 0
+        self._last_sweep = time.time()
+        self._counters = {'submitted': 0, 'rejected': 0, 'done': 0, 'error': 0}
+
+    def submit(self, fn, *args, owner=None, **kwargs):
+        """把 fn(*args, **kwargs) 排進佇列，回傳 job_id；佇列滿了會丟出 JobQueueFull"""
+        self._maybe_sweep()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters['rejected'] += 1
+                raise JobQueueFull(f"目前有 {self._pending} 個工作在處理中")
+            job_id = uuid.uuid4().hex
+            self._events[job_id] = threading.Event()
+            self._pending += 1
+            self._counters['submitted'] += 1
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True)
+                self._heartbeat.start()
+        now = time.time()
+        self._save({'job_id': job_id, 'owner': owner, 'status': 'queued', 'result': None, 'error': None,
+                    'created_at': now, 'updated_at': now, 'finished_at': None})
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def get(self, job_id):
+        """回傳工作目前的狀態 (找不到回傳 None)"""
+        payload = self.store.get(job_id)
+        if payload is None:
+            return None
+        job = json.loads(payload)
+        if job['status'] not in FINISHED and time.time() - job['updated_at'] > self.stale_after:
+            job.update(status='error', error=INTERRUPTED_ERROR)
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """等到工作完成或逾時，回傳狀態"""
+        with self._lock:
+            event = self._events.get(job_id)
+        job = self.get(job_id)
+        if job is None or job['status'] in FINISHED:
+            return job
+        if event is not None:
+            event.wait(timeout)
+            return self.get(job_id)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while job is not None and job['status'] not in FINISHED:
+            remaining = self.poll_interval if deadline is None else min(self.poll_interval, deadline - time.monotonic())
+            if remaining <= 0:
+                break
+            time.sleep(remaining)
+            job = self.get(job_id)
+        return job
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters, pending=self._pending)
+        return dict(counters, stored=self.store.stats()['size'],
+                    max_workers=self.max_workers, max_pending=self.max_pending)
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status='running')
+        try:
+            result = fn(*args, **kwargs)
+            self._finish(job_id, status='done', result=result)
+        except Exception as e:
+            print(f"背景工作 {job_id} 失敗: {e}")
+            self._finish(job_id, status='error', error=str(e))
+
+    def _save(self, job):
+        # 還沒完成的工作也要有期限：執行它的 process 不見了，stale_after 之後回報中斷，再過 result_ttl 刪掉
+        ttl = self.result_ttl if job['status'] in FINISHED else self.stale_after + self.result_ttl
+        self.store.set(job['job_id'], json.dumps(job, ensure_ascii=False), ttl)
+
+    def _update(self, job_id, **fields):
+        with self._write_lock:
+            payload = self.store.get(job_id)
+            if payload is None:
+                return  # 已經過期被清掉了
+            job = json.loads(payload)
+            job.update(fields, updated_at=time.time())
+            self._save(job)
+
+    def _heartbeat_loop(self):
+        """(背景執行緒) 定期更新這個 process 還沒完成的工作，讓別的 process 知道它們還活著"""
+        while True:
+            time.sleep(self.stale_after / 3)
+            with self._lock:
+                job_ids = list(self._events)
+            for job_id in job_ids:
+                try:
+                    self._update(job_id)
+                except Exception as e:
+                    print(f"更新背景工作 {job_id} 的 heartbeat 時出錯: {e}")
+
+    def _finish(self, job_id, **fields):
+        now = time.time()
+        try:
+            self._update(job_id, finished_at=now, **fields)
+        except (TypeError, ValueError) as e:
+            # 結果不能轉成 JSON：當作失敗，前端還是會收到結果
+            print(f"背景工作 {job_id} 的結果無法儲存: {e}")
+            fields = {'status': 'error', 'error': f"結果無法儲存 ({e})"}
+            self._update(job_id, finished_at=now, result=None, **fields)
+        with self._lock:
+            event = self._events.pop(job_id, None)
+            self._pending -= 1
+            self._counters[fields['status']] += 1
+        if event is not None:
+            event.set()
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            self.store.sweep()
+        except Exception as e:
+            print(f"清理過期的背景工作時出錯: {e}")
@@ -0,0 +1,236 @@
+import numpy as np
+
+# ==============================================================================
+# 知識圖譜 (Knowledge Graph)
+# ==============================================================================
+# skill_dependency (先備技能 -> 目標技能) 加上 SKILL_ENGINE 裡的 prerequisite_skill_id，
+# 載入時一次建成緊湊的整數陣列，之後的查詢都不碰資料庫：
+#   - CSR (prereq_indptr / prereq_indices)：第 i 個技能的直接先備技能是
+#     prereq_indices[prereq_indptr[i]:prereq_indptr[i + 1]] (dependent_* 是反方向)
+#   - topo_order : 拓撲順序 (先備技能一定排在前面)
+#   - depth      : 最長先備鏈的長度 (沒有先備技能的是 0)
+#   - closure    : 每個技能一列 bitset (uint64)，第 j 個 bit = 技能 j 是它 (直接或間接) 的先備技能
+#   - descendant_count : 有幾個技能 (直接或間接) 以它為先備技能 (學會它能解鎖多少後面的內容)
+# 內部的索引是技能在 node_ids (排序過的 skill.id) 裡的位置；對外的參數與回傳值都是 skill.id。
+# bitset 的大小是 技能數^2 / 8 bytes：一千個技能 125 KB，一萬個技能 12.5 MB。
+# 載入時會檢查循環依賴：strict=True 丟出 CycleError；strict=False 拿掉造成循環的邊 (記在 dropped_edges)。
+
+WORD_BITS = 64
+UNPACK_CHUNK = 1024  # 統計 descendant_count 時一次展開幾列 bitset (控制暫存記憶體)
+
+class CycleError(ValueError):
+    def __init__(self, cycle):
+        self.cycle = cycle  # 循環上的 skill.id，最後一個依賴第一個
+        super().__init__(f"知識圖譜有循環依賴: {' -> '.join(str(skill_id) for skill_id in cycle)}")
+
+def _csr(count, sources, targets):
+    """(sources[k] -> targets[k]) 依 targets 分組：回傳 (indptr, indices)，indices 是 sources"""
+    order = np.argsort(targets, kind='stable')
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(targets, minlength=count), out=indptr[1:])
+    return indptr, sources[order].astype(np.int32)
+
+def _topological_order(count, prereq_indptr, dependent_indptr, dependent_indices):
+    """Kahn 演算法；有循環時回傳的順序會少於 count 個"""
+    indegree = np.diff(prereq_indptr).tolist()
+    dependent_indptr = dependent_indptr.tolist()
+    dependent_indices = dependent_indices.tolist()
+    queue = [i for i in range(count) if indegree[i] == 0]
+    for i in queue:  # queue 邊走邊加長
+        for j in dependent_indices[dependent_indptr[i]:dependent_indptr[i + 1]]:
+            indegree[j] -= 1
+            if indegree[j] == 0:
+                queue.append(j)
+    return queue
+
+def _back_edges(count, dependent_indptr, dependent_indices):
+    """非遞迴 DFS，回傳所有 back edge (拿掉之後就沒有循環了) 和找到的第一個循環"""
+    dependent_indptr = dependent_indptr.tolist()
+    dependent_indices = dependent_indices.tolist()
+    state = [0] * count  # 0 = 還沒走過, 1 = 在目前的路徑上, 2 = 走完了
+    back_edges, first_cycle = [], None
+    for root in range(count):
+        if state[root]:
+            continue
+        path, stack = [root], [dependent_indptr[root]]
+        state[root] = 1
+        while stack:
+            i, position = path[-1], stack[-1]
+            if position == dependent_indptr[i + 1]:
+                state[i] = 2
+                path.pop()
+                stack.pop()
+                continue
+            stack[-1] += 1
+            j = dependent_indices[position]
+            if state[j] == 0:
+                state[j] = 1
+                path.append(j)
+                stack.append(dependent_indptr[j])
+            elif state[j] == 1:
+                back_edges.append((i, j))
+                if first_cycle is None:
+                    first_cycle = path[path.index(j):]
+    return back_edges, first_cycle
+
+class KnowledgeGraph:
+    """不可修改的知識圖譜；技能或依賴關係改了就建一個新的"""
+    def __init__(self, skill_ids, edges, names=None, practicable=None, strict=True):
+        """
+        skill_ids   : 所有技能的 skill.id
+        edges       : [(先備技能 id, 目標技能 id), ...]；不在 skill_ids 裡的會略過 (計入 skipped_edges)
+        names       : {skill.id: 技能代號}，demotion / 推薦要回傳技能代號時用
+        practicable : 有題目產生器、可以直接練習的技能代號 (None = 全部都可以)
+        strict      : 有循環依賴時丟出 CycleError；False 時拿掉造成循環的邊
+        """
+        self.node_ids = np.unique(np.fromiter(skill_ids, dtype=np.int64))
+        count = len(self.node_ids)
+        self.names = dict(names or {})
+        edge_array = np.array(list(edges), dtype=np.int64).reshape(-1, 2)
+        known = np.isin(edge_array, self.node_ids).all(axis=1)
+        self.skipped_edges = int(np.count_nonzero(~known))
+        edge_array = np.unique(np.searchsorted(self.node_ids, edge_array[known]), axis=0)
+        self.dropped_edges = []
+
+        self._build_csr(count, edge_array)
+        order = _topological_order(count, self.prereq_indptr, self.dependent_indptr, self.dependent_indices)
+        if len(order) < count:
+            back_edges, cycle = _back_edges(count, self.dependent_indptr, self.dependent_indices)
+            if strict:
+                raise CycleError([int(self.node_ids[i]) for i in cycle])
+            drop = {(i, j) for i, j in back_edges}
+            self.dropped_edges = [(int(self.node_ids[i]), int(self.node_ids[j])) for i, j in back_edges]
+            edge_array = np.array([edge for edge in edge_array.tolist() if tuple(edge) not in drop],
+                                  dtype=np.int64).reshape(-1, 2)
+            self._build_csr(count, edge_array)
+            order = _topological_order(count, self.prereq_indptr, self.dependent_indptr, self.dependent_indices)
+        self.topo_order = np.array(order, dtype=np.int32)
+        self.edge_count = len(edge_array)
+        self.edge_prerequisites = edge_array[:, 0].astype(np.int32)  # COO 形式，給向量化的推薦用
+        self.edge_targets = edge_array[:, 1].astype(np.int32)
+
+        if practicable is None:
+            self.practicable = np.ones(count, dtype=bool)
+        else:
+            practicable = set(practicable)
+            self.practicable = np.array([self.names.get(int(skill_id)) in practicable
+                                         for skill_id in self.node_ids], dtype=bool)
+        self._build_closure(count)
+
+    def _build_csr(self, count, edge_array):
+        sources, targets = edge_array[:, 0], edge_array[:, 1]
+        self.prereq_indptr, self.prereq_indices = _csr(count, sources, targets)
+        self.dependent_indptr, self.dependent_indices = _csr(count, targets, sources)
+
+    def _build_closure(self, count):
+        """依拓撲順序：closure[i] = OR(closure[p] | bit(p))，p 是 i 的直接先備技能"""
+        words = max(1, (count + WORD_BITS - 1) // WORD_BITS)
+        self.closure = np.zeros((count, words), dtype='<u8')
+        self.depth = np.zeros(count, dtype=np.int32)
+        for i in self.topo_order.tolist():
+            prereqs = self.prereq_indices[self.prereq_indptr[i]:self.prereq_indptr[i + 1]]
+            if not len(prereqs):
+                continue
+            row = np.bitwise_or.reduce(self.closure[prereqs], axis=0)
+            np.bitwise_or.at(row, prereqs // WORD_BITS, np.left_shift(np.uint64(1), (prereqs % WORD_BITS).astype(np.uint64)))
+            self.closure[i] = row
+            self.depth[i] = self.depth[prereqs].max() + 1
+        self.descendant_count = np.zeros(count, dtype=np.int32)
+        for start in range(0, count, UNPACK_CHUNK):
+            bits = np.unpackbits(self.closure[start:start + UNPACK_CHUNK].view(np.uint8), axis=1, bitorder='little')
+            self.descendant_count += bits[:, :count].sum(axis=0, dtype=np.int32)
+        # 有沒有「可以練習」的先備技能 (決定答錯時能不能降級)
+        practicable_bits = self._pack(self.practicable)
+        self.has_practicable_ancestor = (self.closure & practicable_bits).any(axis=1)
+
+    def _pack(self, mask):
+        """長度 = 技能數的 bool 陣列 -> 一列 bitset"""
+        words = self.closure.shape[1]
+        padded = np.zeros(words * WORD_BITS, dtype=bool)
+        padded[:len(mask)] = mask
+        return np.packbits(padded, bitorder='little').view('<u8')
+
+    def _ancestor_distances(self, i):
+        """從 i 沿著先備技能 (prereq CSR) 做 BFS：回傳 (所有先備技能的索引, 離 i 幾步)，依距離排好"""
+        indptr = self.prereq_indptr
+        distance = {i: 0}
+        queue = [i]
+        for j in queue:  # queue 邊走邊加長
+            for p in self.prereq_indices[indptr[j]:indptr[j + 1]].tolist():
+                if p not in distance:
+                    distance[p] = distance[j] + 1
+                    queue.append(p)
+        ancestors = np.array(queue[1:], dtype=np.int64)
+        return ancestors, np.array([distance[j] for j in queue[1:]], dtype=np.int64)
+
+    # --- 查詢 (參數與回傳值都是 skill.id) ---
+    def index(self, skill_id):
+        """skill.id -> 內部索引 (不在圖裡回傳 None)"""
+        i = int(np.searchsorted(self.node_ids, skill_id))
+        return i if i < len(self.node_ids) and self.node_ids[i] == skill_id else None
+
+    def name(self, skill_id):
+        return self.names.get(skill_id)
+
+    def prerequisites(self, skill_id):
+        """直接先備技能"""
+        i = self.index(skill_id)
+        if i is None:
+            return []
+        return self.node_ids[self.prereq_indices[self.prereq_indptr[i]:self.prereq_indptr[i + 1]]].tolist()
+
+    def all_prerequisites(self, skill_id):
+        """所有 (直接或間接) 先備技能，離這個技能越近 (步數越少) 的排越前面，同樣近的 depth 大的排前面"""
+        i = self.index(skill_id)
+        if i is None:
+            return []
+        ancestors, distances = self._ancestor_distances(i)
+        ancestors = ancestors[np.lexsort((ancestors, -self.depth[ancestors], distances))]
+        return self.node_ids[ancestors].tolist()
+
+    def is_prerequisite(self, prerequisite_id, skill_id):
+        """prerequisite_id 是不是 skill_id 的 (直接或間接) 先備技能"""
+        i, j = self.index(skill_id), self.index(prerequisite_id)
+        if i is None or j is None:
+            return False
+        return bool(self.closure[i, j // WORD_BITS] >> np.uint64(j % WORD_BITS) & np.uint64(1))
+
+    def skill_depth(self, skill_id):
+        i = self.index(skill_id)
+        return int(self.depth[i]) if i is not None else 0
+
+    def can_demote(self, skill_id):
+        """有沒有可以退回去練習的先備技能"""
+        i = self.index(skill_id)
+        return i is not None and bool(self.has_practicable_ancestor[i])
+
+    def weakest_ancestor(self, skill_id, scores=None, mastered_at=1):
+        """
+        答錯太多次時要退回哪個先備技能 (只考慮可以練習的)：
+        還沒精熟 (scores < mastered_at) 的先備技能裡離這個技能最近的 (沿著先備關係走的步數最少)，
+        同樣近的取分數最低的；全部都精熟了就退回最近的先備技能。沒有先備技能回傳 None。
+        scores: 以 skill.id 為索引的陣列 (例如精熟度向量的連續答對數)，太短或 None 的部分當作 0。
+        """
+        i = self.index(skill_id)
+        if i is None:
+            return None
+        if not self.has_practicable_ancestor[i]:
+            return None
+        ancestors, distances = self._ancestor_distances(i)
+        practicable = self.practicable[ancestors]
+        ids, distances = self.node_ids[ancestors[practicable]], distances[practicable]
+        values = np.zeros(len(ids), dtype=np.int64)
+        if scores is not None:
+            in_range = ids < len(scores)
+            values[in_range] = np.asarray(scores)[ids[in_range]]
+        weak = values < mastered_at
+        if weak.any():
+            ids, values, distances = ids[weak], values[weak], distances[weak]
+        best = np.lexsort((ids, values, distances))[0]
+        return int(ids[best])
+
+    def stats(self):
+        return {'skills': len(self.node_ids), 'edges': self.edge_count,
+                'max_depth': int(self.depth.max()) if len(self.depth) else 0,
+                'skipped_edges': self.skipped_edges, 'dropped_edges': len(self.dropped_edges),
+                'closure_bytes': int(self.closure.nbytes)}
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ==============================================================================
+# 兩層式 Key-Value 儲存 (記憶體 LRU + SQLite)
+# ==============================================================================
+# - LRUStore    : 單一 process 內的 LRU 快取 (可設定 TTL，也可以用總位元組數設上限)，最快。
+# - SQLiteStore : 存在 SQLite 檔案裡，多個 worker process 可以共用，重開機也不會消失。
+# - TieredStore : 先查記憶體，查不到再查 SQLite (查到就回填記憶體)。
+# 值一律是字串 (通常是 JSON)，由呼叫的人自己序列化。
+
+class LRUStore:
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None, sizeof=len):
+        self.maxsize = maxsize
+        self.ttl = ttl  # 秒；None 表示不過期
+        self.maxbytes = maxbytes  # 所有值加起來的大小上限 (用 sizeof 計算)；None 表示只限制筆數
+        self.sizeof = sizeof
+        self._data = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[1] is None or item[1] > time.time()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                self._remove(key)  # 已過期
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+                self._remove(next(iter(self._data)))  # 最久沒用的先丟 (單一個超過上限的值也不會留下)
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        """(呼叫的人要先拿到 _lock)"""
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def sweep(self):
+        """清掉所有已過期的項目，回傳清掉幾筆"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at, _) in self._data.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                self._remove(key)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._data), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': (self.hits / total) if total else None}
+
+class SQLiteStore:
+    def __init__(self, path, table='kv_store', ttl=None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self._local = threading.local()  # sqlite3 連線不能跨執行緒共用，每個執行緒各開一條
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+        self._connect().execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_expires_at ON {table} (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            f"SELECT value FROM {self.table} WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        self._connect().execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at))
+
+    def delete(self, key):
+        self._connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def sweep(self):
+        """清掉所有已過期的項目，回傳清掉幾筆"""
+        cursor = self._connect().execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def stats(self):
+        size = self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': size, 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': (self.hits / total) if total else None}
+
+class TieredStore:
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def sweep(self):
+        removed = self.memory.sweep()
+        if self.disk is not None:
+            removed += self.disk.sweep()
+        return removed
+
+    def stats(self):
+        result = {'memory': self.memory.stats()}
+        if self.disk is not None:
+            result['disk'] = self.disk.stats()
+        return result
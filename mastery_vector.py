@@ -0,0 +1,83 @@
+import numpy as np
+from sqlalchemy import bindparam, text
+
+# ==============================================================================
+# 每個學生的精熟度向量 (Mastery Vector)
+# ==============================================================================
+# dashboard 想顯示整份課綱的進度，但 user_progress 一個技能一列，學生練得越多要讀的列越多。
+# 這裡每個學生只存一列 user_mastery：data 是一個 little-endian uint16 陣列，
+# 以 skill.id 當索引，每個技能兩格 [總作答數, 連續答對數] (超過 65535 就停在 65535)。
+# 一般的課綱 (幾百個技能) 不到 1 KB，一次讀出來用 NumPy 就能算出每個年級練了幾個單元。
+# 每次作答時在同一個交易裡更新 (這時已經拿到寫入鎖，不會和其他寫入互相覆蓋)；
+# 舊資料由 migrations.py 第 5 版建好；之後還是沒有向量的學生 (例如關掉 MASTERY_VECTOR 時才開始練習)，
+# 第一次作答時從 user_progress 重建。
+
+DTYPE = np.dtype('<u2')
+FIELDS = 2                 # [total_attempted, consecutive_correct]
+ATTEMPTED, CONSECUTIVE = 0, 1
+MAX_VALUE = np.iinfo(DTYPE).max
+
+SELECT_MASTERY_SQL = text("SELECT data FROM user_mastery WHERE user_id = :user_id")
+UPSERT_MASTERY_SQL = text("""
+    INSERT INTO user_mastery (user_id, data) VALUES (:user_id, :data)
+    ON CONFLICT (user_id) DO UPDATE SET data = excluded.data
+""")
+SELECT_PROGRESS_SQL = text("""
+    SELECT user_id, skill_id, total_attempted, consecutive_correct FROM user_progress WHERE user_id IN :user_ids
+""").bindparams(bindparam('user_ids', expanding=True))
+
+def unpack(blob):
+    """blob -> 可寫入的 (n, 2) uint16 陣列 (第 skill.id 列就是該技能)"""
+    if not blob:
+        return np.zeros((0, FIELDS), dtype=DTYPE)
+    return np.frombuffer(blob, dtype=DTYPE).reshape(-1, FIELDS).copy()
+
+def pack(vector):
+    return vector.astype(DTYPE, copy=False).tobytes()
+
+def set_entry(vector, skill_id, total_attempted, consecutive_correct):
+    """設定一個技能的數值 (陣列不夠長就補零加長)，回傳新的陣列"""
+    if skill_id >= len(vector):
+        grown = np.zeros((skill_id + 1, FIELDS), dtype=DTYPE)
+        grown[:len(vector)] = vector
+        vector = grown
+    vector[skill_id] = (min(total_attempted or 0, MAX_VALUE), min(consecutive_correct or 0, MAX_VALUE))
+    return vector
+
+def read_mastery(session, user_id, for_update=False):
+    """學生的精熟度向量；還沒有的話回傳 None。for_update: PostgreSQL 上鎖住這一列直到交易結束"""
+    query = SELECT_MASTERY_SQL
+    if for_update and session.get_bind().dialect.name != 'sqlite':
+        query = text(query.text + " FOR UPDATE")  # SQLite 在 upsert 時已經拿到整個資料庫的寫入鎖
+    blob = session.execute(query, {'user_id': user_id}).scalar()
+    return unpack(blob) if blob is not None else None
+
+def rebuild_mastery(session, user_ids):
+    """從 user_progress 重建這些學生的向量 (不會 commit；session 或 connection 都可以)"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    vectors = {user_id: np.zeros((0, FIELDS), dtype=DTYPE) for user_id in user_ids}
+    rows = session.execute(SELECT_PROGRESS_SQL, {'user_ids': user_ids})
+    for user_id, skill_id, total_attempted, consecutive_correct in rows:
+        vectors[user_id] = set_entry(vectors[user_id], skill_id, total_attempted, consecutive_correct)
+    session.execute(UPSERT_MASTERY_SQL, [{'user_id': user_id, 'data': pack(vector)}
+                                         for user_id, vector in vectors.items()])
+
+def update_mastery(session, user_id, skill_id, total_attempted, consecutive_correct):
+    """作答後更新一個技能 (和 user_progress 的 upsert 在同一個交易裡，不會 commit)"""
+    vector = read_mastery(session, user_id, for_update=True)
+    if vector is None:
+        rebuild_mastery(session, [user_id])  # 第一次：user_progress 裡已經有這次作答了
+        return
+    session.execute(UPSERT_MASTERY_SQL, {'user_id': user_id,
+                                         'data': pack(set_entry(vector, skill_id, total_attempted,
+                                                                consecutive_correct))})
+
+def practiced_count(vector, skill_ids):
+    """skill_ids 裡有作答過的技能數"""
+    if vector is None or not len(skill_ids):
+        return 0
+    ids = np.asarray(skill_ids)
+    ids = ids[ids < len(vector)]
+    return int(np.count_nonzero(vector[ids, ATTEMPTED]))
@@ -0,0 +1,135 @@
+import os
+import time
+from contextlib import contextmanager
+from sqlalchemy import inspect, text
+from mastery_vector import rebuild_mastery
+
+# ==============================================================================
+# 資料庫結構升級 (Schema Migrations)
+# ==============================================================================
+# 以前改了模型就 drop_all() + create_all()，所有學生的 UserProgress 都會被清掉。
+# 現在資料庫裡有一張 schema_version 表記錄已經套用到第幾版，
+# 啟動時 (或執行 python migrations.py) 只套用還沒跑過的版本，每一版在自己的交易裡執行。
+# 每一版都寫成可以重複執行 (IF NOT EXISTS)，新的資料庫和舊的資料庫都會升級成一樣的結構。
+# 新增一版：在 MIGRATIONS 最後面加上 (版本, 說明, 函式)，函式收到的是已經開好交易的 connection。
+# 多個 worker 同時啟動時，每一版都先拿到鎖 (SQLite: BEGIN IMMEDIATE，PostgreSQL: pg_advisory_xact_lock)
+# 再重新讀一次版本號，一直持有到這一版 commit，同一版不會被套用兩次。
+
+MIGRATION_LOCK_KEY = 7263501  # pg_advisory_xact_lock 用的鎖編號 (隨便選一個不會和別人撞到的數字)
+
+def _create_missing_tables(conn, metadata):
+    """第一版：依照目前的模型建立還不存在的資料表 (已存在的表不會動)"""
+    metadata.create_all(conn, checkfirst=True)
+
+def _add_lookup_indexes(conn, metadata):
+    """依年級 / 大單元列出技能、依先備或目標技能查知識圖譜時用的索引"""
+    for name, table, column in (('ix_skill_grade_level', 'skill', 'grade_level'),
+                                ('ix_skill_main_unit', 'skill', 'main_unit'),
+                                ('ix_skill_dependency_prerequisite_id', 'skill_dependency', 'prerequisite_id'),
+                                ('ix_skill_dependency_target_id', 'skill_dependency', 'target_id')):
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})"))
+
+def _unique_skill_dependency(conn, metadata):
+    """同一條依賴關係只能有一筆 (先刪掉重複的，保留最早的那一筆)"""
+    conn.execute(text("""
+        DELETE FROM skill_dependency WHERE id NOT IN (
+            SELECT MIN(id) FROM skill_dependency GROUP BY prerequisite_id, target_id)
+    """))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS unique_dependency "
+                      "ON skill_dependency (prerequisite_id, target_id)"))
+
+def _add_curriculum_version(conn, metadata):
+    """課綱版本號 (匯入課綱後 +1，讓各個 process 的課綱快取重建)"""
+    metadata.create_all(conn, tables=[metadata.tables['curriculum_version']], checkfirst=True)
+    if conn.execute(text("SELECT COUNT(*) FROM curriculum_version")).scalar() == 0:
+        conn.execute(text("INSERT INTO curriculum_version (id, version, updated_at) VALUES (1, 1, :now)"),
+                     {'now': int(time.time())})
+
+def _add_user_mastery(conn, metadata):
+    """每個學生一列的精熟度向量 (見 mastery_vector.py)，用現有的 user_progress 建好"""
+    metadata.create_all(conn, tables=[metadata.tables['user_mastery']], checkfirst=True)
+    user_ids = conn.execute(text("SELECT DISTINCT user_id FROM user_progress")).scalars().all()
+    rebuild_mastery(conn, user_ids)
+
+def _add_progress_checkpoint(conn, metadata):
+    """延後寫入的 journal 已經寫回到第幾個批次檔 (見 progress_buffer.py)"""
+    metadata.create_all(conn, tables=[metadata.tables['progress_checkpoint']], checkfirst=True)
+
+MIGRATIONS = [
+    (1, "建立缺少的資料表", _create_missing_tables),
+    (2, "技能與知識圖譜的查詢索引", _add_lookup_indexes),
+    (3, "skill_dependency (prerequisite_id, target_id) 不可重複", _unique_skill_dependency),
+    (4, "課綱版本號", _add_curriculum_version),
+    (5, "學生精熟度向量", _add_user_mastery),
+    (6, "延後寫入的 journal 檢查點", _add_progress_checkpoint),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version(engine):
+    """資料庫目前的版本 (還沒有 schema_version 表時是 0)"""
+    if not inspect(engine).has_table('schema_version'):
+        return 0
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+@contextmanager
+def _locked_transaction(engine):
+    """開一個交易並拿到升級用的鎖 (commit / rollback 時才放掉)"""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            # pysqlite 不會自己送 BEGIN，這裡直接要寫入鎖；別的 process 升級中會等 busy_timeout
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        elif engine.dialect.name == 'postgresql':
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def upgrade(engine, metadata):
+    """套用還沒跑過的版本，回傳套用了幾版 (別的 process 先套用的版本不算)"""
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version ("
+                          "version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at INTEGER)"))
+    version = current_version(engine)
+    applied = 0
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with _locked_transaction(engine) as conn:
+            # 等鎖的時候別的 process 可能已經套用了這一版
+            version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+            if migration_version <= version:
+                continue
+            migrate(conn, metadata)
+            conn.execute(text("INSERT INTO schema_version (version, description, applied_at) "
+                              "VALUES (:version, :description, :applied_at)"),
+                         {'version': migration_version, 'description': description, 'applied_at': int(time.time())})
+        print(f"資料庫已升級到第 {migration_version} 版: {description}")
+        applied += 1
+    return applied
+
+def check_schema(engine, metadata, auto_upgrade=True):
+    """
+    啟動時檢查資料庫版本：落後時自動升級 (auto_upgrade=False 時只印出警告)。
+    資料庫版本比程式新 (例如退版部署) 時也只印出警告，不做任何修改。
+    """
+    version = current_version(engine)
+    if version > LATEST_VERSION:
+        print(f"警告: 資料庫是第 {version} 版，比程式認得的第 {LATEST_VERSION} 版還新")
+    elif version < LATEST_VERSION:
+        if auto_upgrade:
+            upgrade(engine, metadata)
+        else:
+            print(f"警告: 資料庫是第 {version} 版，需要升級到第 {LATEST_VERSION} 版 (執行 python migrations.py)")
+    return current_version(engine)
+
+if __name__ == "__main__":
+    os.environ.setdefault('MIGRATE_ON_STARTUP', '0')  # 由這裡明確執行升級
+    from app import app, db
+    with app.app_context():
+        print(f"目前資料庫版本: {current_version(db.engine)} (最新: {LATEST_VERSION})")
+        applied = upgrade(db.engine, db.metadata)
+        print(f"完成，套用了 {applied} 個版本。")
@@ -0,0 +1,289 @@
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+# ==============================================================================
+# 模型呼叫排程器 (Model Scheduler)
+# ==============================================================================
+# 所有 generate_content 呼叫都經過這裡：
+#   - Token bucket : 每分鐘最多 rate_per_minute 次 (配合 API 額度)，允許短暫 burst
+#   - 優先權佇列   : 批改 (PRIORITY_GRADING) 排在聊天 (PRIORITY_CHAT) 前面
+#   - 重試         : 遇到 ResourceExhausted 等可重試的錯誤，用「指數退避 + 隨機抖動」重試
+#   - 斷路器       : 連續失敗 (可重試的錯誤) 太多次就暫停一段時間，期間的請求直接拒絕，不再浪費額度
+# 呼叫的執行緒會等到結果 (或逾時)；實際呼叫模型的是排程器自己的 worker 執行緒。
+# 串流 (stream=True) 也一樣：worker 把模型的每一段放進佇列，整段串流都佔著那個 worker (受 max_workers 限制)，
+# 串流中途的錯誤也會算進斷路器；還沒送出任何一段之前的錯誤可以重試，送出之後就直接交給呼叫的人。
+
+PRIORITY_GRADING = 0
+PRIORITY_CHAT = 1
+PRIORITY_NAMES = {PRIORITY_GRADING: 'grading', PRIORITY_CHAT: 'chat'}
+
+class ModelBusy(Exception):
+    """排隊的請求太多，或等太久還輪不到"""
+
+class ModelUnavailable(Exception):
+    """斷路器開啟中 (模型連續失敗)，暫時不接受請求"""
+
+_STREAM_DONE = object()
+
+class ModelStream:
+    """generate(stream=True) 回傳的 iterator：一段一段拿 worker 放進來的回應，每一段最多等 timeout 秒"""
+    def __init__(self, future, timeout=None, on_timeout=None):
+        self.future = future
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.started = False              # 已經送出第一段 (之後失敗就不能重試了)
+        self.closed = threading.Event()   # 呼叫的人不要了 (例如學生關掉網頁)，worker 停止讀取
+        self._chunks = queue.Queue()
+        future.add_done_callback(lambda _: self._chunks.put(_STREAM_DONE))
+
+    def feed(self, response):
+        """(worker 執行緒) 讀完模型的串流，每一段放進佇列"""
+        try:
+            for chunk in response:
+                if self.closed.is_set():
+                    break
+                self.started = True
+                self._chunks.put(chunk)
+        finally:
+            close = getattr(response, 'close', None)
+            if close is not None:
+                close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            item = self._chunks.get(timeout=self.timeout)
+        except queue.Empty:
+            self.close()
+            if self.on_timeout is not None:
+                self.on_timeout()
+            raise ModelBusy(f"等待模型超過 {self.timeout} 秒")
+        if item is _STREAM_DONE:
+            self._chunks.put(_STREAM_DONE)  # 之後再呼叫 next() 也是結束
+            if not self.future.cancelled() and self.future.exception() is not None:
+                raise self.future.exception()
+            raise StopIteration
+        return item
+
+    def close(self):
+        """不再讀取：還在排隊就取消，已經在讀的話 worker 讀到下一段就停"""
+        self.closed.set()
+        self.future.cancel()
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0  # 每秒補充幾個 token
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """拿一個 token；拿不到時回傳還要等幾秒"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None  # half_open 時正在試探的請求
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'open' if time.monotonic() - self.opened_at < self.cooldown else 'half_open'
+
+    def allow(self):
+        """closed 時放行；冷卻結束後 (half_open) 一次只放一個請求去試探"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                return False
+            if self.probe_started_at is not None and now - self.probe_started_at < self.cooldown:
+                return False
+            self.probe_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                # 試探的請求也失敗，或連續失敗太多次：重新開始冷卻
+                if self.opened_at is None:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+                self.probe_started_at = None
+
+class ModelScheduler:
+    def __init__(self, model, rate_per_minute=60, burst=10, max_workers=4, max_queue=64,
+                 max_retries=4, base_backoff=1.0, max_backoff=30.0, retryable=(),
+                 breaker_threshold=5, breaker_cooldown=30.0):
+        self.model = model
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retryable = tuple(retryable)
+        self._queue = []                  # heap of (priority, seq, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'retries': 0,
+                          'rejected_queue_full': 0, 'rejected_breaker_open': 0, 'timed_out': 0}
+        self._wait_total = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self._wait_max = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self._wait_count = {name: 0 for name in PRIORITY_NAMES.values()}
+        for i in range(max_workers):
+            threading.Thread(target=self._worker, name=f'model-worker-{i}', daemon=True).start()
+
+    def generate(self, contents, priority=PRIORITY_CHAT, timeout=None, **kwargs):
+        """
+        排隊呼叫 model.generate_content(contents, **kwargs)，等到結果為止 (最多 timeout 秒)。
+        stream=True 時馬上回傳 ModelStream (iterator)，每一段最多等 timeout 秒 (第一段包含排隊的時間)。
+        """
+        if kwargs.get('stream'):
+            future = Future()
+            stream = ModelStream(future, timeout, on_timeout=lambda: self._count('timed_out'))
+            self._enqueue(future, contents, priority, kwargs, stream)
+            return stream
+        future = self.submit(contents, priority, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()  # 還在排隊的話就不用再呼叫了
+            self._count('timed_out')
+            raise ModelBusy(f"等待模型超過 {timeout} 秒")
+
+    def submit(self, contents, priority=PRIORITY_CHAT, **kwargs):
+        """把呼叫排進佇列，回傳 Future (串流請用 generate(stream=True))"""
+        future = Future()
+        self._enqueue(future, contents, priority, kwargs)
+        return future
+
+    def _enqueue(self, future, contents, priority, kwargs, stream=None):
+        if not self.breaker.allow():
+            self._count('rejected_breaker_open')
+            raise ModelUnavailable("模型暫時無法使用 (斷路器開啟中)")
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._counters['rejected_queue_full'] += 1
+                raise ModelBusy(f"排隊中的模型請求已達上限 ({self.max_queue})")
+            job = {'future': future, 'contents': contents, 'kwargs': kwargs, 'stream': stream,
+                   'priority': priority, 'enqueued_at': time.monotonic()}
+            heapq.heappush(self._queue, (priority, next(self._seq), job))
+            self._counters['submitted'] += 1
+            self._cond.notify()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._queue)
+            if not job['future'].set_running_or_notify_cancel():
+                continue  # 呼叫的人已經放棄等待
+            try:
+                result = self._call_with_retry(job)
+            except Exception as e:
+                self._count('failed')
+                job['future'].set_exception(e)
+            else:
+                self._count('completed')
+                job['future'].set_result(result)
+
+    def _call_with_retry(self, job):
+        attempt = 0
+        while True:
+            self._wait_for_token()
+            if attempt == 0:
+                self._record_wait(job)  # 等待時間 = 排隊 + 等 token
+            stream = job['stream']
+            try:
+                result = self.model.generate_content(job['contents'], **job['kwargs'])
+                if stream is not None:
+                    stream.feed(result)  # 串流讀完才算成功，期間一直佔著這個 worker
+                self.breaker.record_success()
+                return result
+            except self.retryable as e:
+                # 只有額度 / 服務端的錯誤算進斷路器；題目本身造成的錯誤 (例如參數錯誤) 不算
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or self.breaker.state == 'open' or (stream is not None and stream.started):
+                    raise
+                # 指數退避 + full jitter：同時被限流的請求不會在同一時間一起重試
+                delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+                attempt += 1
+                self._count('retries')
+                print(f"模型呼叫失敗 ({e.__class__.__name__}: {e})，{delay:.1f} 秒後第 {attempt} 次重試")
+                time.sleep(delay)
+
+    def _wait_for_token(self):
+        while True:
+            delay = self.bucket.acquire()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _record_wait(self, job):
+        waited = time.monotonic() - job['enqueued_at']
+        name = PRIORITY_NAMES.get(job['priority'], str(job['priority']))
+        with self._cond:
+            self._wait_total[name] = self._wait_total.get(name, 0.0) + waited
+            self._wait_max[name] = max(self._wait_max.get(name, 0.0), waited)
+            self._wait_count[name] = self._wait_count.get(name, 0) + 1
+
+    def _count(self, key):
+        with self._cond:
+            self._counters[key] += 1
+
+    def stats(self):
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, _ in self._queue:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+            wait = {name: {'avg_ms': (self._wait_total[name] / count * 1000) if count else None,
+                           'max_ms': self._wait_max[name] * 1000, 'count': count}
+                    for name, count in self._wait_count.items()}
+            counters = dict(self._counters)
+        return dict(counters, queue_depth=depth, wait=wait,
+                    tokens_available=round(self.bucket.available(), 2),
+                    rate_per_minute=self.bucket.rate * 60,
+                    breaker={'state': self.breaker.state, 'failures': self.breaker.failures,
+                             'trips': self.breaker.trips})
@@ -0,0 +1,46 @@
+import itertools
+import random
+import numpy as np
+
+# ==============================================================================
+# 參數抽樣引擎 (Constraint-driven Parameter Sampler)
+# ==============================================================================
+# 題目生成器只要宣告一次「參數範圍」與「限制條件」，
+# 引擎就會在載入時把所有合法的參數組合列舉出來，之後每次抽題只要抽一次索引 (O(1))，
+# 不再需要 while 迴圈一直重抽到符合條件為止。
+
+class ParamSpace:
+    def __init__(self, name, domains, constraint=None):
+        self.name = name
+        self.names = tuple(domains)
+        self.domains = tuple(tuple(values) for values in domains.values())
+        self.constraint = constraint
+        self.total = 1
+        for values in self.domains:
+            self.total *= len(values)
+        self.valid = [combo for combo in itertools.product(*self.domains) if self._accepts(combo)]
+        if not self.valid:
+            raise ValueError(f"參數空間 '{name}' 沒有任何符合條件的組合")
+        self._array = None
+
+    @property
+    def acceptance_rate(self):
+        """合法組合佔全部組合的比例 (舊的拒絕抽樣平均要重抽 1 / acceptance_rate 次)"""
+        return len(self.valid) / self.total
+
+    def sample(self, rng=random):
+        """均勻抽出一組合法參數，回傳 {參數名稱: 值}"""
+        return dict(zip(self.names, rng.choice(self.valid)))
+
+    def sample_batch(self, n, rng):
+        """一次均勻抽出 n 組合法參數，回傳 {參數名稱: NumPy 陣列} (rng 為 np.random.Generator)"""
+        if self._array is None:
+            self._array = np.array(self.valid, dtype=np.int64)
+        rows = self._array[rng.integers(0, len(self.valid), size=n)]
+        return {name: rows[:, i] for i, name in enumerate(self.names)}
+
+    def _accepts(self, combo):
+        return self.constraint is None or self.constraint(**dict(zip(self.names, combo)))
+
+    def __repr__(self):
+        return f'<ParamSpace {self.name}: {len(self.valid)}/{self.total}>'
@@ -0,0 +1,390 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from sqlalchemy import text
+from progress_service import INSERT_ATTEMPT_SQL, UPSERT_DAILY_SQL, activity_day
+from mastery_vector import CONSECUTIVE, read_mastery, rebuild_mastery, set_entry, unpack
+
+# ==============================================================================
+# 作答進度的延後寫入 (Write-behind Progress Buffer)
+# ==============================================================================
+# 考試週大家一起寫題目時，每次作答都自己 commit 一次，SQLite 的寫入鎖就變成瓶頸。
+# 開啟延後寫入後 (PROGRESS_WRITE_BEHIND=1)：
+#   - 作答結果先記在記憶體 (每個 (user_id, skill_id) 一串依序的對/錯)，
+#     同時附加到 instance/ 底下的 journal 檔 (一行一筆 JSON)，process 掛掉也不會遺失
+#   - 每隔幾秒或累積太多筆時，整批在「一個」交易裡寫回：attempt 一次 executemany，
+#     user_progress 和 daily_activity 則是同一個 key 的多次作答先合併成一條 upsert
+#   - 讀取進度時 (例如單元列表) 用記憶體裡的最新計數器蓋過資料庫的值，學生馬上看得到
+# 記憶體裡的計數器以「這個 process 是唯一的寫入者」為前提，多個 process 時不要開啟。
+# 寫回的同一個交易裡也記下「已經寫回到第幾個批次檔」(progress_checkpoint 表)，
+# 如果 commit 之後、刪掉批次檔之前就當掉，重新啟動時會跳過這些批次檔，不會重複計算。
+
+FOLD_PROGRESS_SQL = text("""
+    INSERT INTO user_progress (user_id, skill_id, consecutive_correct, total_correct, total_attempted, consecutive_incorrect)
+    VALUES (:user_id, :skill_id, :trailing_correct, :n_correct, :n, :trailing_incorrect)
+    ON CONFLICT (user_id, skill_id) DO UPDATE SET
+        total_attempted = COALESCE(user_progress.total_attempted, 0) + :n,
+        total_correct = COALESCE(user_progress.total_correct, 0) + :n_correct,
+        consecutive_correct = CASE WHEN :n_correct = :n
+                                   THEN COALESCE(user_progress.consecutive_correct, 0) + :n
+                                   ELSE :trailing_correct END,
+        consecutive_incorrect = CASE WHEN :n_correct > 0 THEN :trailing_incorrect
+                                     WHEN :can_demote = 1
+                                          THEN (COALESCE(user_progress.consecutive_incorrect, 0) + :n) % :threshold
+                                     ELSE COALESCE(user_progress.consecutive_incorrect, 0) + :n END
+""")
+
+SELECT_PROGRESS_SQL = text("""
+    SELECT consecutive_correct, total_correct, total_attempted, consecutive_incorrect
+    FROM user_progress WHERE user_id = :user_id AND skill_id = :skill_id
+""")
+
+SELECT_CHECKPOINT_SQL = text("SELECT segment FROM progress_checkpoint WHERE journal = :journal")
+
+SAVE_CHECKPOINT_SQL = text("""
+    INSERT INTO progress_checkpoint (journal, segment) VALUES (:journal, :segment)
+    ON CONFLICT (journal) DO UPDATE SET segment = excluded.segment
+""")
+
+COUNTER_FIELDS = ('consecutive_correct', 'total_correct', 'total_attempted', 'consecutive_incorrect')
+
+def apply_result(counters, correct, can_demote, threshold):
+    """在 Python 裡套用一次作答 (規則和 UPSERT_PROGRESS_SQL 一樣)，回傳新的計數器"""
+    counters = {field: counters.get(field) or 0 for field in COUNTER_FIELDS}
+    counters['total_attempted'] += 1
+    if correct:
+        counters['total_correct'] += 1
+        counters['consecutive_correct'] += 1
+        counters['consecutive_incorrect'] = 0
+    else:
+        counters['consecutive_correct'] = 0
+        counters['consecutive_incorrect'] += 1
+        if can_demote and counters['consecutive_incorrect'] >= threshold:
+            counters['consecutive_incorrect'] = 0
+    return counters
+
+def fold_results(results, can_demote, threshold):
+    """把同一個 key 依序的對/錯合併成 FOLD_PROGRESS_SQL 的參數"""
+    n = len(results)
+    n_correct = sum(results)
+    trailing_correct = trailing_wrong = 0
+    for correct in reversed(results):
+        if not correct:
+            break
+        trailing_correct += 1
+    for correct in reversed(results):
+        if correct:
+            break
+        trailing_wrong += 1
+    trailing_incorrect = trailing_wrong % threshold if can_demote else trailing_wrong
+    return {'n': n, 'n_correct': n_correct, 'trailing_correct': trailing_correct,
+            'trailing_incorrect': trailing_incorrect, 'can_demote': 1 if can_demote else 0,
+            'threshold': threshold}
+
+def segment_number(path):
+    """批次檔 journal_path.<序號>.flushing 的序號"""
+    return int(path.rsplit('.', 2)[-2])
+
+class ProgressBuffer:
+    def __init__(self, service, journal_path, flush_interval=2.0, max_pending=500,
+                 fsync=False, app_context=None):
+        """
+        service       : ProgressService (技能代號對照、先備技能、降級門檻都沿用它的)
+        journal_path  : journal 檔路徑；寫回中的批次會改名成 journal_path.<序號>.flushing
+                        (progress_checkpoint 用檔名當 key，同一個資料庫的 journal 檔名不要重複)
+        flush_interval: 最多隔幾秒寫回一次
+        max_pending   : 記憶體裡累積幾筆作答就提早寫回
+        fsync         : 每筆都 fsync (連主機斷電都不遺失，但比較慢)；否則只保證 process 掛掉不遺失
+        app_context   : 回傳 context manager 的函式 (背景執行緒要用 app.app_context 才能碰資料庫)
+        """
+        self.service = service
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.app_context = app_context or nullcontext
+        self.journal_key = os.path.basename(journal_path)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._state = {}       # (user_id, skill_id) -> 最新的計數器 (含還沒寫回的作答)
+        self._pending = {}     # (user_id, skill_id) -> {'slug', 'results': [依序的作答 {'correct', 'ts', 'seed', 'latency_ms'}]}
+        self._pending_count = 0
+        self._segments = []    # 內容還沒寫回資料庫的 journal 批次檔
+        self._segment_seq = 0
+        self._counters = {'buffered': 0, 'demotions': 0, 'unknown_skill': 0, 'flushes': 0,
+                          'flushed_results': 0, 'flushed_rows': 0, 'flush_errors': 0, 'recovered': 0, 'last_flush_ms': None}
+        with self.app_context():
+            self._recover_journal()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        threading.Thread(target=self._flusher, name='progress-flusher', daemon=True).start()
+
+    # --- journal ---
+    def _recover_journal(self):
+        """
+        把上次沒寫回的作答 (舊的批次檔 + journal) 讀回記憶體，之後照常寫回。
+        序號不超過 progress_checkpoint 的批次檔已經 commit 過了 (只是來不及刪掉)，直接刪掉不重播。
+        """
+        checkpoint = self.service.session_factory().execute(
+            SELECT_CHECKPOINT_SQL, {'journal': self.journal_key}).scalar() or 0
+        paths = sorted(glob.glob(glob.escape(self.journal_path) + '.*.flushing'), key=segment_number)
+        for path in [path for path in paths if segment_number(path) <= checkpoint]:
+            os.remove(path)
+            paths.remove(path)
+            print(f"略過已經寫回的 journal 批次檔: {os.path.basename(path)}")
+        self._segment_seq = max([checkpoint] + [segment_number(path) for path in paths])
+        if os.path.exists(self.journal_path):
+            paths.append(self._rotate_journal_file())
+        for path in paths:
+            recovered = 0
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries = json.loads(line)
+                        entries = entries if isinstance(entries, list) else [entries]  # 批次批改是一行一整批
+                        keyed = [((entry.pop('user_id'), entry.pop('skill_id')), entry.pop('slug'), entry)
+                                 for entry in entries]
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue  # 寫到一半就當掉的最後一行
+                    for key, slug, entry in keyed:
+                        self._add_pending(key, slug, entry)
+                    recovered += len(keyed)
+            if recovered:
+                self._segments.append(path)
+                self._counters['recovered'] += recovered
+            else:
+                os.remove(path)
+        if self._counters['recovered']:
+            print(f"從 journal 找回 {self._counters['recovered']} 筆還沒寫回的作答")
+            self._wakeup.set()  # 背景執行緒一啟動就先寫回
+
+    def _rotate_journal_file(self):
+        """把目前的 journal 改名成新的批次檔，回傳批次檔路徑"""
+        self._segment_seq += 1
+        segment = f"{self.journal_path}.{self._segment_seq}.flushing"
+        os.replace(self.journal_path, segment)
+        return segment
+
+    def _append_journal(self, key, slug, result):
+        self._write_journal(dict(result, user_id=key[0], skill_id=key[1], slug=slug))
+
+    def _write_journal(self, payload):
+        """寫一行 JSON (一筆作答是 dict，一整批是 list：當掉時只會整行都在或整行不算)"""
+        line = json.dumps(payload, separators=(',', ':'))
+        self._journal.write(line + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _add_pending(self, key, slug, result):
+        entry = self._pending.setdefault(key, {'slug': slug, 'results': []})
+        entry['results'].append(result)
+        self._pending_count += 1
+
+    # --- 作答 ---
+    def _can_demote(self, slug, skill_id):
+        return self.service.can_demote(slug, skill_id)
+
+    def _demotion_target(self, user_id, slug, skill_id):
+        """和 ProgressService 一樣選降級目標；資料庫的精熟度向量要再蓋上還沒寫回的計數器 (只讀，不拿寫入鎖)"""
+        vector = read_mastery(self.service.session_factory(), user_id) if self.service.mastery else None
+        if vector is None:
+            vector = unpack(None)
+        for live_skill_id, counters in self.live_counters(user_id).items():
+            vector = set_entry(vector, live_skill_id, counters['total_attempted'], counters['consecutive_correct'])
+        return self.service.demotion_target(slug, skill_id, vector[:, CONSECUTIVE])
+
+    def _load_state(self, key, slug):
+        """資料庫的計數器，再套用還沒寫回的作答 (從 journal 找回的)"""
+        row = self.service.session_factory().execute(
+            SELECT_PROGRESS_SQL, {'user_id': key[0], 'skill_id': key[1]}).first()
+        state = dict(row._mapping) if row is not None else {}
+        state = {field: state.get(field) or 0 for field in COUNTER_FIELDS}
+        for result in self._pending.get(key, {}).get('results', []):
+            state = apply_result(state, result['correct'], self._can_demote(slug, key[1]), self.service.demotion_threshold)
+        return state
+
+    def record_attempt(self, user_id, slug, is_correct, commit=True, seed=None, latency_ms=None, ts=None):
+        """
+        和 ProgressService.record_attempt 一樣的介面與回傳值，但只寫 journal、不碰資料庫的寫入鎖。
+        commit 參數只是為了介面相容 (延後寫入本來就不會馬上 commit)。
+        """
+        skill_id = self.service.skill_id_for(slug)
+        if skill_id is None:
+            self._count('unknown_skill')
+            return None
+        key = (user_id, skill_id)
+        correct = 1 if is_correct else 0
+        result = {'correct': correct, 'ts': int(ts if ts is not None else time.time()),
+                  'seed': seed, 'latency_ms': latency_ms}
+        can_demote = self._can_demote(slug, skill_id)
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                state = self._load_state(key, slug)
+            state = apply_result(state, correct, can_demote, self.service.demotion_threshold)
+            self._append_journal(key, slug, result)
+            self._add_pending(key, slug, result)
+            self._state[key] = state
+            self._counters['buffered'] += 1
+            pending_count = self._pending_count
+        if pending_count >= self.max_pending:
+            self._wakeup.set()
+        demoted = not is_correct and can_demote and state['consecutive_incorrect'] == 0
+        target = None
+        if demoted:
+            self._count('demotions')
+            target = self._demotion_target(user_id, slug, skill_id)
+        return dict(state, demote_to_skill_id=target)
+
+    def record_attempts(self, user_id, attempts, commit=True):
+        """
+        和 ProgressService.record_attempts 一樣的介面：依照順序套用多次作答，回傳每一筆的結果。
+        整批寫成 journal 的一行，並在同一次持鎖裡放進記憶體，寫回時不會把一份作業拆成兩個交易。
+        """
+        prepared = []
+        for attempt in attempts:
+            skill_id = self.service.skill_id_for(attempt['slug'])
+            if skill_id is None:
+                self._count('unknown_skill')
+                prepared.append(None)
+                continue
+            result = {'correct': 1 if attempt['is_correct'] else 0,
+                      'ts': int(attempt['ts'] if attempt.get('ts') is not None else time.time()),
+                      'seed': attempt.get('seed'), 'latency_ms': attempt.get('latency_ms')}
+            prepared.append(((user_id, skill_id), attempt['slug'], result,
+                             self._can_demote(attempt['slug'], skill_id)))
+        states = []
+        with self._lock:
+            # 先在區域變數裡算好，journal 寫成功之後才放進記憶體
+            batch_state = {}
+            for item in prepared:
+                if item is None:
+                    states.append(None)
+                    continue
+                key, slug, result, can_demote = item
+                state = batch_state.get(key) or self._state.get(key)
+                if state is None:
+                    state = self._load_state(key, slug)
+                state = apply_result(state, result['correct'], can_demote, self.service.demotion_threshold)
+                batch_state[key] = state
+                states.append(state)
+            entries = [item for item in prepared if item is not None]
+            if entries:
+                self._write_journal([dict(result, user_id=key[0], skill_id=key[1], slug=slug)
+                                     for key, slug, result, _ in entries])
+            for key, slug, result, _ in entries:
+                self._add_pending(key, slug, result)
+            self._state.update(batch_state)
+            self._counters['buffered'] += len(entries)
+            pending_count = self._pending_count
+        if pending_count >= self.max_pending:
+            self._wakeup.set()
+        results = []
+        for item, state in zip(prepared, states):
+            if item is None:
+                results.append(None)
+                continue
+            (_, skill_id), slug, result, can_demote = item
+            target = None
+            if not result['correct'] and can_demote and state['consecutive_incorrect'] == 0:
+                self._count('demotions')
+                target = self._demotion_target(user_id, slug, skill_id)
+            results.append(dict(state, demote_to_skill_id=target))
+        return results
+
+    def live_counters(self, user_id):
+        """這個學生還沒寫回 (或剛寫回) 的最新計數器 {skill_id: counters}，讀取進度時用來蓋過資料庫的值"""
+        with self._lock:
+            return {skill_id: dict(state) for (uid, skill_id), state in self._state.items() if uid == user_id}
+
+    # --- 寫回 ---
+    def flush(self):
+        """把累積的作答在一個交易裡寫回資料庫，回傳寫回幾筆作答"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                batch_count, self._pending_count = self._pending_count, 0
+                self._journal.close()
+                self._segments.append(self._rotate_journal_file())
+                segments, self._segments = self._segments, []
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+            start = time.perf_counter()
+            attempts, daily, params = [], {}, []
+            for (user_id, skill_id), entry in batch.items():
+                for result in entry['results']:
+                    attempts.append(dict(result, user_id=user_id, skill_id=skill_id, correct=bool(result['correct'])))
+                    counts = daily.setdefault((user_id, skill_id, activity_day(result['ts'])), {'n': 0, 'n_correct': 0})
+                    counts['n'] += 1
+                    counts['n_correct'] += result['correct']
+                folded = fold_results([result['correct'] for result in entry['results']],
+                                      self._can_demote(entry['slug'], skill_id), self.service.demotion_threshold)
+                params.append(dict(folded, user_id=user_id, skill_id=skill_id))
+            daily_params = [dict(counts, user_id=user_id, skill_id=skill_id, day=day)
+                            for (user_id, skill_id, day), counts in daily.items()]
+            session = self.service.session_factory()
+            try:
+                session.execute(INSERT_ATTEMPT_SQL, attempts)
+                session.execute(UPSERT_DAILY_SQL, daily_params)
+                session.execute(FOLD_PROGRESS_SQL, params)
+                if self.service.mastery:
+                    rebuild_mastery(session, {user_id for user_id, _ in batch})
+                # 批次檔按序號一起寫回，記下最大的序號：commit 之後才當掉的話，重播時就知道要跳過
+                session.execute(SAVE_CHECKPOINT_SQL, {'journal': self.journal_key,
+                                                      'segment': max(segment_number(path) for path in segments)})
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                with self._lock:
+                    # 放回去等下一次；新累積的作答排在後面，順序不變
+                    for key, entry in self._pending.items():
+                        batch.setdefault(key, {'slug': entry['slug'], 'results': []})['results'].extend(entry['results'])
+                    self._pending = batch
+                    self._pending_count += batch_count
+                    self._segments = segments + self._segments
+                    self._counters['flush_errors'] += 1
+                print(f"寫回作答進度失敗 ({batch_count} 筆，稍後重試): {e}")
+                return 0
+
+            for path in segments:
+                os.remove(path)
+            with self._lock:
+                # 資料庫已經是最新的了；沒有新作答的 key 下次直接讀資料庫
+                for key in batch:
+                    if key not in self._pending:
+                        self._state.pop(key, None)
+                self._counters['flushes'] += 1
+                self._counters['flushed_results'] += batch_count
+                self._counters['flushed_rows'] += len(params)
+                self._counters['last_flush_ms'] = (time.perf_counter() - start) * 1000
+            return batch_count
+
+    def _flusher(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self.app_context():
+                    self.flush()
+            except Exception as e:
+                print(f"作答進度寫回執行緒發生錯誤: {e}")
+
+    def close(self):
+        """程式結束前寫回剩下的作答"""
+        with self.app_context():
+            self.flush()
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending_results=self._pending_count, pending_keys=len(self._pending),
+                        live_keys=len(self._state), journal_segments=len(self._segments))
@@ -0,0 +1,180 @@
+import threading
+import time
+from sqlalchemy import text
+from mastery_vector import CONSECUTIVE, read_mastery, update_mastery
+
+# ==============================================================================
+# 學習進度更新 (Progress Service)
+# ==============================================================================
+# 以前每次作答要：查 Skill -> 查 UserProgress -> (可能再查先備技能) -> 在 Python 裡加減 -> commit，
+# 好幾次來回，而且兩個請求同時送出時，後寫入的會蓋掉先寫入的 (lost update)。
+# 這裡改成一條 INSERT ... ON CONFLICT DO UPDATE ... RETURNING：
+#   - 計數器在 SQL 裡加減，同時送出的作答不會互相覆蓋
+#   - 直接回傳更新後的計數器，要不要降級不用再查一次
+#   - 技能代號 -> skill.id 的對照表放在記憶體裡 (Skill.name 就是技能代號)
+# 每次作答也會新增一列 attempt (只新增、不修改)，同一個交易裡順便累加彙總表：
+#   - daily_activity : 每人每技能每天的作答數 / 答對數
+#   - user_progress  : 每人每技能的計數器 (也就是 attempt 的另一個彙總)
+# 要看每天的練習量、答錯哪幾題 (seed 可以重建題目) 都不用掃整張 attempt。
+# SQLite 需要 3.35 以上 (RETURNING)；PostgreSQL 也適用。
+# 有知識圖譜 (graph) 時，降級退回「還沒精熟的先備技能裡最近的那一個」，而不只是 SKILL_ENGINE 寫的直接先備技能。
+
+INSERT_ATTEMPT_SQL = text("""
+    INSERT INTO attempt (user_id, skill_id, ts, correct, seed, latency_ms)
+    VALUES (:user_id, :skill_id, :ts, :correct, :seed, :latency_ms)
+""")
+
+UPSERT_DAILY_SQL = text("""
+    INSERT INTO daily_activity (user_id, skill_id, day, attempted, correct)
+    VALUES (:user_id, :skill_id, :day, :n, :n_correct)
+    ON CONFLICT (user_id, skill_id, day) DO UPDATE SET
+        attempted = daily_activity.attempted + :n,
+        correct = daily_activity.correct + :n_correct
+""")
+
+UPSERT_PROGRESS_SQL = text("""
+    INSERT INTO user_progress (user_id, skill_id, consecutive_correct, total_correct, total_attempted, consecutive_incorrect)
+    VALUES (:user_id, :skill_id, :correct, :correct, 1, 1 - :correct)
+    ON CONFLICT (user_id, skill_id) DO UPDATE SET
+        total_attempted = COALESCE(user_progress.total_attempted, 0) + 1,
+        total_correct = COALESCE(user_progress.total_correct, 0) + :correct,
+        consecutive_correct = CASE WHEN :correct = 1
+                                   THEN COALESCE(user_progress.consecutive_correct, 0) + 1 ELSE 0 END,
+        consecutive_incorrect = CASE WHEN :correct = 1 THEN 0
+                                     WHEN :can_demote = 1
+                                          AND COALESCE(user_progress.consecutive_incorrect, 0) + 1 >= :threshold THEN 0
+                                     ELSE COALESCE(user_progress.consecutive_incorrect, 0) + 1 END
+    RETURNING consecutive_correct, total_correct, total_attempted, consecutive_incorrect
+""")
+
+def activity_day(ts):
+    """作答時間 (unix 秒) -> 'YYYY-MM-DD' (伺服器當地時間，和學生的一天一致)"""
+    return time.strftime('%Y-%m-%d', time.localtime(ts))
+
+class ProgressService:
+    def __init__(self, session_factory, prerequisites, demotion_threshold=3, reload_interval=60, mastery=False,
+                 graph=None, mastered_at=5):
+        """
+        session_factory : 回傳 SQLAlchemy session 的函式 (例如 lambda: db.session)
+        prerequisites   : {技能代號: 先備技能代號 或 None} (沒有知識圖譜、或圖譜裡找不到時用)
+        reload_interval : 遇到對照表裡沒有的技能代號時，最快多久重新讀一次 skill 表 (秒)
+        mastery         : 同時更新 user_mastery 的精熟度向量 (見 mastery_vector.py)
+        graph           : 回傳目前 KnowledgeGraph 的函式 (例如 lambda: curriculum_cache.get().graph)
+        mastered_at     : 連續答對幾題算精熟 (選降級目標時用)
+        """
+        self.session_factory = session_factory
+        self.prerequisites = prerequisites
+        self.demotion_threshold = demotion_threshold
+        self.reload_interval = reload_interval
+        self.mastery = mastery
+        self.graph = graph
+        self.mastered_at = mastered_at
+        self._skill_ids = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'upserts': 0, 'demotions': 0, 'unknown_skill': 0, 'map_loads': 0}
+
+    def _load_skill_ids(self):
+        rows = self.session_factory().execute(text("SELECT id, name FROM skill")).all()
+        with self._lock:
+            self._skill_ids = {name: skill_id for skill_id, name in rows}
+            self._loaded_at = time.monotonic()
+            self._counters['map_loads'] += 1
+
+    def skill_id_for(self, slug):
+        """技能代號 -> skill.id (找不到回傳 None)"""
+        if self._skill_ids is None:
+            self._load_skill_ids()
+        skill_id = self._skill_ids.get(slug)
+        if skill_id is None and time.monotonic() - self._loaded_at > self.reload_interval:
+            self._load_skill_ids()  # 可能是剛匯入的新技能
+            skill_id = self._skill_ids.get(slug)
+        return skill_id
+
+    def invalidate(self):
+        """skill 表被改過 (例如重新匯入課綱) 時呼叫"""
+        with self._lock:
+            self._skill_ids = None
+
+    def _graph(self):
+        return self.graph() if self.graph is not None else None
+
+    def can_demote(self, slug, skill_id):
+        """這個技能答錯太多次時有沒有先備技能可以退回去"""
+        graph = self._graph()
+        return bool(graph is not None and graph.can_demote(skill_id)) or bool(self.prerequisites.get(slug))
+
+    def demotion_target(self, slug, skill_id, scores=None):
+        """
+        降級要退回的技能代號。scores 是以 skill.id 為索引的連續答對數 (例如精熟度向量)，
+        None 時當作都還沒練過 (也就是退回最近的先備技能)。
+        """
+        graph = self._graph()
+        if graph is not None:
+            target = graph.weakest_ancestor(skill_id, scores, self.mastered_at)
+            if target is not None:
+                return graph.name(target)
+        return self.prerequisites.get(slug)
+
+    def record_attempt(self, user_id, slug, is_correct, commit=True, seed=None, latency_ms=None, ts=None):
+        """
+        記錄一次作答，回傳更新後的計數器 dict (含 demote_to_skill_id)；技能不在資料庫裡時回傳 None。
+        commit=False 時由呼叫的人負責 commit (批次批改時整批一次寫入)。
+        seed / latency_ms (從出題到作答的毫秒數) 可以是 None；ts 預設是現在。
+        """
+        skill_id = self.skill_id_for(slug)
+        if skill_id is None:
+            self._count('unknown_skill')
+            return None
+        can_demote = self.can_demote(slug, skill_id)
+        correct = 1 if is_correct else 0
+        ts = int(ts if ts is not None else time.time())
+        session = self.session_factory()
+        session.execute(INSERT_ATTEMPT_SQL, {'user_id': user_id, 'skill_id': skill_id, 'ts': ts,
+                                             'correct': bool(correct), 'seed': seed, 'latency_ms': latency_ms})
+        session.execute(UPSERT_DAILY_SQL, {'user_id': user_id, 'skill_id': skill_id, 'day': activity_day(ts),
+                                           'n': 1, 'n_correct': correct})
+        row = session.execute(UPSERT_PROGRESS_SQL, {
+            'user_id': user_id,
+            'skill_id': skill_id,
+            'correct': correct,
+            'can_demote': 1 if can_demote else 0,
+            'threshold': self.demotion_threshold
+        }).one()
+        if self.mastery:
+            update_mastery(session, user_id, skill_id, row.total_attempted, row.consecutive_correct)
+        # 答錯後連錯次數歸零，代表剛好達到門檻、觸發降級
+        demoted = not is_correct and can_demote and row.consecutive_incorrect == 0
+        target = None
+        if demoted:
+            vector = read_mastery(session, user_id) if self.mastery else None
+            target = self.demotion_target(slug, skill_id, vector[:, CONSECUTIVE] if vector is not None else None)
+        if commit:
+            session.commit()
+        result = dict(row._mapping)
+        result['demote_to_skill_id'] = target
+        self._count('upserts')
+        if demoted:
+            self._count('demotions')
+        return result
+
+    def record_attempts(self, user_id, attempts, commit=True):
+        """
+        依照順序記錄多次作答 (批次批改)，全部在同一個交易裡；回傳和 attempts 一樣順序的 record_attempt 結果。
+        attempts: [{'slug', 'is_correct', 'seed', 'latency_ms', 'ts'}, ...] (後三個可以省略)
+        """
+        results = [self.record_attempt(user_id, attempt['slug'], attempt['is_correct'], commit=False,
+                                       seed=attempt.get('seed'), latency_ms=attempt.get('latency_ms'),
+                                       ts=attempt.get('ts'))
+                   for attempt in attempts]
+        if commit:
+            self.session_factory().commit()
+        return results
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, known_skills=len(self._skill_ids or {}))
@@ -0,0 +1,503 @@
+import random
+import numpy as np
+from param_sampler import ParamSpace
+
+# ==============================================================================
+# 題目生成器 (Question Generators)
+# ==============================================================================
+# 以前放在 app.py 的第 4、5 節：答案驗證、格式化函式、參數空間與單題 / 批次生成器。
+# 獨立成一個模組，benchmark 和測試只要 import 這裡，不用載入整個網站 (資料庫、模型、背景執行緒)。
+# app.py 的 SKILL_ENGINE 從這裡取用生成器；validate_* 用函式名稱存在題目裡，批改時再找回來。
+
+# ==============================================================================
+# 答案驗證與格式化 (Formatting, Checking)
+# ==============================================================================
+
+# --- Validation Functions (Referenced by name) ---
+def validate_remainder(user_answer, correct_answer):
+    # 簡單的字串比較
+    return str(user_answer).strip().lower() == str(correct_answer).strip().lower()
+
+def validate_factor(user_answer, correct_answer):
+    # 判斷 '是' 或 '否'
+    return str(user_answer).strip() == str(correct_answer)
+
+def validate_linear_equation(user_answer, correct_answer):
+    # 判斷 x=... 或 y=...
+    return str(user_answer).strip().lower() == str(correct_answer).strip().lower()
+
+def validate_check_point(user_answer, correct_answer):
+    # 判斷 '是' 或 '否'
+    return str(user_answer).strip() == str(correct_answer)
+
+# --- Formatting Functions ---
+def format_polynomial(coeffs):
+    """將係數列表轉換成漂亮的多項式字串"""
+    terms = []
+    degree = len(coeffs) - 1
+    for i, coeff in enumerate(coeffs):
+        power = degree - i
+        if coeff == 0:
+            continue
+        terms.append(format_polynomial_term(coeff, power, is_first=(i == 0)))
+    if not terms:
+        return "0"
+    return "".join(terms)
+
+def format_polynomial_term(coeff, power, is_first):
+    """將單一項 (係數, 次方) 轉換成字串，例如 " - 3x^2" (係數為 0 時回傳空字串)"""
+    if coeff == 0:
+        return ""
+    term = ""
+    if coeff > 0:
+        if not is_first:
+            term += " + "
+    else:
+        term += " - "
+    abs_coeff = abs(coeff)
+    if abs_coeff != 1 or power == 0:
+        term += str(abs_coeff)
+    if power == 1:
+        term += "x"
+    elif power > 1:
+        term += f"x^{power}"
+    return term
+
+def format_linear_equation_lhs(a, b):
+    """將係數 (a, b) 轉換成 "ax + by" 的漂亮字串"""
+    terms = []
+    if a == 1:
+        terms.append("x")
+    elif a == -1:
+        terms.append("-x")
+    elif a != 0:
+        terms.append(f"{a}x")
+    if b > 0:
+        if a != 0:
+            terms.append(" + ")
+        if b == 1:
+            terms.append("y")
+        else:
+            terms.append(f"{b}y")
+    elif b < 0:
+        if a != 0:
+            terms.append(" - ")
+        else:
+            terms.append("-")
+        if b == -1:
+            terms.append("y")
+        else:
+            terms.append(f"{abs(b)}y")
+    if not terms:
+        return "0"
+    return "".join(terms)
+
+def check_inequality(a, b, c, sign, x, y):
+    """檢查點 (x, y) 是否滿足 ax + by [sign] c"""
+    lhs = (a * x) + (b * y)
+    if sign == '>':
+        return lhs > c
+    if sign == '>=':
+        return lhs >= c
+    if sign == '<':
+        return lhs < c
+    if sign == '<=':
+        return lhs <= c
+    return False
+
+def format_inequality(a, b, c, sign):
+    """將係數 (a, b, c) 和符號轉換成 "ax + by [sign] c" 的字串"""
+    lhs_str = format_linear_equation_lhs(a, b)
+    return f"{lhs_str} {sign} {c}"
+
+def format_constant_term(c):
+    """將常數項轉換成 " + c" / " - |c|" 的字串 (c 為 0 時回傳空字串)"""
+    if c > 0:
+        return f" + {c}"
+    if c < 0:
+        return f" - {abs(c)}"
+    return ""
+
+def format_divisor(k):
+    """將 k 轉換成除式 (x - k) 的字串"""
+    if k == 0:
+        return "(x)"
+    k_sign = "-" if k >= 0 else "+"
+    return f"(x {k_sign} {abs(k)})"
+
+def format_inequality_region(a, b, c, sign):
+    """將係數 (a, b, c) 和符號轉換成 "ax + by + c [sign] 0" 的字串"""
+    return f"{format_linear_equation_lhs(a, b)}{format_constant_term(c)} {sign} 0"
+
+def format_bulk(formatter, *arrays):
+    """整批格式化：只對「不重複的參數組合」呼叫一次 formatter，再用索引展開成整個陣列"""
+    # 題目參數都是小範圍整數，先把多個欄位合成一個整數鍵 (混合進位)，再做一維 unique
+    arrays = [np.asarray(arr).astype(np.int64) for arr in arrays]
+    keys = np.zeros(len(arrays[0]), dtype=np.int64)
+    for arr in arrays:
+        keys = keys * (int(arr.max()) - int(arr.min()) + 1) + (arr - arr.min())
+    unique_keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    formatted = np.empty(len(unique_keys), dtype=object)
+    formatted[:] = [formatter(*(arr[i].item() for arr in arrays)) for i in first_index.tolist()]
+    return formatted[inverse]
+
+# ==============================================================================
+# 單題與批次生成器 (Question Generators)
+# ==============================================================================
+# 所有生成器都接受 rng 參數 (random.Random)，只用它抽亂數，
+# 所以同一個 seed 一定生成同一道題 (見 app.py 的 get_question)。
+# --- 參數空間 (每個生成器的參數範圍與限制條件，只宣告一次) ---
+REMAINDER_SPACES = {
+    2: ParamSpace('remainder-theorem/deg2',
+                  {'a': range(-3, 4), 'b': range(-5, 6), 'c': range(-9, 10), 'k': range(-3, 4)},
+                  lambda a, b, c, k: a != 0),
+    3: ParamSpace('remainder-theorem/deg3',
+                  {'a': range(-2, 3), 'b': range(-3, 4), 'c': range(-5, 6), 'd': range(-9, 10), 'k': range(-3, 4)},
+                  lambda a, b, c, d, k: a != 0),
+}
+
+FACTOR_SPACES = {
+    # is_factor = True 時，常數項由 k 反推，所以不用抽
+    (2, True): ParamSpace('factor-theorem/deg2-factor',
+                          {'a': range(-3, 4), 'b': range(-5, 6), 'k': range(-3, 4)},
+                          lambda a, b, k: a != 0),
+    (2, False): ParamSpace('factor-theorem/deg2-not-factor',
+                           {'a': range(-3, 4), 'b': range(-5, 6), 'c': range(-9, 10), 'k': range(-3, 4)},
+                           lambda a, b, c, k: a != 0 and (a * (k**2)) + (b * k) + c != 0),
+    (3, True): ParamSpace('factor-theorem/deg3-factor',
+                          {'a': range(-2, 3), 'b': range(-3, 4), 'c': range(-5, 6), 'k': range(-3, 4)},
+                          lambda a, b, c, k: a != 0),
+    (3, False): ParamSpace('factor-theorem/deg3-not-factor',
+                           {'a': range(-2, 3), 'b': range(-3, 4), 'c': range(-5, 6), 'd': range(-9, 10), 'k': range(-3, 4)},
+                           lambda a, b, c, d, k: a != 0 and (a * (k**3)) + (b * (k**2)) + (c * k) + d != 0),
+}
+
+SOLUTION_SPACE = ParamSpace('linear-eq/solution',
+                            {'x_sol': range(-5, 6), 'y_sol': range(-5, 6)},
+                            lambda x_sol, y_sol: x_sol != 0 and y_sol != 0)
+
+SUBSTITUTION_SPACES = {
+    # y = mx + k 形式：第二式不能與第一式平行 (a != -m * b)
+    'y': ParamSpace('linear-eq-substitution/y=mx+k',
+                    {'m': range(-3, 4), 'a': range(-3, 4), 'b': range(-3, 4)},
+                    lambda m, a, b: m != 0 and a != 0 and b != 0 and a != -m * b),
+    # x = my + k 形式：第二式不能與第一式平行 (b != -m * a)
+    'x': ParamSpace('linear-eq-substitution/x=my+k',
+                    {'m': range(-3, 4), 'a': range(-3, 4), 'b': range(-3, 4)},
+                    lambda m, a, b: m != 0 and a != 0 and b != 0 and b != -m * a),
+}
+
+ADDITION_SPACE = ParamSpace('linear-eq-addition/coefficients',
+                            {'a1': range(-5, 6), 'b1': range(-5, 6), 'multiplier': (-3, -2, 2, 3), 'a2': range(-5, 6)},
+                            lambda a1, b1, multiplier, a2: a1 != 0 and b1 != 0 and a2 != 0 and a2 != a1 * multiplier)
+
+LINE_COEFF_SPACE = ParamSpace('linear-ineq/line',
+                              {'a': range(-5, 6), 'b': range(-5, 6)},
+                              lambda a, b: not (a == 0 and b == 0))
+
+INEQUALITY_REGION_SPACE = ParamSpace('linear-ineq-region/half-plane',
+                                     {'a': range(-5, 6), 'b': range(-5, 6), 'c': range(-9, 10)},
+                                     lambda a, b, c: not (a == 0 and b == 0) and c != 0)
+
+def generate_remainder_theorem_question(rng=random):
+    """動態生成一道「餘式定理」的題目 (二次式或三次式)"""
+    degree = rng.choice([2, 3])
+    p = REMAINDER_SPACES[degree].sample(rng)
+    k = p['k']
+    if degree == 2:
+        coeffs = [p['a'], p['b'], p['c']]
+    else:
+        coeffs = [p['a'], p['b'], p['c'], p['d']]
+    correct_answer = sum(coeff * (k**power) for power, coeff in enumerate(reversed(coeffs)))
+    poly_text = format_polynomial(coeffs)
+    divisor_text = format_divisor(k)
+    question_text = f"求 f(x) = {poly_text} 除以 {divisor_text} 的餘式。"
+    return {
+        "text": question_text,
+        "answer": str(correct_answer),
+        "validation_function_name": validate_remainder.__name__
+    }
+
+def generate_factor_theorem_question(rng=random):
+    """動態生成一道「因式定理」的題目 (是/否)"""
+    degree = rng.choice([2, 3])
+    is_factor = rng.choice([True, False])
+    p = FACTOR_SPACES[(degree, is_factor)].sample(rng)
+    k = p['k']
+    if degree == 2:
+        a, b = p['a'], p['b']
+        c = -((a * (k**2)) + (b * k)) if is_factor else p['c']
+        coeffs = [a, b, c]
+    else:
+        a, b, c = p['a'], p['b'], p['c']
+        d = -((a * (k**3)) + (b * (k**2)) + (c * k)) if is_factor else p['d']
+        coeffs = [a, b, c, d]
+    poly_text = format_polynomial(coeffs)
+    divisor_text = format_divisor(k)
+    question_text = f"請問 {divisor_text} 是否為 f(x) = {poly_text} 的因式？ (請回答 '是' 或 '否')"
+    correct_answer = "是" if is_factor else "否"
+    return {
+        "text": question_text,
+        "answer": correct_answer,
+        "validation_function_name": validate_factor.__name__
+    }
+
+def generate_substitution_question(rng=random):
+    """動態生成一道「帶入消去法」的題目 (確保唯一解)。"""
+    sol = SOLUTION_SPACE.sample(rng)
+    x_sol, y_sol = sol['x_sol'], sol['y_sol']
+    if rng.choice([True, False]):  # 產生 y = mx + k
+        p = SUBSTITUTION_SPACES['y'].sample(rng)
+        m, a, b = p['m'], p['a'], p['b']
+        k = y_sol - (m * x_sol)
+        eq1_lhs = "y"
+        eq1_rhs = f"{m}x"
+    else:  # 產生 x = my + k
+        p = SUBSTITUTION_SPACES['x'].sample(rng)
+        m, a, b = p['m'], p['a'], p['b']
+        k = x_sol - (m * y_sol)
+        eq1_lhs = "x"
+        eq1_rhs = f"{m}y"
+    eq1_rhs += format_constant_term(k)
+    c = (a * x_sol) + (b * y_sol)
+    eq2_lhs = format_linear_equation_lhs(a, b)
+    eq2_rhs = str(c)
+    ask_for = rng.choice(["x", "y"])
+    answer = str(x_sol) if ask_for == "x" else str(y_sol)
+    question_text = (f"請用帶入消去法解下列聯立方程式：\n"
+                    f"  {eq1_lhs:<15} = {eq1_rhs:<10} ...... (1)\n"
+                    f"  {eq2_lhs:<15} = {eq2_rhs:<10} ...... (2)\n\n"
+                    f"請問 {ask_for} = ?")
+    return {
+        "text": question_text,
+        "answer": answer,
+        "validation_function_name": validate_linear_equation.__name__
+    }
+
+def generate_addition_subtraction_question(rng=random):
+    """動態生成一道「加減消去法」的題目 (加入倍數變化)。"""
+    sol = SOLUTION_SPACE.sample(rng)
+    x_sol, y_sol = sol['x_sol'], sol['y_sol']
+    p = ADDITION_SPACE.sample(rng)
+    a1, b1, a2 = p['a1'], p['b1'], p['a2']
+    b2 = b1 * p['multiplier']
+    c1 = (a1 * x_sol) + (b1 * y_sol)
+    c2 = (a2 * x_sol) + (b2 * y_sol)
+    eq1_lhs = format_linear_equation_lhs(a1, b1)
+    eq2_lhs = format_linear_equation_lhs(a2, b2)
+    ask_for = rng.choice(["x", "y"])
+    answer = str(x_sol) if ask_for == "x" else str(y_sol)
+    question_text = (f"請用加減消去法解下列聯立方程式：\n"
+                    f"  {eq1_lhs:<15} = {c1:<10} ...... (1)\n"
+                    f"  {eq2_lhs:<15} = {c2:<10} ...... (2)\n\n"
+                    f"請問 {ask_for} = ?")
+    return {
+        "text": question_text,
+        "answer": answer,
+        "validation_function_name": validate_linear_equation.__name__
+    }
+
+def generate_check_point_in_system_question(rng=random):
+    """動態生成一道「判斷點是否為不等式系統解」的題目。"""
+    num_inequalities = rng.choice([2, 3])
+    inequalities = []
+    inequality_strs = []
+    for _ in range(num_inequalities):
+        line = LINE_COEFF_SPACE.sample(rng)
+        a, b = line['a'], line['b']
+        temp_x = rng.randint(-3, 3)
+        temp_y = rng.randint(-3, 3)
+        c = (a * temp_x) + (b * temp_y)
+        sign = rng.choice(['>', '>=', '<', '<='])
+        inequalities.append({'a': a, 'b': b, 'c': c, 'sign': sign})
+        inequality_strs.append(format_inequality(a, b, c, sign))
+    test_x = rng.randint(-5, 5)
+    test_y = rng.randint(-5, 5)
+    is_solution = True
+    for ieq in inequalities:
+        if not check_inequality(ieq['a'], ieq['b'], ieq['c'], ieq['sign'], test_x, test_y):
+            is_solution = False
+            break
+    correct_answer = "是" if is_solution else "否"
+    system_str = "\n".join([f"  {s}" for s in inequality_strs])
+    question_text = f"請問點 ({test_x}, {test_y}) 是否為下列不等式系統的解？ (請回答 '是' 或 '否')\n{system_str}"
+    return {
+        "text": question_text,
+        "answer": correct_answer,
+        "validation_function_name": validate_check_point.__name__
+    }
+
+def generate_inequality_region_question(rng=random):
+    """動態生成一道「圖示不等式解區域」的題目。"""
+    p = INEQUALITY_REGION_SPACE.sample(rng)
+    a, b, c = p['a'], p['b'], p['c']
+    sign = rng.choice(['>', '<', '>=', '<='])
+    full_inequality_string = format_inequality_region(a, b, c, sign)
+    question_text = (
+        f"請在下方的「數位計算紙」上，圖示二元一次不等式：\n\n"
+        f"    {full_inequality_string}\n\n"
+        f"畫完後，請點擊「AI 檢查計算」按鈕。"
+    )
+    return {
+        "text": question_text,
+        "answer": None,
+        "validation_function_name": None,
+        "inequality_string": full_inequality_string,
+        "region": {"a": a, "b": b, "c": c, "sign": sign}  # 給本機批改用的正確半平面
+    }
+
+# --- 批次生成 (NumPy 向量化)：一次產生大量題目，給紙本作業與分級測驗使用 ---
+def format_polynomial_bulk(coeff_columns):
+    """format_polynomial 的批次版：coeff_columns 為「每一次方一個係數陣列」的列表"""
+    degree = len(coeff_columns) - 1
+    result = np.full(len(coeff_columns[0]), "", dtype=object)
+    for i, coeffs in enumerate(coeff_columns):
+        result = result + format_bulk(lambda c, i=i: format_polynomial_term(c, degree - i, is_first=(i == 0)), coeffs)
+    result[result == ""] = "0"
+    return result
+
+def pad_bulk(strings, width):
+    """字串陣列靠左補空白 (等同 f"{s:<width}")"""
+    return np.char.ljust(strings.astype(str), width).astype(object)
+
+def build_question_list(texts, answers, validation_function_name, inequality_strings=None):
+    """把批次生成的欄位陣列組回和單題生成器相同格式的 dict 列表"""
+    questions = []
+    for i, text in enumerate(texts.tolist()):
+        question = {
+            "text": text,
+            "answer": answers[i] if answers is not None else None,
+            "validation_function_name": validation_function_name
+        }
+        if inequality_strings is not None:
+            question["inequality_string"] = inequality_strings[i]
+        questions.append(question)
+    return questions
+
+def generate_remainder_theorem_batch(n, rng):
+    """「餘式定理」批次版：f(k) 以 Horner 法對整個陣列一次算完"""
+    degree = rng.choice([2, 3], size=n)
+    texts = np.empty(n, dtype=object)
+    answers = np.zeros(n, dtype=np.int64)
+    for deg, coeff_names in ((2, 'abc'), (3, 'abcd')):
+        idx = np.flatnonzero(degree == deg)
+        if len(idx) == 0:
+            continue
+        p = REMAINDER_SPACES[deg].sample_batch(len(idx), rng)
+        k = p['k']
+        coeffs = [p[name] for name in coeff_names]
+        remainder = np.zeros(len(idx), dtype=np.int64)
+        for coeff in coeffs:
+            remainder = remainder * k + coeff
+        texts[idx] = "求 f(x) = " + format_polynomial_bulk(coeffs) + " 除以 " + format_bulk(format_divisor, k) + " 的餘式。"
+        answers[idx] = remainder
+    return build_question_list(texts, format_bulk(str, answers), validate_remainder.__name__)
+
+def generate_factor_theorem_batch(n, rng):
+    """「因式定理」批次版"""
+    degree = rng.choice([2, 3], size=n)
+    is_factor = rng.integers(0, 2, size=n).astype(bool)
+    texts = np.empty(n, dtype=object)
+    for (deg, factor), space in FACTOR_SPACES.items():
+        idx = np.flatnonzero((degree == deg) & (is_factor == factor))
+        if len(idx) == 0:
+            continue
+        p = space.sample_batch(len(idx), rng)
+        k = p['k']
+        leading = [p[name] for name in 'abc'[:deg]]
+        if factor:
+            partial = np.zeros(len(idx), dtype=np.int64)
+            for coeff in leading:
+                partial = partial * k + coeff
+            constant = -(partial * k)
+        else:
+            constant = p['c'] if deg == 2 else p['d']
+        poly_text = format_polynomial_bulk(leading + [constant])
+        texts[idx] = "請問 " + format_bulk(format_divisor, k) + " 是否為 f(x) = " + poly_text + " 的因式？ (請回答 '是' 或 '否')"
+    answers = np.where(is_factor, "是", "否").tolist()
+    return build_question_list(texts, answers, validate_factor.__name__)
+
+def generate_substitution_batch(n, rng):
+    """「帶入消去法」批次版"""
+    sol = SOLUTION_SPACE.sample_batch(n, rng)
+    x_sol, y_sol = sol['x_sol'], sol['y_sol']
+    solve_for_y = rng.integers(0, 2, size=n).astype(bool)
+    m = np.zeros(n, dtype=np.int64)
+    a = np.zeros(n, dtype=np.int64)
+    b = np.zeros(n, dtype=np.int64)
+    for form, mask in (('y', solve_for_y), ('x', ~solve_for_y)):
+        idx = np.flatnonzero(mask)
+        p = SUBSTITUTION_SPACES[form].sample_batch(len(idx), rng)
+        m[idx], a[idx], b[idx] = p['m'], p['a'], p['b']
+    k = np.where(solve_for_y, y_sol - m * x_sol, x_sol - m * y_sol)
+    eq1_lhs = np.where(solve_for_y, "y", "x").astype(object)
+    eq1_rhs = format_bulk(lambda m, k, is_y: f"{m}{'x' if is_y else 'y'}{format_constant_term(k)}", m, k, solve_for_y)
+    eq2_lhs = format_bulk(format_linear_equation_lhs, a, b)
+    c = a * x_sol + b * y_sol
+    ask_x = rng.integers(0, 2, size=n).astype(bool)
+    texts = ("請用帶入消去法解下列聯立方程式：\n"
+             + "  " + pad_bulk(eq1_lhs, 15) + " = " + pad_bulk(eq1_rhs, 10) + " ...... (1)\n"
+             + "  " + pad_bulk(eq2_lhs, 15) + " = " + pad_bulk(format_bulk(str, c), 10) + " ...... (2)\n\n"
+             + "請問 " + np.where(ask_x, "x", "y").astype(object) + " = ?")
+    answers = format_bulk(str, np.where(ask_x, x_sol, y_sol))
+    return build_question_list(texts, answers, validate_linear_equation.__name__)
+
+def generate_addition_subtraction_batch(n, rng):
+    """「加減消去法」批次版"""
+    sol = SOLUTION_SPACE.sample_batch(n, rng)
+    x_sol, y_sol = sol['x_sol'], sol['y_sol']
+    p = ADDITION_SPACE.sample_batch(n, rng)
+    a1, b1, a2 = p['a1'], p['b1'], p['a2']
+    b2 = b1 * p['multiplier']
+    c1 = a1 * x_sol + b1 * y_sol
+    c2 = a2 * x_sol + b2 * y_sol
+    ask_x = rng.integers(0, 2, size=n).astype(bool)
+    texts = ("請用加減消去法解下列聯立方程式：\n"
+             + "  " + pad_bulk(format_bulk(format_linear_equation_lhs, a1, b1), 15) + " = " + pad_bulk(format_bulk(str, c1), 10) + " ...... (1)\n"
+             + "  " + pad_bulk(format_bulk(format_linear_equation_lhs, a2, b2), 15) + " = " + pad_bulk(format_bulk(str, c2), 10) + " ...... (2)\n\n"
+             + "請問 " + np.where(ask_x, "x", "y").astype(object) + " = ?")
+    answers = format_bulk(str, np.where(ask_x, x_sol, y_sol))
+    return build_question_list(texts, answers, validate_linear_equation.__name__)
+
+CHECK_POINT_SIGNS = ['>', '>=', '<', '<=']
+
+def generate_check_point_in_system_batch(n, rng):
+    """「判斷點是否為不等式系統解」批次版 (固定抽 3 條，只有 2 條的題目忽略第 3 條)"""
+    num_inequalities = rng.choice([2, 3], size=n)
+    test_x = rng.integers(-5, 6, size=n)
+    test_y = rng.integers(-5, 6, size=n)
+    is_solution = np.ones(n, dtype=bool)
+    system_str = np.full(n, "", dtype=object)
+    for j in range(3):
+        active = num_inequalities > j
+        line = LINE_COEFF_SPACE.sample_batch(n, rng)
+        a, b = line['a'], line['b']
+        c = a * rng.integers(-3, 4, size=n) + b * rng.integers(-3, 4, size=n)
+        sign = rng.integers(0, len(CHECK_POINT_SIGNS), size=n)
+        lhs = a * test_x + b * test_y
+        satisfied = np.select([sign == 0, sign == 1, sign == 2, sign == 3], [lhs > c, lhs >= c, lhs < c, lhs <= c], default=False)
+        is_solution &= satisfied | ~active
+        ineq_str = (format_bulk(format_linear_equation_lhs, a, b)
+                    + format_bulk(lambda s: f" {CHECK_POINT_SIGNS[s]} ", sign)
+                    + format_bulk(str, c))
+        line_str = ("\n" if j > 0 else "") + "  " + ineq_str
+        system_str = system_str + np.where(active, line_str, "")
+    point_str = "(" + format_bulk(str, test_x) + ", " + format_bulk(str, test_y) + ")"
+    texts = "請問點 " + point_str + " 是否為下列不等式系統的解？ (請回答 '是' 或 '否')\n" + system_str
+    answers = np.where(is_solution, "是", "否").tolist()
+    return build_question_list(texts, answers, validate_check_point.__name__)
+
+REGION_SIGNS = ['>', '<', '>=', '<=']
+
+def generate_inequality_region_batch(n, rng):
+    """「圖示不等式解區域」批次版"""
+    p = INEQUALITY_REGION_SPACE.sample_batch(n, rng)
+    sign = rng.integers(0, len(REGION_SIGNS), size=n)
+    # 拆成「不重複值很少」的幾段分別格式化再相接，比整條字串一起格式化快得多
+    inequality_strings = (format_bulk(format_linear_equation_lhs, p['a'], p['b'])
+                          + format_bulk(format_constant_term, p['c'])
+                          + format_bulk(lambda s: f" {REGION_SIGNS[s]} 0", sign))
+    texts = ("請在下方的「數位計算紙」上，圖示二元一次不等式：\n\n    "
+             + inequality_strings
+             + "\n\n畫完後，請點擊「AI 檢查計算」按鈕。")
+    return build_question_list(texts, None, None, inequality_strings.tolist())
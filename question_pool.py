@@ -0,0 +1,81 @@
+import threading
+from collections import deque
+
+# ==============================================================================
+# 題目池 (Question Pool)
+# ==============================================================================
+# 每個技能各有一個有上限的環狀緩衝區 (deque)，裡面放著「已經生成好」的 (seed, 題目)。
+# 路由只要從池子裡 popleft() 一題 (O(1))，不必在請求中執行 generator 的重試迴圈。
+# 背景執行緒會在池子低於「低水位」時，把它補到「高水位」(= 容量)。
+# 池子空了就退回原本的做法：直接在請求中生成一題。
+
+class QuestionPool:
+    def __init__(self, skill_ids, make_question, capacity=50, low_watermark=10, refill_interval=1.0):
+        self.make_question = make_question    # make_question(skill_id) -> (seed, question_data)
+        self.capacity = capacity              # 高水位 (每個技能最多預存幾題)
+        self.low_watermark = low_watermark    # 低於這個數量就喚醒補充執行緒
+        self.refill_interval = refill_interval
+        self._pools = {skill_id: deque(maxlen=capacity) for skill_id in skill_ids}
+        self._stats = {skill_id: {'hits': 0, 'misses': 0, 'generated': 0} for skill_id in skill_ids}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """啟動背景補充執行緒 (重複呼叫不會多開)"""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._refill_loop, name='question-pool-refill', daemon=True)
+            self._worker.start()
+        self._wakeup.set()
+
+    def get(self, skill_id):
+        """從池子取出一題 (seed, question_data)；池子是空的就直接生成 (fallback)"""
+        pool = self._pools.get(skill_id)
+        if pool is None:
+            return self.make_question(skill_id)
+        if self._worker is None:
+            self.start()
+        try:
+            question = pool.popleft()
+            self._count(skill_id, 'hits')
+        except IndexError:
+            self._count(skill_id, 'misses')
+            question = self._generate(skill_id)
+        if len(pool) < self.low_watermark:
+            self._wakeup.set()
+        return question
+
+    def stats(self):
+        """回傳每個技能的池子大小與命中/未命中次數"""
+        with self._lock:
+            result = {}
+            for skill_id, counters in self._stats.items():
+                total = counters['hits'] + counters['misses']
+                result[skill_id] = dict(counters,
+                                        size=len(self._pools[skill_id]),
+                                        hit_rate=(counters['hits'] / total) if total else None)
+            return result
+
+    def _count(self, skill_id, key, amount=1):
+        with self._lock:
+            self._stats[skill_id][key] += amount
+
+    def _generate(self, skill_id):
+        question = self.make_question(skill_id)
+        self._count(skill_id, 'generated')
+        return question
+
+    def _refill_loop(self):
+        while True:
+            self._wakeup.wait(self.refill_interval)
+            self._wakeup.clear()
+            for skill_id, pool in self._pools.items():
+                if len(pool) >= self.low_watermark:
+                    continue
+                try:
+                    while len(pool) < self.capacity:
+                        pool.append(self._generate(skill_id))
+                except Exception as e:
+                    print(f"題目池補充 {skill_id} 時出錯: {e}")
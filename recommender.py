@@ -0,0 +1,94 @@
+import numpy as np
+from sqlalchemy import bindparam, text
+
+# ==============================================================================
+# 下一個該練的技能 (Recommender)
+# ==============================================================================
+# 學生 x 技能 的矩陣 (連續答對數 / 總作答數，從 user_progress 一次查出來) 配上知識圖譜 (knowledge_graph.py)，
+# 用 NumPy 一次算完所有學生、所有技能的分數，不用一個技能一個技能去走 ORM 關聯：
+#   - 精熟 (mastered)   : 連續答對數 >= mastered_at
+#   - 前緣 (frontier)   : 還沒精熟、而且所有直接先備技能都精熟了 (沒有先備技能的也算)；
+#                         沒有題目可以練的先備技能 (graph.practicable 是 False) 永遠不會精熟，當作已經通過
+#   - 分數 (只有前緣技能才有) = 練到一半的優先 + 離精熟越近越高 + 能解鎖越多後面的技能越高 - 越深的越後面
+#   - 推薦清單裡可以直接練習的技能一律排在前面，沒有題目的 (只能看課綱) 排在後面
+# 「直接先備技能有幾個沒精熟」用 CSR 的 prereq_indices 取出整批，再用 cumsum 依 prereq_indptr 分段加總，
+# 整個計算是幾個 (學生數 x 邊數) 的陣列運算，一個學生或一整班都只跑一次。
+
+WEIGHT_IN_PROGRESS = 2.0   # 已經開始練 (總作答數 > 0) 的技能
+WEIGHT_PROGRESS = 1.0      # 連續答對數 / mastered_at
+WEIGHT_UNLOCK = 0.5        # log(1 + 以它為先備技能的技能數)
+WEIGHT_DEPTH = 0.1         # 先備鏈越長 (越進階) 扣越多
+
+SELECT_PROGRESS_SQL = text("""
+    SELECT user_id, skill_id, consecutive_correct, total_attempted FROM user_progress WHERE user_id IN :user_ids
+""").bindparams(bindparam('user_ids', expanding=True))
+
+def load_progress_matrix(session, graph, user_ids):
+    """
+    一次查出這些學生的進度，回傳 (consecutive, attempted) 兩個 (學生數 x 技能數) 的 int32 陣列；
+    第 u 列是 user_ids[u]，第 i 欄是 graph.node_ids[i]。
+    """
+    consecutive = np.zeros((len(user_ids), len(graph.node_ids)), dtype=np.int32)
+    attempted = np.zeros_like(consecutive)
+    if not len(user_ids) or not len(graph.node_ids):
+        return consecutive, attempted
+    rows = session.execute(SELECT_PROGRESS_SQL, {'user_ids': list(user_ids)}).all()
+    if rows:
+        data = np.array([tuple(value or 0 for value in row) for row in rows], dtype=np.int64)
+        row_of = {user_id: u for u, user_id in enumerate(user_ids)}
+        users = np.array([row_of[user_id] for user_id in data[:, 0].tolist()], dtype=np.int64)
+        known = np.isin(data[:, 1], graph.node_ids)  # 不在圖裡的技能 (例如剛刪掉的) 略過
+        columns = np.searchsorted(graph.node_ids, data[:, 1])
+        consecutive[users[known], columns[known]] = data[known, 2]
+        attempted[users[known], columns[known]] = data[known, 3]
+    return consecutive, attempted
+
+def overlay_counters(graph, consecutive, attempted, row, counters):
+    """把還沒寫回資料庫的計數器 {skill_id: {...}} 蓋到第 row 列 (延後寫入時用)"""
+    for skill_id, values in counters.items():
+        i = graph.index(skill_id)
+        if i is not None:
+            consecutive[row, i] = values['consecutive_correct']
+            attempted[row, i] = values['total_attempted']
+
+def score_skills(graph, consecutive, attempted, mastered_at):
+    """每個學生每個技能的分數 (學生數 x 技能數)；不在前緣的技能是 -inf"""
+    mastered = consecutive >= mastered_at
+    passable = mastered | ~graph.practicable  # 沒有題目可以練的技能擋不住後面的技能
+    # 每個技能還有幾個直接先備技能沒通過：整批取出再依 CSR 分段加總 (沒有先備技能的段長度是 0)
+    unmet = (~passable[:, graph.prereq_indices]).astype(np.int32)
+    unmet_cumsum = np.zeros((len(consecutive), len(graph.prereq_indices) + 1), dtype=np.int32)
+    np.cumsum(unmet, axis=1, out=unmet_cumsum[:, 1:])
+    unmet_count = unmet_cumsum[:, graph.prereq_indptr[1:]] - unmet_cumsum[:, graph.prereq_indptr[:-1]]
+    frontier = ~mastered & (unmet_count == 0)
+
+    max_depth = max(int(graph.depth.max()), 1) if len(graph.depth) else 1
+    static = WEIGHT_UNLOCK * np.log1p(graph.descendant_count) - WEIGHT_DEPTH * graph.depth / max_depth
+    scores = (WEIGHT_IN_PROGRESS * (attempted > 0) +
+              WEIGHT_PROGRESS * np.minimum(consecutive / mastered_at, 1.0) + static)
+    return np.where(frontier, scores, -np.inf)
+
+def top_skills(scores, limit):
+    """每一列分數最高的 limit 個 (由高到低)：回傳 (indices, scores)，不夠 limit 個的部分分數是 -inf"""
+    limit = min(limit, scores.shape[1])
+    if limit <= 0:
+        return np.zeros((len(scores), 0), dtype=np.int64), np.zeros((len(scores), 0))
+    candidates = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+def recommend(graph, consecutive, attempted, mastered_at, limit=5):
+    """
+    回傳每個學生的推薦清單 [[(skill.id, 分數), ...], ...]，順序和矩陣的列一樣。
+    可以直接練習的技能排在前面；前緣技能不到 limit 個時清單會比較短 (全部精熟就是空的)。
+    """
+    scores = score_skills(graph, consecutive, attempted, mastered_at)
+    # 排序時可以練習的技能加上比所有分數差距都大的常數，回傳的還是原本的分數
+    finite = np.isfinite(scores)
+    span = float(np.ptp(scores[finite])) + 1.0 if finite.any() else 0.0
+    indices, _ = top_skills(np.where(graph.practicable, scores + span, scores), limit)
+    scores = np.take_along_axis(scores, indices, axis=1)
+    skill_ids = graph.node_ids[indices]
+    return [[(int(skill_id), float(score)) for skill_id, score in zip(id_row, score_row) if np.isfinite(score)]
+            for id_row, score_row in zip(skill_ids, scores)]
@@ -0,0 +1,180 @@
+import math
+import time
+import numpy as np
+
+# ==============================================================================
+# 不等式解區域的本機批改 (Local Region Grader)
+# ==============================================================================
+# 「圖示二元一次不等式」這種題目，我們已經知道正確答案是半平面 ax + by + c [sign] 0。
+# 前端在畫布上畫好座標格線 (已知原點位置與每單位幾 px)，學生在上面畫直線和陰影。
+# 這裡直接用 NumPy 在同一個座標格上比對學生的筆跡：
+#   1. 直線位置 : 沿著正確的邊界線取樣，看兩側 tol 範圍內有沒有筆跡 (學生畫到的那一段的覆蓋率)
+#   2. 實線/虛線: 沿線的筆跡有沒有規律的空隙 (> 和 < 要畫虛線，>= 和 <= 要畫實線)
+#   3. 陰影方向 : 比較線兩側離線較遠處的筆跡密度
+# 每一項都給一個信心分數；信心不足時由呼叫端改交給視覺模型批改。
+
+REGION_CORRECT_REPLY = "CORRECT: 畫得很好！解區域完全正確。"
+
+REGION_FEEDBACK = {
+    'line': "邊界直線的位置：可以先找出直線和 x 軸、y 軸的交點，再把兩點連起來。",
+    'shading': "陰影的方向：陰影畫到另一側了。可以把原點 (0, 0) 代入不等式，檢查原點那一側是不是解。",
+    'no_shading': "解區域：還沒有用陰影標示出解區域。",
+    'dashed': "邊界線的畫法：不等式沒有等號 (> 或 <)，邊界線上的點不是解，要畫成虛線。",
+    'solid': "邊界線的畫法：不等式有等號 (>= 或 <=)，邊界線上的點也是解，要畫成實線。"
+}
+
+MIN_LINE_UNITS = 2.0  # 沿邊界線至少畫了幾個單位長，才有把握說直線位置正確
+LINE_FAIL_MAX_CONFIDENCE = 0.5  # 「直線畫錯」只靠覆蓋率判斷，信心上限要低於呼叫端的門檻
+
+def _clip(value):
+    return float(min(1.0, max(0.0, value)))
+
+def _clip_line_to_box(a, b, c, limit):
+    """ax + by + c = 0 與正方形 [-limit, limit]^2 的交線段兩端點；沒有交點回傳 None"""
+    points = []
+    if b != 0:
+        for x in (-limit, limit):
+            y = -(a * x + c) / b
+            if -limit <= y <= limit:
+                points.append((x, y))
+    if a != 0:
+        for y in (-limit, limit):
+            x = -(b * y + c) / a
+            if -limit <= x <= limit:
+                points.append((x, y))
+    if len(points) < 2:
+        return None
+    # 取距離最遠的兩點 (線剛好經過角落時會有重複點)
+    best = max(((p, q) for p in points for q in points), key=lambda pq: math.dist(*pq))
+    return best if math.dist(*best) > 0 else None
+
+def _ink_mask(gray, grid, ink_threshold):
+    """裁出座標格範圍並轉成筆跡遮罩，再用 max-pooling 縮小到每單位約 8 px"""
+    arr = np.asarray(gray)
+    unit = float(grid['unit'])
+    limit = float(grid['range'])
+    x0 = max(0, int(grid['origin_x'] - limit * unit))
+    y0 = max(0, int(grid['origin_y'] - limit * unit))
+    x1 = min(arr.shape[1], int(math.ceil(grid['origin_x'] + limit * unit)))
+    y1 = min(arr.shape[0], int(math.ceil(grid['origin_y'] + limit * unit)))
+    if x1 - x0 < 8 or y1 - y0 < 8:
+        return None, None
+    factor = max(1, int(unit // 8))
+    height = (y1 - y0) // factor
+    width = (x1 - x0) // factor
+    ink = arr[y0:y0 + height * factor, x0:x0 + width * factor] < ink_threshold
+    ink = ink.reshape(height, factor, width, factor).any(axis=(1, 3))
+    # 池化後的像素 -> 數學座標 的換算
+    frame = {
+        'scale': factor / unit,
+        'x_offset': (x0 - grid['origin_x']) / unit,
+        'y_offset': (grid['origin_y'] - y0) / unit,
+        'unit': unit / factor
+    }
+    return ink, frame
+
+def grade_region_drawing(gray, grid, a, b, c, sign, ink_threshold=170, line_tolerance=0.4, min_density=0.01):
+    """
+    gray: 灰階 PIL 圖片 (未裁切，座標和前端畫布一致)
+    grid: {'origin_x', 'origin_y', 'unit', 'range'} (單位: 圖片 px；range 是座標軸的最大刻度)
+    回傳 {'verdict': 'correct'/'incorrect'/None, 'confidence', 'reply', 'checks', 'elapsed_ms'}
+    """
+    start = time.perf_counter()
+    result = {'verdict': None, 'confidence': 0.0, 'reply': None, 'checks': {}}
+    ink, frame = _ink_mask(gray, grid, ink_threshold)
+    segment = _clip_line_to_box(a, b, c, float(grid['range']))
+    if ink is None or segment is None or not ink.any():
+        result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        return result
+
+    height, width = ink.shape
+    unit = frame['unit']
+    norm = math.hypot(a, b)
+    tol = max(1.5, line_tolerance * unit)
+
+    # --- 1. 沿著正確的邊界線取樣 (每 1 px 一點)，看垂直方向 ±tol 內有沒有筆跡 ---
+    (xa, ya), (xb, yb) = segment
+    to_px = lambda x, y: ((x - frame['x_offset']) / frame['scale'] - 0.5,
+                          (frame['y_offset'] - y) / frame['scale'] - 0.5)
+    (ca, ra), (cb, rb) = to_px(xa, ya), to_px(xb, yb)
+    n_samples = max(2, int(math.hypot(cb - ca, rb - ra)))
+    t = np.linspace(0.0, 1.0, n_samples)
+    cols = ca + (cb - ca) * t
+    rows = ra + (rb - ra) * t
+    normal_col, normal_row = a / norm, -b / norm  # 畫布的 y 軸朝下
+    offsets = np.arange(-math.ceil(tol), math.ceil(tol) + 1)
+    sample_cols = np.rint(cols[:, None] + offsets[None, :] * normal_col).astype(int).clip(0, width - 1)
+    sample_rows = np.rint(rows[:, None] + offsets[None, :] * normal_row).astype(int).clip(0, height - 1)
+    covered = ink[sample_rows, sample_cols].any(axis=1)
+    # 只在學生實際畫到的那一段 (第一個到最後一個有筆跡的取樣點) 計算覆蓋率，
+    # 短但位置正確的線不會因為沒畫滿整個座標格而被判錯；畫得太短則無法確認直線位置。
+    # 虛線的空隙 (短於 1 單位) 算在線上，實線和虛線的覆蓋率才能用同一個標準
+    covered_index = np.flatnonzero(covered)
+    if len(covered_index):
+        first, last = covered_index[[0, -1]]
+        gaps = np.diff(covered_index) - 1
+        coverage = float((len(covered_index) + gaps[gaps <= unit].sum()) / (last - first + 1))
+        drawn_units = float((last - first) * math.hypot(cb - ca, rb - ra) / (n_samples - 1) / unit)
+    else:
+        first = last = 0
+        coverage, drawn_units = 0.0, 0.0
+    line_pass = _clip((coverage - 0.5) / 0.3) * _clip(drawn_units / MIN_LINE_UNITS)
+    # 覆蓋率低也可能只是陰影剛好經過邊界線，單憑這點不夠當作確定的錯誤，信心壓在門檻以下交給視覺模型
+    line_fail = min(LINE_FAIL_MAX_CONFIDENCE, _clip((0.5 - coverage) / 0.3))
+    checks = {'line': {'coverage': coverage, 'drawn_units': drawn_units, 'pass': line_pass, 'fail': line_fail}}
+
+    # --- 2. 實線 / 虛線：只看學生實際畫到的那一段，計算空隙比例和線段數 ---
+    if covered.any():
+        drawn = covered[first:last + 1]
+        gap_fraction = float(1.0 - drawn.mean())
+        runs = int(np.count_nonzero(np.diff(drawn.astype(np.int8)) == 1) + 1)
+    else:
+        gap_fraction, runs = 1.0, 0
+    dashed_score = _clip((gap_fraction - 0.1) / 0.15) if runs >= 3 else 0.0
+    solid_score = _clip((0.2 - gap_fraction) / 0.12)
+    expect_dashed = sign in ('>', '<')
+    checks['dash'] = {'gap_fraction': gap_fraction, 'runs': runs, 'expect_dashed': expect_dashed,
+                      'pass': dashed_score if expect_dashed else solid_score,
+                      'fail': solid_score if expect_dashed else dashed_score}
+
+    # --- 3. 陰影方向：離線 tol 以外的兩側，比較筆跡密度 ---
+    xs = frame['x_offset'] + (np.arange(width) + 0.5) * frame['scale']
+    ys = frame['y_offset'] - (np.arange(height) + 0.5) * frame['scale']
+    values = a * xs[None, :] + b * ys[:, None] + c
+    far = np.abs(values) / norm * unit > tol + 1
+    positive = values > 0
+    correct_side = far & (positive if sign in ('>', '>=') else ~positive)
+    wrong_side = far & ~(positive if sign in ('>', '>=') else ~positive)
+    density_correct = float(ink[correct_side].mean()) if correct_side.any() else 0.0
+    density_wrong = float(ink[wrong_side].mean()) if wrong_side.any() else 0.0
+    if max(density_correct, density_wrong) < min_density:
+        shading = {'pass': 0.0, 'fail': 0.9, 'reason': 'no_shading'}
+    else:
+        ratio = math.log((density_correct + 1e-4) / (density_wrong + 1e-4)) / math.log(4)
+        shading = {'pass': _clip(ratio), 'fail': _clip(-ratio), 'reason': 'shading'}
+    shading.update(density_correct=density_correct, density_wrong=density_wrong)
+    checks['shading'] = shading
+
+    # --- 4. 綜合判斷 ---
+    failed = [(name, check['fail']) for name, check in checks.items() if check['fail'] > check['pass']]
+    if line_fail > line_pass:
+        failed = [('line', line_fail)]  # 直線畫錯時，虛實線與陰影的判斷都沒有意義
+    if failed:
+        feedback = []
+        for name, _ in failed:
+            if name == 'dash':
+                feedback.append(REGION_FEEDBACK['dashed' if expect_dashed else 'solid'])
+            elif name == 'shading':
+                feedback.append(REGION_FEEDBACK[shading['reason']])
+            else:
+                feedback.append(REGION_FEEDBACK[name])
+        result['verdict'] = 'incorrect'
+        result['confidence'] = max(conf for _, conf in failed)
+        result['reply'] = "INCORRECT: 錯誤的地方在" + feedback[0] + "".join(f"\n{line}" for line in feedback[1:])
+    else:
+        result['verdict'] = 'correct'
+        result['confidence'] = min(check['pass'] for check in checks.values())
+        result['reply'] = REGION_CORRECT_REPLY
+    result['checks'] = checks
+    result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    return result
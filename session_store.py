@@ -0,0 +1,124 @@
+import json
+import os
+import secrets
+import threading
+import time
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from kv_store import LRUStore, SQLiteStore
+
+# ==============================================================================
+# 伺服器端 Session (Server-side Session)
+# ==============================================================================
+# Flask 預設把整個 session 放在簽章過的 cookie 裡，每次請求都要序列化、算 HMAC、再傳回來。
+# 這裡改成 cookie 只放一個隨機的 session id，內容存在伺服器上：
+#   'memory' : 只有記憶體 LRU (單一 process)
+#   'sqlite' : 記憶體 LRU + SQLite 共用層 (多個 worker process 可以共用)
+#   'cookie' : 維持 Flask 預設的 cookie session
+#
+# cookie 的內容是 "<session id>.<版本號>"，每次 session 被修改版本號就 +1。
+# 記憶體層以 session id 當 key，值是 (版本號, 內容)：別的 worker 改過 session 後，
+# 這個 worker 快取的版本號對不上 cookie，會改從 SQLite 讀最新的內容，不會讀到過期資料；
+# 每個 session 在記憶體裡只佔一格，存新版本時就蓋掉舊版本。
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, version=0, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.version = version
+        self.new = new
+        self.modified = False
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, memory, disk=None, lifetime_seconds=86400, sweep_interval=300):
+        self.memory = memory
+        self.disk = disk
+        self.lifetime_seconds = lifetime_seconds
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+        self._metrics = {'requests': 0, 'cookie_bytes': 0, 'payload_bytes': 0, 'writes': 0, 'swept': 0}
+
+    def open_session(self, app, request):
+        cookie_value = request.cookies.get(self.get_cookie_name(app), '')
+        self._record(requests=1, cookie_bytes=len(request.headers.get('Cookie', '')))
+        sid, _, version = cookie_value.partition('.')
+        if sid and version.isdigit():
+            cached = self.memory.get(sid)
+            payload = cached[1] if cached is not None and cached[0] == int(version) else None
+            if payload is None and self.disk is not None:
+                payload = self.disk.get(sid)
+            if payload is not None:
+                self._record(payload_bytes=len(payload))
+                return ServerSideSession(json.loads(payload), sid=sid, version=int(version))
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.memory.delete(session.sid)
+                if self.disk is not None:
+                    self.disk.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.modified or session.new:
+            session.version += 1
+            payload = json.dumps(dict(session), ensure_ascii=False)
+            self.memory.set(session.sid, (session.version, payload))
+            if self.disk is not None:
+                self.disk.set(session.sid, payload, self.lifetime_seconds)
+            self._record(writes=1)
+            response.set_cookie(name, f"{session.sid}.{session.version}",
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            swept = self.memory.sweep()
+            if self.disk is not None:
+                swept += self.disk.sweep()
+            self._record(swept=swept)
+        except Exception as e:
+            print(f"清理過期 session 時出錯: {e}")
+
+    def _record(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self._metrics[key] += amount
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        requests = metrics['requests']
+        metrics['cookie_bytes_per_request'] = (metrics['cookie_bytes'] / requests) if requests else None
+        metrics['payload_bytes_per_request'] = (metrics['payload_bytes'] / requests) if requests else None
+        metrics['memory'] = self.memory.stats()
+        if self.disk is not None:
+            metrics['disk'] = self.disk.stats()
+        return metrics
+
+def create_session_interface(backend, instance_path, lifetime_seconds, memory_size=10000):
+    """依 backend 名稱建立 session interface；'cookie' 回傳 None (沿用 Flask 預設)"""
+    if backend == 'cookie':
+        return None
+    memory = LRUStore(maxsize=memory_size, ttl=lifetime_seconds)
+    if backend == 'memory':
+        return ServerSideSessionInterface(memory, lifetime_seconds=lifetime_seconds)
+    if backend == 'sqlite':
+        disk = SQLiteStore(os.path.join(instance_path, 'sessions.db'), table='sessions')
+        return ServerSideSessionInterface(memory, disk, lifetime_seconds=lifetime_seconds)
+    raise ValueError(f"未知的 SESSION_BACKEND: {backend}")
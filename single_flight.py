@@ -0,0 +1,73 @@
+import threading
+
+# ==============================================================================
+# 相同請求合併 (Single Flight)
+# ==============================================================================
+# 老師投影一題、全班一起按「AI 助教」時，會有幾十個一模一樣的請求同時送出。
+# 同一個 key 同時間只讓第一個請求 (leader) 真的去呼叫模型，
+# 其他請求 (follower) 等 leader 完成後直接拿同一個結果 (或同一個例外)。
+# 只在同一個 process 的執行緒之間合併；完成後就移除，之後的請求交給快取處理。
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+    def wait(self, timeout=None):
+        """follower 等 leader 的結果；逾時丟出 TimeoutError，leader 失敗時丟出同一個例外"""
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"等待相同的請求超過 {timeout} 秒")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'collapsed': 0, 'errors': 0}
+
+    def begin(self, key):
+        """加入 key 的呼叫，回傳 (flight, 是否為 leader)；leader 之後一定要呼叫 finish()"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self._counters['collapsed'] += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self._counters['leaders'] += 1
+            return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        """leader 回報結果，叫醒所有 follower"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if error is not None:
+                self._counters['errors'] += 1
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    def do(self, key, fn, timeout=None):
+        """同一個 key 同時只執行一次 fn()，其他呼叫等待並共用結果"""
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait(timeout)
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result=result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters, in_flight=len(self._flights))
+        total = counters['leaders'] + counters['collapsed']
+        counters['collapse_rate'] = (counters['collapsed'] / total) if total else None
+        return counters
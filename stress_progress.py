@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from progress_service import ProgressService
+
+# ==============================================================================
+# 同一個學生同時送出很多次作答時，UserProgress 的計數器會不會少算
+# 比較「舊的 讀取 -> Python 裡加一 -> 寫回」與 ProgressService 的單一 upsert
+# 執行方式: python stress_progress.py
+# ==============================================================================
+
+THREADS = 16
+ATTEMPTS_PER_THREAD = 50
+USER_ID = 1
+SKILL_SLUG = 'remainder-theorem'
+
+SCHEMA = [
+    "CREATE TABLE skill (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL UNIQUE)",
+    """CREATE TABLE user_progress (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, skill_id INTEGER NOT NULL,
+        consecutive_correct INTEGER DEFAULT 0, consecutive_incorrect INTEGER DEFAULT 0,
+        total_correct INTEGER DEFAULT 0, total_attempted INTEGER DEFAULT 0,
+        UNIQUE (user_id, skill_id))""",
+    """CREATE TABLE attempt (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, skill_id INTEGER NOT NULL, ts INTEGER NOT NULL,
+        correct BOOLEAN NOT NULL, seed INTEGER, latency_ms INTEGER)""",
+    """CREATE TABLE daily_activity (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, skill_id INTEGER NOT NULL, day VARCHAR(10) NOT NULL,
+        attempted INTEGER NOT NULL DEFAULT 0, correct INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (user_id, skill_id, day))"""
+]
+
+def make_session_factory(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args={'timeout': 30})
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO skill (id, name) VALUES (1, :name)"), {'name': SKILL_SLUG})
+    return engine, scoped_session(sessionmaker(bind=engine))
+
+def read_modify_write(session_factory, is_correct):
+    """ 舊的寫法：先讀出整列，在 Python 裡改完再寫回 """
+    session = session_factory()
+    row = session.execute(text("SELECT id, total_attempted, total_correct FROM user_progress "
+                               "WHERE user_id = :user_id AND skill_id = 1"), {'user_id': USER_ID}).first()
+    if row is None:
+        session.execute(text("INSERT OR IGNORE INTO user_progress (user_id, skill_id) VALUES (:user_id, 1)"),
+                        {'user_id': USER_ID})
+        session.commit()
+        row = session.execute(text("SELECT id, total_attempted, total_correct FROM user_progress "
+                                   "WHERE user_id = :user_id AND skill_id = 1"), {'user_id': USER_ID}).first()
+    time.sleep(0)  # 讓其他執行緒有機會插進來 (真實情況是網路 / 其他查詢的延遲)
+    session.execute(text("UPDATE user_progress SET total_attempted = :attempted, total_correct = :correct "
+                         "WHERE id = :id"),
+                    {'attempted': row.total_attempted + 1, 'correct': row.total_correct + (1 if is_correct else 0),
+                     'id': row.id})
+    session.commit()
+
+def run(name, attempt):
+    path = os.path.join(tempfile.mkdtemp(), 'stress.db')
+    engine, session_factory = make_session_factory(path)
+    service = ProgressService(session_factory, {SKILL_SLUG: None})
+    errors = []
+
+    def worker(index):
+        try:
+            for i in range(ATTEMPTS_PER_THREAD):
+                attempt(service, session_factory, (index + i) % 2 == 0)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session_factory.remove()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        attempted, correct = conn.execute(text("SELECT total_attempted, total_correct FROM user_progress")).one()
+    engine.dispose()
+    expected = THREADS * ATTEMPTS_PER_THREAD
+    print(f"{name:<20}{expected:>8}{attempted:>8}{expected - attempted:>8}{correct:>8}{elapsed:>10.2f}{len(errors):>8}")
+    return attempted == expected and not errors
+
+if __name__ == "__main__":
+    print(f"{THREADS} 個執行緒 x 每個 {ATTEMPTS_PER_THREAD} 次作答 (同一個學生、同一個技能)")
+    print(f"{'寫法':<20}{'應有':>8}{'實際':>8}{'少算':>8}{'答對':>8}{'秒':>10}{'錯誤':>8}")
+    run("讀取-修改-寫回", lambda service, factory, ok: read_modify_write(factory, ok))
+    passed = run("單一 upsert", lambda service, factory, ok: service.record_attempt(USER_ID, SKILL_SLUG, ok))
+    print("upsert 沒有少算任何一次作答" if passed else "upsert 的結果不正確！")
+    raise SystemExit(0 if passed else 1)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from PIL import Image, ImageColor, ImageDraw
+from kv_store import LRUStore, SQLiteStore, TieredStore
+
+# ==============================================================================
+# 手寫筆跡的向量格式 (Stroke Store)
+# ==============================================================================
+# 前端本來就知道每一筆是怎麼畫的，不需要把整張 HiDPI PNG 傳上來。
+# 上傳格式 (座標單位是 CSS px，整數)：
+#   {"v": 1, "width": 畫布寬, "height": 畫布高,
+#    "grid": {"origin_x", "origin_y", "unit", "range"} (畫圖題才有),
+#    "strokes": [{"c": "#000000", "w": 筆寬, "e": 0/1 (橡皮擦), "p": [x0, y0, dx1, dy1, dx2, dy2, ...]}]}
+# 點座標用差值編碼 (第一點是絕對座標，之後都是和前一點的差)，一般的計算過程只有幾 KB。
+# 伺服器以內容雜湊當 id 存下來，真的需要像素時 (視覺模型、本機批改、老師檢視) 才轉成圖片，
+# 轉好的圖片放在記憶體 LRU 裡，key = (雜湊, 倍率)。倍率只允許 RASTER_SCALES 裡的幾個值，
+# 圖片的像素數不超過 max_pixels，快取用總位元組數設上限，?scale= 再怎麼變化也不會塞爆記憶體。
+
+STROKE_FORMAT_VERSION = 1
+MAX_CANVAS_SIZE = 4000     # 畫布長寬上限 (CSS px)
+MAX_STROKES = 2000
+MAX_POINTS = 50000         # 所有筆畫的點數總和上限
+MAX_PEN_WIDTH = 64
+RASTER_SCALES = (0.5, 1.0, 2.0, 4.0)  # 允許的轉圖倍率 (要求的倍率往下取到其中一個)
+RASTER_CACHE_BYTES = 64 * 1024 * 1024
+
+GRID_LINE_SHADE = 225      # 座標格線的灰階 (和前端一樣淺，批改時不會被當成筆跡)
+GRID_AXIS_SHADE = 192
+
+class StrokeFormatError(ValueError):
+    """筆跡資料格式錯誤或超過上限"""
+
+def parse_strokes(payload):
+    """檢查並正規化上傳的筆跡資料，回傳新的 dict (格式錯誤丟出 StrokeFormatError)"""
+    if not isinstance(payload, dict) or payload.get('v') != STROKE_FORMAT_VERSION:
+        raise StrokeFormatError("不支援的筆跡格式版本")
+    try:
+        width, height = int(payload['width']), int(payload['height'])
+        strokes = payload['strokes']
+    except (KeyError, TypeError, ValueError):
+        raise StrokeFormatError("缺少畫布尺寸或筆畫資料")
+    if not (0 < width <= MAX_CANVAS_SIZE and 0 < height <= MAX_CANVAS_SIZE):
+        raise StrokeFormatError(f"畫布尺寸不合理: {width}x{height}")
+    if not isinstance(strokes, list) or len(strokes) > MAX_STROKES:
+        raise StrokeFormatError("筆畫數量不合理")
+
+    normalized = []
+    total_points = 0
+    for stroke in strokes:
+        try:
+            points = [int(v) for v in stroke['p']]
+            pen_width = float(stroke.get('w', 1))
+            color = str(stroke.get('c', '#000000'))
+            ImageColor.getrgb(color)
+        except (KeyError, TypeError, ValueError):
+            raise StrokeFormatError("筆畫資料格式錯誤")
+        if len(points) < 2 or len(points) % 2 or not (0 < pen_width <= MAX_PEN_WIDTH):
+            raise StrokeFormatError("筆畫資料格式錯誤")
+        total_points += len(points) // 2
+        if total_points > MAX_POINTS:
+            raise StrokeFormatError("筆跡點數太多")
+        normalized.append({'c': color, 'w': pen_width, 'e': 1 if stroke.get('e') else 0, 'p': points})
+
+    result = {'v': STROKE_FORMAT_VERSION, 'width': width, 'height': height, 'strokes': normalized}
+    grid = payload.get('grid')
+    if grid:
+        try:
+            result['grid'] = {key: float(grid[key]) for key in ('origin_x', 'origin_y', 'unit', 'range')}
+        except (KeyError, TypeError, ValueError):
+            raise StrokeFormatError("座標格資料格式錯誤")
+    return result
+
+def stroke_hash(strokes):
+    """正規化後筆跡的內容雜湊 (同樣的筆跡一定得到同樣的 id)"""
+    canonical = json.dumps(strokes, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+def decode_points(deltas, scale=1.0):
+    """差值編碼 [x0, y0, dx1, dy1, ...] -> [(x, y), ...] (乘上倍率)"""
+    points = []
+    x = y = 0
+    for i in range(0, len(deltas), 2):
+        x += deltas[i]
+        y += deltas[i + 1]
+        points.append((x * scale, y * scale))
+    return points
+
+def draw_grid(draw, grid, scale):
+    """畫上和前端一樣的淺灰色座標格 (給視覺模型看座標用)"""
+    origin_x, origin_y = grid['origin_x'] * scale, grid['origin_y'] * scale
+    unit = grid['unit'] * scale
+    limit = int(grid['range'])
+    half = limit * unit
+    for k in range(-limit, limit + 1):
+        draw.line([(origin_x + k * unit, origin_y - half), (origin_x + k * unit, origin_y + half)], fill=GRID_LINE_SHADE)
+        draw.line([(origin_x - half, origin_y + k * unit), (origin_x + half, origin_y + k * unit)], fill=GRID_LINE_SHADE)
+    axis_width = max(1, round(scale))
+    draw.line([(origin_x - half, origin_y), (origin_x + half, origin_y)], fill=GRID_AXIS_SHADE, width=axis_width)
+    draw.line([(origin_x, origin_y - half), (origin_x, origin_y + half)], fill=GRID_AXIS_SHADE, width=axis_width)
+
+def quantize_scale(scale):
+    """RASTER_SCALES 裡不超過 scale 的最大值 (至少是最小的那個；NaN 也當作最小的)"""
+    return max([value for value in RASTER_SCALES if value <= scale], default=RASTER_SCALES[0])
+
+def raster_scale(strokes, scale, max_pixels=None):
+    """
+    實際使用的倍率：先用 quantize_scale 取到允許的倍率，圖片超過 max_pixels 就再往下降一級；
+    連最小的倍率都太大時，改用剛好等於 max_pixels 的倍率。
+    """
+    area = strokes['width'] * strokes['height']
+    for value in reversed([value for value in RASTER_SCALES if value <= quantize_scale(scale)]):
+        if max_pixels is None or area * value * value <= max_pixels:
+            return value
+    return math.sqrt(max_pixels / area)
+
+def rasterize(strokes, scale=1.0):
+    """把筆跡畫成灰階圖片 (白底)；scale 是每個 CSS px 對應幾個圖片 px"""
+    image = Image.new('L', (max(1, round(strokes['width'] * scale)), max(1, round(strokes['height'] * scale))), 255)
+    draw = ImageDraw.Draw(image)
+    if strokes.get('grid'):
+        draw_grid(draw, strokes['grid'], scale)
+    for stroke in strokes['strokes']:
+        points = decode_points(stroke['p'], scale)
+        shade = 255 if stroke['e'] else ImageColor.getcolor(stroke['c'], 'L')
+        width = max(1, round(stroke['w'] * scale))
+        if len(points) > 1:
+            draw.line(points, fill=shade, width=width, joint='curve')
+        if width > 2:
+            # 圓形筆頭 (和前端的 lineCap = 'round' 一樣)
+            radius = width / 2
+            for x, y in (points[0], points[-1]):
+                draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=shade)
+    return image
+
+class StrokeStore:
+    def __init__(self, store, raster_cache_size=64, raster_cache_bytes=RASTER_CACHE_BYTES, max_pixels=None):
+        self.store = store
+        self.max_pixels = max_pixels
+        self.raster_cache = LRUStore(maxsize=raster_cache_size, maxbytes=raster_cache_bytes,
+                                     sizeof=lambda image: image.width * image.height * len(image.getbands()))
+        self._lock = threading.Lock()
+        self._counters = {'saved': 0, 'payload_bytes': 0, 'rasterized': 0}
+
+    def save(self, strokes):
+        """存下正規化後的筆跡，回傳 stroke_id (內容雜湊)"""
+        stroke_id = stroke_hash(strokes)
+        payload = json.dumps(strokes, separators=(',', ':'))
+        self.store.set(stroke_id, payload)
+        with self._lock:
+            self._counters['saved'] += 1
+            self._counters['payload_bytes'] += len(payload)
+        return stroke_id
+
+    def load(self, stroke_id):
+        payload = self.store.get(stroke_id)
+        return json.loads(payload) if payload is not None else None
+
+    def scale_for(self, strokes, scale):
+        """這份筆跡用 scale 轉圖時實際的倍率 (座標格要跟著換算)"""
+        return raster_scale(strokes, scale, self.max_pixels)
+
+    def rasterize(self, stroke_id, scale=1.0, strokes=None):
+        """
+        取得筆跡的圖片 (有快取)；strokes 已經在手上時可以直接傳入，省一次讀取。
+        實際的倍率是 scale_for(strokes, scale)，同一份筆跡最多只有 len(RASTER_SCALES) 種快取。
+        """
+        requested = quantize_scale(scale)
+        cache_key = (stroke_id, requested)
+        image = self.raster_cache.get(cache_key)
+        if image is None:
+            strokes = strokes if strokes is not None else self.load(stroke_id)
+            if strokes is None:
+                return None
+            image = rasterize(strokes, self.scale_for(strokes, requested))
+            self.raster_cache.set(cache_key, image)
+            with self._lock:
+                self._counters['rasterized'] += 1
+        return image.copy()  # 呼叫的人可能會修改圖片，快取裡的保持原樣
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters['bytes_per_submission'] = (counters['payload_bytes'] / counters['saved']) if counters['saved'] else None
+        counters['raster_cache'] = self.raster_cache.stats()
+        counters['store'] = self.store.stats()
+        return counters
+
+def create_stroke_store(instance_path, ttl_seconds=None, memory_size=500, max_pixels=None):
+    """記憶體 LRU + instance/strokes.db (之後老師檢視、重新批改都拿得到原始筆跡)；max_pixels 是轉圖的像素上限"""
+    memory = LRUStore(maxsize=memory_size, ttl=ttl_seconds)
+    disk = SQLiteStore(os.path.join(instance_path, 'strokes.db'), table='strokes', ttl=ttl_seconds)
+    return StrokeStore(TieredStore(memory, disk), max_pixels=max_pixels)
@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+from sqlalchemy import create_engine
+
+# 測試直接 import 專案根目錄的模組 (和 python app.py 一樣的平面結構)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """載入 app.py：資料庫換成暫存檔、用本機假模型、session 只放記憶體，不會動到 instance/kumon_math.db"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + str(tmp_path_factory.mktemp('app') / 'app.db')
+    os.environ['GEMINI_FAKE_MODEL'] = '1'
+    os.environ['SESSION_BACKEND'] = 'memory'
+    os.environ.pop('PROGRESS_WRITE_BEHIND', None)
+    import app
+    return app
+
+@pytest.fixture
+def migrated_engine(app_module, tmp_path):
+    """升級到最新版的空白 SQLite 資料庫 (每個測試一個)"""
+    from migrations import upgrade
+    engine = create_engine('sqlite:///' + str(tmp_path / 'test.db'))
+    upgrade(engine, app_module.db.metadata)
+    yield engine
+    engine.dispose()
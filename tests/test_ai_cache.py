@@ -0,0 +1,43 @@
+from ai_cache import ResponseCache, is_conceptual_question, normalize_text
+from kv_store import LRUStore, SQLiteStore, TieredStore
+
+def test_normalize_text():
+    assert normalize_text('ＡＢＣ  x ＋ １？') == normalize_text('abc x+1') == 'abcx+1'
+    assert normalize_text('x - (1)') != normalize_text('x1')
+    assert normalize_text(None) == ''
+
+def test_signs_and_brackets_do_not_collide():
+    cache = ResponseCache(LRUStore())
+    question = '求 f(x) = -2x^2 + 3x + 1 除以 (x - 1) 的餘式。'
+    assert cache.make_key('餘式定理', question, '第一步要做什麼？') != \
+        cache.make_key('餘式定理', question.replace('-2x^2', '2x^2'), '第一步要做什麼？')
+    assert normalize_text('-x + 2y = 5') != normalize_text('x + 2y = 5')
+    assert normalize_text('(x - 1)(x + 1)') != normalize_text('x - 1x + 1')
+
+def test_conceptual_questions():
+    assert is_conceptual_question('什麼是餘式定理？')
+    assert not is_conceptual_question('這題的答案是什麼？')
+    assert not is_conceptual_question('我算出 3，對嗎')
+
+def test_key_ignores_spacing_and_width():
+    cache = ResponseCache(LRUStore())
+    assert cache.make_key('餘式定理', 'f(x)=x^2+1', '第一步要做什麼？') == \
+        cache.make_key('餘式定理 ', 'f(x) = x^2 + 1', '第一步要做什麼?')
+    assert cache.make_key('餘式定理', 'f(x)=x^2+1', '第一步要做什麼？') != \
+        cache.make_key('餘式定理', 'f(x)=x^2+2', '第一步要做什麼？')
+
+def test_concept_questions_are_shared_across_questions():
+    cache = ResponseCache(LRUStore())
+    cache.set('餘式定理', 'f(x)=x^2+1', '什麼是餘式定理？', 'reply')
+    assert cache.get('餘式定理', 'f(x)=x^3-2', '什麼是餘式定理') == 'reply'
+    assert cache.get('因式定理', 'f(x)=x^3-2', '什麼是餘式定理') is None
+    stats = cache.stats()
+    assert (stats['concept_hits'], stats['misses'], stats['stores']) == (1, 1, 1)
+
+def test_tiered_store_refills_memory_from_disk(tmp_path):
+    disk = SQLiteStore(str(tmp_path / 'cache.db'), table='ai_responses')
+    ResponseCache(TieredStore(LRUStore(), disk)).set('s', 'q', 'p', 'reply')
+    memory = LRUStore()
+    cache = ResponseCache(TieredStore(memory, disk))
+    assert cache.get('s', 'q', 'p') == 'reply'
+    assert memory.stats()['size'] == 1
@@ -0,0 +1,137 @@
+import json
+import uuid
+import pytest
+from model_scheduler import ModelBusy
+
+def sse_events(body):
+    """SSE 回應 -> [(event, data), ...]；每個事件都要有 event: 和 data: 兩行"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        event_line, data_line = block.split('\n')
+        assert event_line.startswith('event: ') and data_line.startswith('data: ')
+        events.append((event_line[len('event: '):], json.loads(data_line[len('data: '):])))
+    return events
+
+def tutor_prompt():
+    return f"第一步怎麼做 {uuid.uuid4().hex}"  # 避開 instance/ai_cache.db 裡的舊回覆
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    client.post('/register', data={'username': 'route-student', 'password': 'pw'})
+    client.post('/login', data={'username': 'route-student', 'password': 'pw'})
+    return client
+
+def test_skill_engine_is_synced_to_skill_table(app_module):
+    with app_module.app.app_context():
+        app_module.initialize_skills()  # 第二次同步不會多建任何東西
+        skills = {skill.name: skill for skill in app_module.Skill.query.filter(
+            app_module.Skill.name.in_(list(app_module.SKILL_ENGINE))).all()}
+        assert set(skills) == set(app_module.SKILL_ENGINE)
+        edges = {(dependency.prerequisite.name, dependency.target.name)
+                 for dependency in app_module.SkillDependency.query.all()}
+        expected = {(data['prerequisite_skill_id'], slug) for slug, data in app_module.SKILL_ENGINE.items()
+                    if data['prerequisite_skill_id']}
+        assert edges == expected
+
+def test_practice_page(client, app_module):
+    for skill_id in app_module.SKILL_ENGINE:
+        response = client.get(f'/practice/{skill_id}')
+        assert response.status_code == 200
+        assert app_module.SKILL_ENGINE[skill_id]['display_name'] in response.text
+
+def test_practice_unknown_skill_redirects(client):
+    response = client.get('/practice/no-such-skill')
+    assert response.status_code == 302
+
+def test_dashboard_after_sync(client):
+    assert client.get('/dashboard').status_code == 200
+
+def test_questions_batch(client, app_module):
+    response = client.get('/api/questions/batch?skill=remainder-theorem&n=5&seed=42')
+    assert response.status_code == 200
+    batch = response.get_json()
+    assert (batch['skill'], batch['count'], batch['seed']) == ('remainder-theorem', 5, 42)
+    assert len({question['question_id'] for question in batch['questions']}) == 5
+    again = client.get('/api/questions/batch?skill=remainder-theorem&n=5&seed=42').get_json()
+    assert again['questions'] == batch['questions']  # 同一個 seed 是同一份考卷
+
+def test_questions_batch_rejects_bad_arguments(client, app_module):
+    for query in ('skill=no-such-skill', 'skill=remainder-theorem&n=0',
+                  f'skill=remainder-theorem&n={app_module.BATCH_MAX_QUESTIONS + 1}',
+                  'skill=remainder-theorem&seed=-1'):
+        response = client.get(f'/api/questions/batch?{query}')
+        assert response.status_code == 400, query
+        assert 'error' in response.get_json()
+    assert app_module.app.test_client().get('/api/questions/batch?skill=remainder-theorem').status_code == 401
+
+def test_recommend_teacher_batch_mode(client, app_module, monkeypatch):
+    mine = client.get('/recommend').get_json()
+    assert mine['recommendations'] and mine['recommendations'][0]['practicable']
+    assert client.get('/recommend?user_ids=all').status_code == 403  # 學生不能看別人的
+
+    monkeypatch.setattr(app_module, 'TEACHER_USERNAMES', {'route-teacher'})
+    teacher = app_module.app.test_client()
+    teacher.post('/register', data={'username': 'route-teacher', 'password': 'pw'})
+    teacher.post('/login', data={'username': 'route-teacher', 'password': 'pw'})
+    with app_module.app.app_context():
+        student_id = app_module.User.query.filter_by(username='route-student').one().id
+    batch = teacher.get(f'/recommend?user_ids={student_id},{student_id}&limit=3').get_json()
+    assert [student['user_id'] for student in batch['students']] == [student_id]
+    assert batch['students'][0]['recommendations'] == mine['recommendations'][:3]
+    assert len(teacher.get('/recommend?user_ids=all').get_json()['students']) >= 2
+    assert teacher.get('/recommend?user_ids=1,x').status_code == 400
+
+def test_tutor_stream_through_scheduler(client, app_module):
+    prompt = tutor_prompt()
+    response = client.post('/ask_gemini/stream', json={'prompt': prompt, 'current_question': 'x+1=2'})
+    events = [block.split('\n')[0] for block in response.text.strip().split('\n\n')]
+    assert events[0] == 'event: chunk' and events[-1] == 'event: done'
+    assert app_module.model_scheduler.stats()['breaker']['state'] == 'closed'
+
+def test_tutor_stream_frames_and_cache(client, app_module):
+    prompt = tutor_prompt()
+    response = client.post('/ask_gemini/stream', json={'prompt': prompt, 'current_question': 'x+1=2'})
+    assert response.mimetype == 'text/event-stream'
+    events = sse_events(response.text)
+    assert [name for name, _ in events[:-1]] == ['chunk'] * (len(events) - 1) and len(events) > 2
+    name, done = events[-1]
+    assert name == 'done' and done['cached'] is False and done['total_ms'] >= done['ttft_ms']
+    reply = "".join(data['text'] for _, data in events[:-1])
+    assert reply == app_module.model._reply_for(prompt)
+
+    # 同一個問題第二次：快取整段一次送出
+    events = sse_events(client.post('/ask_gemini/stream', json={'prompt': prompt, 'current_question': 'x+1=2'}).text)
+    assert events == [('chunk', {'text': reply}), ('done', events[1][1])] and events[1][1]['cached'] is True
+
+def test_tutor_stream_error_event(client, app_module, monkeypatch):
+    def busy(*args, **kwargs):
+        raise ModelBusy("排隊太多")
+    monkeypatch.setattr(app_module.model_scheduler, 'generate', busy)
+    events = sse_events(client.post('/ask_gemini/stream', json={'prompt': tutor_prompt(),
+                                                               'current_question': 'x+1=2'}).text)
+    assert events == [('error', {'reply': app_module.MODEL_BUSY_REPLY})]
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(app_module.model_scheduler, 'generate', broken)
+    events = sse_events(client.post('/ask_gemini/stream', json={'prompt': tutor_prompt(),
+                                                               'current_question': 'x+1=2'}).text)
+    assert [name for name, _ in events] == ['error'] and 'reply' in events[0][1]
+    assert app_module.ai_flights.stats()['in_flight'] == 0  # 失敗時 flight 也要結束
+
+def test_tutor_stream_disconnect_closes_model_stream(client, app_module, monkeypatch):
+    streams = []
+    generate = app_module.model_scheduler.generate
+
+    def capture(*args, **kwargs):
+        streams.append(generate(*args, **kwargs))
+        return streams[-1]
+    monkeypatch.setattr(app_module.model_scheduler, 'generate', capture)
+    response = client.post('/ask_gemini/stream', json={'prompt': tutor_prompt(), 'current_question': 'x+1=2'},
+                           buffered=False)
+    first = next(iter(response.response))
+    assert first.startswith(b'event: chunk')
+    response.close()  # 學生關掉網頁
+    assert len(streams) == 1 and streams[0].closed.is_set()
+    assert app_module.ai_flights.stats()['in_flight'] == 0
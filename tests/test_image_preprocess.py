@@ -0,0 +1,46 @@
+import io
+import pytest
+from PIL import Image, ImageDraw
+from image_preprocess import INK_THRESHOLD, ImageRejected, decode_image, flatten_to_gray, preprocess_handwriting
+from stroke_store import GRID_AXIS_SHADE, GRID_LINE_SHADE, parse_strokes, rasterize
+
+def png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+def test_decode_limits():
+    raw = png_bytes(Image.new('L', (300, 200), 255))
+    assert decode_image(raw, max_pixels=300 * 200).size == (300, 200)
+    with pytest.raises(ImageRejected, match='太大'):
+        decode_image(raw, max_pixels=300 * 200 - 1)
+    with pytest.raises(ImageRejected):
+        decode_image(b'not an image', max_pixels=10 ** 6)
+    with pytest.raises(ImageRejected):
+        decode_image(raw[:60], max_pixels=10 ** 6)  # 檔頭正常但內容被截斷
+
+def test_transparent_canvas_is_flattened_to_white():
+    image = Image.new('RGBA', (40, 40), (0, 0, 0, 0))
+    ImageDraw.Draw(image).line([(5, 20), (35, 20)], fill=(0, 0, 0, 255), width=3)
+    gray = flatten_to_gray(image)
+    assert gray.mode == 'L' and gray.getpixel((2, 2)) == 255 and gray.getpixel((20, 20)) == 0
+
+def test_crop_ignores_the_grid():
+    assert INK_THRESHOLD < min(GRID_AXIS_SHADE, GRID_LINE_SHADE)
+    # 整個畫布都是座標格，只有右下角一小筆
+    strokes = parse_strokes({'v': 1, 'width': 400, 'height': 400,
+                             'grid': {'origin_x': 200, 'origin_y': 200, 'unit': 20, 'range': 9},
+                             'strokes': [{'p': [300, 300, 20, 20], 'w': 3}]})
+    image, stats = preprocess_handwriting(rasterize(strokes, scale=2.0), padding=16)
+    assert max(image.size) < 120  # 只有那一筆加上邊界，不是整個格線的 720 px
+    assert stats['pixel_ratio'] < 0.05
+    with pytest.raises(ImageRejected):
+        preprocess_handwriting(rasterize(dict(strokes, strokes=[]), scale=2.0))  # 只有格線就是沒有筆跡
+
+def test_thumbnail_and_bilevel_mode():
+    image = Image.new('L', (3000, 1000), 255)
+    ImageDraw.Draw(image).line([(100, 500), (2900, 520)], fill=0, width=8)
+    output, stats = preprocess_handwriting(image, target_size=1024)
+    assert max(output.size) == 1024 and stats['output_size'] == output.size
+    bilevel, _ = preprocess_handwriting(image, target_size=512, mode='1')
+    assert bilevel.mode == '1' and max(bilevel.size) == 512
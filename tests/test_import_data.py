@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from curriculum_cache import bump_curriculum_version
+from import_data import PREREQ_COLUMN, TARGET_COLUMN, clean_links, import_links, is_empty, plan_import
+
+SKILL_COLUMNS = ['id', 'name', 'display_name', 'description', 'school_type', 'grade_level', 'main_unit']
+
+def links_frame(rows):
+    return clean_links(pd.DataFrame(rows, columns=[PREREQ_COLUMN, TARGET_COLUMN]))
+
+def test_clean_links():
+    links = links_frame([(' A ', 'B'), ('A', 'B'), ('', None), (None, 'C')])
+    assert links.fillna('-').to_numpy().tolist() == [['A', 'B'], ['-', 'C']]
+    with pytest.raises(ValueError):
+        clean_links(pd.DataFrame({'x': []}))
+
+def test_plan_import_diff():
+    links = links_frame([('A', 'B'), ('B', 'C'), ('C', 'C'), ('國中 D', 'A')])
+    skills = pd.DataFrame([
+        (1, 'a', 'A', '舊的說明', '普高', '高一', None),              # 知識點鏈結建立的，說明要更新
+        (2, 'b', 'B', '課綱的說明', '共同', '國一', '整數'),          # 課綱的技能，不會被改
+        (3, 'z', 'Z', '關於「Z」的練習', '普高', '高一', None),
+    ], columns=SKILL_COLUMNS)
+    dependencies = pd.DataFrame([(1, 1, 2), (2, 3, 1)], columns=['id', 'prerequisite_id', 'target_id'])
+
+    plan = plan_import(links, skills, dependencies)
+    assert plan['new_skills']['display_name'].tolist() == ['C', '國中 D']
+    assert plan['new_skills'].set_index('display_name').loc['國中 D', 'grade_level'] == '國中'
+    assert plan['changed_skills']['id'].tolist() == [1]
+    assert sorted(map(tuple, plan['new_edges'].to_numpy().tolist())) == [('b', 'c'), ('國中_d', 'a')]
+    assert plan['deleted_edges'].tolist() == [2]
+    assert plan['self_loops'] == 1
+    assert plan_import(links, skills, dependencies, delete_missing=False)['deleted_edges'].tolist() == []
+
+def test_plan_import_keeps_edges_it_does_not_own():
+    links = links_frame([('A', 'B')])
+    skills = pd.DataFrame([
+        (1, 'a', 'A', '關於「A」的練習', '普高', '高一', None),
+        (2, 'b', 'B', '關於「B」的練習', '普高', '高一', None),
+        (3, 'c', 'C', '關於「C」的練習', '普高', '高一', None),
+        (4, 'remainder-theorem', '餘式定理', '', None, None, None),  # SKILL_ENGINE 的技能
+        (5, 'factor-theorem', '因式定理', '', None, None, None),
+        (6, 'd', 'D', '課綱的說明', '共同', '國一', '整數'),
+    ], columns=SKILL_COLUMNS)
+    dependencies = pd.DataFrame([
+        (1, 1, 2),  # 活頁簿裡還有
+        (2, 2, 3),  # 活頁簿裡沒有了 -> 刪除
+        (3, 4, 5),  # initialize_skills 寫的
+        (4, 4, 1),  # 一端是 SKILL_ENGINE 的技能
+        (5, 6, 1),  # 一端是課綱的技能
+    ], columns=['id', 'prerequisite_id', 'target_id'])
+    protected = ['remainder-theorem', 'factor-theorem']
+    plan = plan_import(links, skills, dependencies, protected_names=protected)
+    assert plan['deleted_edges'].tolist() == [2]
+    # 同名的 SKILL_ENGINE 技能不會被知識點鏈結改掉說明
+    plan = plan_import(links_frame([('餘式定理', 'A')]), skills, dependencies, protected_names=protected)
+    assert plan['changed_skills'].empty
+
+def test_import_twice_is_a_no_op(migrated_engine):
+    session = sessionmaker(bind=migrated_engine)()
+    links = links_frame([('A', 'B'), ('B', 'C')])
+    first = import_links(session, links)
+    assert len(first['new_skills']) == 3 and len(first['new_edges']) == 2
+    assert is_empty(import_links(session, links))
+    session.close()
+
+def test_curriculum_version_bump_joins_the_transaction(migrated_engine):
+    session = sessionmaker(bind=migrated_engine)()
+    before = session.execute(text("SELECT version FROM curriculum_version")).scalar()
+    session.execute(text("INSERT INTO skill (name, display_name) VALUES ('x', 'X')"))
+    bump_curriculum_version(session, commit=False)
+    session.rollback()  # 匯入失敗：課綱和版本號一起退回
+    assert session.execute(text("SELECT version FROM curriculum_version")).scalar() == before
+    bump_curriculum_version(session)
+    assert session.execute(text("SELECT version FROM curriculum_version")).scalar() == before + 1
+    session.close()
@@ -0,0 +1,64 @@
+import openpyxl
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from import_data import PREREQ_COLUMN, SHEET_NAME, TARGET_COLUMN, clean_links, import_links
+from ingest_workbooks import CURRICULUM_HEADER, discover_workbooks, ingest, merge_results, parse_all, parse_workbook
+
+def write_workbook(path, rows, sheet_name=SHEET_NAME):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = sheet_name
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+def test_discover_skips_lock_files(tmp_path):
+    for name in ('b.xlsx', 'a.XLSX', '~$a.xlsx', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+    assert [path.rsplit('/', 1)[-1] for path in discover_workbooks(str(tmp_path))] == ['a.XLSX', 'b.xlsx']
+
+def test_curriculum_header_and_fill_down(tmp_path):
+    path = write_workbook(tmp_path / '課綱.xlsx', [
+        ('備註',) + CURRICULUM_HEADER,
+        ('', '國一', '整數', '正負數', '數線'),
+        (None, None, None, '絕對值', '距離'),
+        (None, None, '分數', '約分', None),
+        (None, None, None, None, None),
+    ])
+    result = parse_workbook(path)
+    assert result['kind'] == 'curriculum'
+    assert result['rows'] == [('國一', '整數', '正負數', '數線'), ('國一', '整數', '絕對值', '距離'),
+                              ('國一', '分數', '約分', None)]
+
+def test_link_header_and_unknown_workbook(tmp_path):
+    links = parse_workbook(write_workbook(tmp_path / 'links.xlsx', [
+        (TARGET_COLUMN, PREREQ_COLUMN), ('B', 'A'), ('C', None)]))
+    assert links['kind'] == 'links'
+    assert links['rows'] == [('A', 'B'), (None, 'C')]
+    other = parse_workbook(write_workbook(tmp_path / 'other.xlsx', [('x', 'y'), (1, 2)], sheet_name='Sheet'))
+    assert other['kind'] is None and other['rows'] == []
+
+    curriculum, merged = merge_results([links, other])
+    assert curriculum is None
+    assert list(merged.columns) == ['prerequisite', 'target']
+    assert merged.fillna('-').to_numpy().tolist() == [['A', 'B'], ['-', 'C']]
+
+def test_unreadable_workbook_aborts_the_ingest(migrated_engine, tmp_path):
+    session = sessionmaker(bind=migrated_engine)()
+    import_links(session, clean_links(pd.DataFrame([('A', 'B'), ('B', 'C')], columns=[PREREQ_COLUMN, TARGET_COLUMN])))
+    good = write_workbook(tmp_path / 'a.xlsx', [(PREREQ_COLUMN, TARGET_COLUMN), ('A', 'B')])
+    broken = tmp_path / 'b.xlsx'
+    broken.write_bytes(b'not a workbook')
+    unknown = write_workbook(tmp_path / 'c.xlsx', [('x', 'y'), (1, 2)])
+
+    results = parse_all([good, str(broken), unknown], workers=1)
+    assert [result['kind'] for result in results] == ['links', None, None]
+    assert 'error' in results[1]
+    # 少了 b、c 兩個檔案：不能把 B -> C 當成已經刪掉
+    with pytest.raises(ValueError, match='b.xlsx, c.xlsx'):
+        ingest(session, results, apply_curriculum=None)
+    assert session.execute(text("SELECT COUNT(*) FROM skill_dependency")).scalar() == 2
+    session.close()
@@ -0,0 +1,59 @@
+import json
+import threading
+import time
+import pytest
+from job_queue import INTERRUPTED_ERROR, JobQueue, JobQueueFull
+from kv_store import SQLiteStore
+
+def test_other_process_sees_result(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    worker = JobQueue(max_workers=1, store=SQLiteStore(path, table='jobs'))
+    other = JobQueue(max_workers=1, store=SQLiteStore(path, table='jobs'), poll_interval=0.01)  # 另一個 worker process
+    release = threading.Event()
+    job_id = worker.submit(lambda: release.wait(5) and {'answer': 42}, owner=7)
+    assert other.get(job_id)['status'] in ('queued', 'running')
+    assert other.get(job_id)['owner'] == 7
+    assert other.wait(job_id, timeout=0.05)['status'] in ('queued', 'running')  # 逾時就回傳目前的狀態
+    release.set()
+    job = other.wait(job_id, timeout=5)
+    assert job['status'] == 'done'
+    assert job['result'] == {'answer': 42}
+    assert worker.stats()['done'] == 1 and other.stats()['submitted'] == 0
+
+def test_queued_job_of_dead_process_reports_error(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    store = SQLiteStore(path, table='jobs')
+    now = time.time()
+    # 送出工作的 process 重新啟動了：store 裡只剩下排隊中的紀錄
+    store.set('lost', json.dumps({'job_id': 'lost', 'owner': 1, 'status': 'queued', 'result': None, 'error': None,
+                                  'created_at': now - 10, 'updated_at': now - 10, 'finished_at': None}), 60)
+    queue = JobQueue(store=SQLiteStore(path, table='jobs'), stale_after=5, poll_interval=0.01)
+    job = queue.wait('lost', timeout=1)
+    assert job['status'] == 'error'
+    assert job['error'] == INTERRUPTED_ERROR
+    assert queue.get('missing') is None
+
+def test_long_queued_job_is_not_reported_stale(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    worker = JobQueue(max_workers=1, store=SQLiteStore(path, table='jobs'), stale_after=0.3)
+    other = JobQueue(store=SQLiteStore(path, table='jobs'), stale_after=0.3, poll_interval=0.01)
+    release = threading.Event()
+    blocker = worker.submit(lambda: release.wait(5))
+    queued = worker.submit(lambda: 'late')  # 前一個工作還沒做完，這個要排隊超過 stale_after
+    time.sleep(1.0)
+    assert other.get(queued)['status'] == 'queued'
+    assert other.get(blocker)['status'] == 'running'
+    release.set()
+    assert other.wait(queued, timeout=5)['result'] == 'late'
+
+def test_full_queue_and_unserializable_result():
+    queue = JobQueue(max_workers=1, max_pending=1)
+    release = threading.Event()
+    job_id = queue.submit(lambda: release.wait(5) and object())
+    with pytest.raises(JobQueueFull):
+        queue.submit(lambda: None)
+    release.set()
+    job = queue.wait(job_id, timeout=5)
+    assert job['status'] == 'error' and '無法儲存' in job['error']
+    assert queue.stats()['rejected'] == 1
+    assert queue.stats()['pending'] == 0
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from knowledge_graph import CycleError, KnowledgeGraph
+
+def test_csr_and_closure():
+    graph = KnowledgeGraph([10, 20, 30, 40], [(10, 20), (20, 30), (10, 30), (99, 10)])
+    assert graph.skipped_edges == 1
+    assert graph.prerequisites(30) == [10, 20]
+    assert graph.all_prerequisites(30) == [20, 10]
+    assert graph.is_prerequisite(10, 30) and not graph.is_prerequisite(30, 10)
+    assert graph.skill_depth(30) == 2 and graph.skill_depth(40) == 0
+    assert graph.descendant_count.tolist() == [2, 1, 0, 0]
+    order = graph.topo_order.tolist()
+    assert order.index(0) < order.index(1) < order.index(2)
+
+def test_cycle_is_detected():
+    with pytest.raises(CycleError) as error:
+        KnowledgeGraph([1, 2, 3], [(1, 2), (2, 3), (3, 1)])
+    assert sorted(error.value.cycle) == [1, 2, 3]
+
+def test_cycle_edges_are_dropped_when_not_strict():
+    graph = KnowledgeGraph([1, 2, 3, 4], [(1, 2), (2, 3), (3, 1), (3, 4)], strict=False)
+    assert len(graph.dropped_edges) == 1
+    assert graph.edge_count == 3
+    assert len(graph.topo_order) == 4
+
+def test_weakest_ancestor():
+    names = {1: 'a', 2: 'b', 3: 'c', 4: 'd'}
+    graph = KnowledgeGraph(names, [(1, 2), (2, 3), (3, 4)], names=names, practicable={'a', 'b', 'd'})
+    scores = np.zeros(5, dtype=np.int64)
+    # c 沒有題目可以練習，略過；b 還沒精熟
+    assert graph.weakest_ancestor(4, scores, mastered_at=5) == 2
+    scores[2] = 5
+    assert graph.weakest_ancestor(4, scores, mastered_at=5) == 1
+    scores[1] = 5
+    assert graph.weakest_ancestor(4, scores, mastered_at=5) == 2  # 都精熟了就退回最近的
+    assert graph.weakest_ancestor(1, scores) is None
+    assert graph.can_demote(4) and not graph.can_demote(1)
+
+def test_weakest_ancestor_uses_hop_distance():
+    # 菱形加一條捷徑：1 -> 2 -> 3 -> 5、1 -> 4 -> 5；4 離 5 只有一步，但 depth 比 3 小
+    names = {1: 'a', 2: 'b', 3: 'c', 4: 'd', 5: 'e'}
+    graph = KnowledgeGraph(names, [(1, 2), (2, 3), (3, 5), (1, 4), (4, 5)], names=names)
+    assert graph.skill_depth(3) > graph.skill_depth(4)
+    assert graph.all_prerequisites(5) == [3, 4, 2, 1]
+    scores = np.zeros(6, dtype=np.int64)
+    scores[3] = 5
+    assert graph.weakest_ancestor(5, scores, mastered_at=5) == 4  # 一步就到的 d，不是 depth 比較大的 b
+    scores[4] = 5
+    scores[1] = 2
+    assert graph.weakest_ancestor(5, scores, mastered_at=5) == 2  # a 經過 d 也是兩步，同樣近取分數低的
+    scores[3] = 0
+    assert graph.weakest_ancestor(5, scores, mastered_at=5) == 3
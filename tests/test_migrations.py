@@ -0,0 +1,79 @@
+import threading
+from sqlalchemy import create_engine, inspect, text
+from migrations import LATEST_VERSION, check_schema, current_version, upgrade
+
+# 加上 schema_version 之前、直接 create_all 建出來的資料庫 (沒有索引、沒有唯一限制、可能有重複的依賴關係)
+BASELINE_SCHEMA = [
+    "CREATE TABLE user (id INTEGER NOT NULL, username VARCHAR(80) NOT NULL, password_hash VARCHAR(128) NOT NULL, "
+    "PRIMARY KEY (id), UNIQUE (username))",
+    "CREATE TABLE skill (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, display_name VARCHAR(100) NOT NULL, "
+    "description VARCHAR(255), main_unit VARCHAR(100), school_type VARCHAR(20), grade_level VARCHAR(20), "
+    "PRIMARY KEY (id), UNIQUE (name))",
+    "CREATE TABLE user_progress (id INTEGER NOT NULL, user_id INTEGER NOT NULL, skill_id INTEGER NOT NULL, "
+    "consecutive_correct INTEGER, total_correct INTEGER, total_attempted INTEGER, consecutive_incorrect INTEGER, "
+    "PRIMARY KEY (id), CONSTRAINT _user_skill_uc UNIQUE (user_id, skill_id))",
+    "CREATE TABLE skill_dependency (id INTEGER NOT NULL, prerequisite_id INTEGER NOT NULL, "
+    "target_id INTEGER NOT NULL, PRIMARY KEY (id))",
+]
+
+def index_names(engine, table):
+    return {index['name'] for index in inspect(engine).get_indexes(table)}
+
+def test_upgrade_empty_database(app_module, tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'empty.db'))
+    assert current_version(engine) == 0
+    assert upgrade(engine, app_module.db.metadata) == LATEST_VERSION
+    assert current_version(engine) == LATEST_VERSION
+    assert set(app_module.db.metadata.tables) <= set(inspect(engine).get_table_names())
+    assert 'unique_dependency' in index_names(engine, 'skill_dependency')
+    assert upgrade(engine, app_module.db.metadata) == 0
+
+def test_upgrade_baseline_database(app_module, tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'baseline.db'))
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO user (id, username, password_hash) VALUES (1, 'student', 'x')"))
+        conn.execute(text("INSERT INTO skill (id, name, display_name) VALUES (1, 'a', 'A'), (2, 'b', 'B')"))
+        conn.execute(text("INSERT INTO skill_dependency (id, prerequisite_id, target_id) VALUES (1, 1, 2), (2, 1, 2)"))
+        conn.execute(text("INSERT INTO user_progress (user_id, skill_id, consecutive_correct, total_correct, "
+                          "total_attempted, consecutive_incorrect) VALUES (1, 2, 3, 4, 6, 0)"))
+
+    assert check_schema(engine, app_module.db.metadata) == LATEST_VERSION
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id FROM skill_dependency")).scalars().all() == [1]
+        assert conn.execute(text("SELECT version FROM curriculum_version")).scalar() == 1
+        assert conn.execute(text("SELECT COUNT(*) FROM user_progress")).scalar() == 1
+        assert conn.execute(text("SELECT COUNT(*) FROM user_mastery WHERE user_id = 1")).scalar() == 1
+    assert {'ix_skill_grade_level', 'ix_skill_main_unit'} <= index_names(engine, 'skill')
+    assert 'ix_attempt_user_skill_ts' in index_names(engine, 'attempt')
+
+def test_check_schema_without_auto_upgrade(app_module, tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'old.db'))
+    assert check_schema(engine, app_module.db.metadata, auto_upgrade=False) == 0
+
+def test_concurrent_upgrade_applies_each_version_once(app_module, tmp_path):
+    url = 'sqlite:///' + str(tmp_path / 'race.db')
+    barrier = threading.Barrier(4)
+    applied, errors = [], []
+
+    def start_worker():
+        engine = create_engine(url, connect_args={'timeout': 30})  # 每個 worker 自己的 engine，像不同的 process
+        barrier.wait()
+        try:
+            applied.append(upgrade(engine, app_module.db.metadata))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            engine.dispose()
+
+    threads = [threading.Thread(target=start_worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert sum(applied) == LATEST_VERSION
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == LATEST_VERSION
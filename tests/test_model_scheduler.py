@@ -0,0 +1,173 @@
+import threading
+import time
+import pytest
+from fake_model import FakeModel, FakeResponse
+from model_scheduler import (CircuitBreaker, ModelScheduler, ModelUnavailable, PRIORITY_CHAT, PRIORITY_GRADING,
+                             TokenBucket)
+
+class Overloaded(Exception):
+    pass
+
+class RecordingModel:
+    """第一個呼叫卡住 worker，等後面的請求都排進佇列再放行"""
+    def __init__(self):
+        self.calls = []
+        self.blocked = threading.Event()
+        self.release = threading.Event()
+
+    def generate_content(self, contents, **kwargs):
+        if contents == 'first':
+            self.blocked.set()
+            self.release.wait(5)
+        self.calls.append(contents)
+        return FakeResponse(contents)
+
+class FlakyModel:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise Overloaded('quota')
+        return FakeResponse('ok')
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert 0 < bucket.acquire() <= 1.0
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+    assert breaker.allow()          # 只放一個請求去試探
+    assert not breaker.allow()
+    breaker.record_failure()        # 試探失敗：重新冷卻
+    assert breaker.state == 'open'
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.trips == 1
+
+def test_grading_runs_before_chat():
+    model = RecordingModel()
+    scheduler = ModelScheduler(model, rate_per_minute=6000, burst=100, max_workers=1)
+    first = scheduler.submit('first')
+    assert model.blocked.wait(5)
+    chat = scheduler.submit('chat', PRIORITY_CHAT)
+    grading = scheduler.submit('grading', PRIORITY_GRADING)
+    model.release.set()
+    for future in (first, chat, grading):
+        future.result(5)
+    assert model.calls == ['first', 'grading', 'chat']
+
+def test_retryable_errors_are_retried():
+    model = FlakyModel(failures=2)
+    scheduler = ModelScheduler(model, rate_per_minute=6000, burst=100, max_workers=1, base_backoff=0.001,
+                               retryable=(Overloaded,), breaker_threshold=5)
+    assert scheduler.generate('hi', timeout=5).text == 'ok'
+    stats = scheduler.stats()
+    assert (stats['retries'], stats['completed'], stats['breaker']['state']) == (2, 1, 'closed')
+
+def test_breaker_rejects_after_repeated_failures():
+    model = FlakyModel(failures=100)
+    scheduler = ModelScheduler(model, rate_per_minute=6000, burst=100, max_workers=1, max_retries=0,
+                               retryable=(Overloaded,), breaker_threshold=2, breaker_cooldown=60)
+    for _ in range(2):
+        with pytest.raises(Overloaded):
+            scheduler.generate('hi', timeout=5)
+    with pytest.raises(ModelUnavailable):
+        scheduler.generate('hi', timeout=5)
+    assert scheduler.stats()['rejected_breaker_open'] == 1
+
+def test_fake_model_through_scheduler():
+    scheduler = ModelScheduler(FakeModel(latency=0), rate_per_minute=6000, burst=100, max_workers=2)
+    assert '解區域' in scheduler.generate('請檢查解區域', timeout=5).text
+
+class StreamingModel:
+    """串流模型：記錄同時有幾個串流正在讀取；fail_after 段之後丟出 Overloaded"""
+    def __init__(self, chunks=3, delay=0.02, fail_after=None, fail_calls=0):
+        self.chunks = chunks
+        self.delay = delay
+        self.fail_after = fail_after
+        self.fail_calls = fail_calls
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False):
+        self.calls += 1
+        if self.calls <= self.fail_calls:
+            raise Overloaded('quota')
+        return self._stream()
+
+    def _stream(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            for i in range(self.chunks):
+                if self.fail_after is not None and i == self.fail_after:
+                    raise Overloaded('stream broke')
+                time.sleep(self.delay)
+                yield FakeResponse(str(i))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+def read_stream(scheduler, results, errors):
+    try:
+        results.append(''.join(chunk.text for chunk in scheduler.generate('hi', timeout=5, stream=True)))
+    except Exception as e:
+        errors.append(e)
+
+def test_streams_hold_a_worker_until_done():
+    model = StreamingModel()
+    scheduler = ModelScheduler(model, rate_per_minute=6000, burst=100, max_workers=1)
+    results, errors = [], []
+    threads = [threading.Thread(target=read_stream, args=(scheduler, results, errors)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == [] and results == ['012'] * 3
+    assert model.max_active == 1
+    assert scheduler.stats()['completed'] == 3
+
+def test_stream_failure_before_first_chunk_is_retried():
+    model = StreamingModel(fail_calls=1)
+    scheduler = ModelScheduler(model, rate_per_minute=6000, burst=100, max_workers=1, base_backoff=0.001,
+                               retryable=(Overloaded,))
+    assert ''.join(chunk.text for chunk in scheduler.generate('hi', timeout=5, stream=True)) == '012'
+    assert scheduler.stats()['retries'] == 1
+
+def test_stream_failure_midway_counts_against_breaker():
+    model = StreamingModel(fail_after=1)
+    scheduler = ModelScheduler(model, rate_per_minute=6000, burst=100, max_workers=1, base_backoff=0.001,
+                               retryable=(Overloaded,), breaker_threshold=5)
+    stream = scheduler.generate('hi', timeout=5, stream=True)
+    assert next(stream).text == '0'
+    with pytest.raises(Overloaded):
+        next(stream)
+    stats = scheduler.stats()
+    assert (stats['retries'], stats['failed'], stats['breaker']['failures']) == (0, 1, 1)
+
+def test_closed_stream_releases_the_worker():
+    model = StreamingModel(chunks=1000, delay=0.01)
+    scheduler = ModelScheduler(model, rate_per_minute=6000, burst=100, max_workers=1)
+    stream = scheduler.generate('hi', timeout=5, stream=True)
+    next(stream)
+    stream.close()
+    # 第一個串流還有將近 10 秒才讀得完；關掉之後下一個請求馬上拿得到 worker
+    second = scheduler.generate('again', timeout=1, stream=True)
+    assert next(second).text == '0'
+    second.close()
+    assert model.max_active == 1
@@ -0,0 +1,51 @@
+import itertools
+import random
+import numpy as np
+import pytest
+from param_sampler import ParamSpace
+
+def make_space():
+    return ParamSpace('test', {'a': range(-3, 4), 'b': range(-2, 3)}, lambda a, b: a != 0 and a + b != 0)
+
+def test_valid_combinations_match_brute_force():
+    space = make_space()
+    expected = [(a, b) for a, b in itertools.product(range(-3, 4), range(-2, 3)) if a != 0 and a + b != 0]
+    assert space.valid == expected
+    assert space.total == 35
+    assert space.acceptance_rate == len(expected) / 35
+
+def test_samples_are_always_valid():
+    space = make_space()
+    rng = random.Random(0)
+    for _ in range(200):
+        params = space.sample(rng)
+        assert params['a'] != 0 and params['a'] + params['b'] != 0
+    batch = space.sample_batch(1000, np.random.default_rng(0))
+    assert np.all(batch['a'] != 0) and np.all(batch['a'] + batch['b'] != 0)
+
+def test_same_seed_same_samples():
+    space = make_space()
+    assert [space.sample(random.Random(42)) for _ in range(3)] == [space.sample(random.Random(42))] * 3
+    first = space.sample_batch(50, np.random.default_rng(7))
+    second = space.sample_batch(50, np.random.default_rng(7))
+    assert all(np.array_equal(first[name], second[name]) for name in space.names)
+
+def test_empty_space_is_rejected():
+    with pytest.raises(ValueError):
+        ParamSpace('empty', {'a': range(3)}, lambda a: a > 10)
+
+def test_questions_are_rebuilt_from_seed(app_module):
+    for skill_id in app_module.SKILL_ENGINE:
+        first = app_module.SKILL_ENGINE[skill_id]['generator'](random.Random(f"{skill_id}:123"))
+        assert app_module.get_question(skill_id, 123) == first
+        worksheet = app_module.get_worksheet(skill_id, 99, 20)
+        assert len(worksheet) == 20
+        assert app_module.get_worksheet_question(skill_id, app_module.make_worksheet_question_id(99, 20, 7)) == worksheet[7]
+        app_module.get_worksheet.cache_clear()
+        assert app_module.get_worksheet(skill_id, 99, 20) == worksheet
+
+def test_worksheet_question_id_is_checked(app_module):
+    with pytest.raises(ValueError):
+        app_module.get_worksheet_question('remainder-theorem', '1:20:20')
+    with pytest.raises(ValueError):
+        app_module.get_worksheet_question('remainder-theorem', 'not-an-id')
@@ -0,0 +1,103 @@
+import glob
+import subprocess
+import sys
+import textwrap
+from sqlalchemy import text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from progress_buffer import ProgressBuffer, fold_results
+from progress_service import ProgressService
+from conftest import ROOT
+
+SKILL = 'skill-a'
+
+# 子 process：記三筆作答後寫回，commit 之後、刪掉批次檔之前就結束 (模擬當掉)
+CRASH_AFTER_COMMIT = """
+import os, sys
+sys.path.insert(0, {root!r})
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from progress_buffer import ProgressBuffer
+from progress_service import ProgressService
+service = ProgressService(scoped_session(sessionmaker(bind=create_engine({url!r}))), {{{skill!r}: None}})
+buffer = ProgressBuffer(service, {journal!r}, flush_interval=3600)
+for correct in (True, True, False):
+    buffer.record_attempt(1, {skill!r}, correct)
+{crash}
+"""
+
+def seed_database(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO user (id, username, password_hash) VALUES (1, 'student', 'x')"))
+        conn.execute(text("INSERT INTO skill (id, name, display_name) VALUES (1, :name, 'A')"), {'name': SKILL})
+
+def run_child(engine, journal, crash):
+    script = CRASH_AFTER_COMMIT.format(root=ROOT, url=str(engine.url), skill=SKILL, journal=journal, crash=crash)
+    return subprocess.run([sys.executable, '-c', script], capture_output=True, timeout=60).returncode
+
+def counts(engine):
+    with engine.connect() as conn:
+        attempts = conn.execute(text("SELECT COUNT(*) FROM attempt")).scalar()
+        progress = conn.execute(text("SELECT total_attempted, total_correct FROM user_progress")).first()
+    return attempts, tuple(progress) if progress else None
+
+def restart(engine, journal):
+    service = ProgressService(scoped_session(sessionmaker(bind=engine)), {SKILL: None})
+    return ProgressBuffer(service, journal, flush_interval=3600)
+
+def test_crash_between_commit_and_remove_is_not_replayed(migrated_engine, tmp_path):
+    seed_database(migrated_engine)
+    journal = str(tmp_path / 'journal.jsonl')
+    crash = "os.remove = lambda path: os._exit(3)\nbuffer.flush()"
+    assert run_child(migrated_engine, journal, textwrap.dedent(crash)) == 3
+    assert counts(migrated_engine) == (3, (3, 2))
+    assert len(glob.glob(journal + '.*.flushing')) == 1  # 批次檔還在
+
+    buffer = restart(migrated_engine, journal)
+    assert buffer.stats()['recovered'] == 0
+    assert glob.glob(journal + '.*.flushing') == []
+    assert buffer.flush() == 0
+    assert counts(migrated_engine) == (3, (3, 2))
+
+    # 重新啟動後的批次檔序號接在檢查點後面，新的作答照常寫回，再重新啟動也不會重播
+    buffer.record_attempt(1, SKILL, True)
+    assert buffer.flush() == 1
+    assert counts(migrated_engine) == (4, (4, 3))
+    assert restart(migrated_engine, journal).stats()['recovered'] == 0
+
+def test_crash_before_flush_is_replayed_once(migrated_engine, tmp_path):
+    seed_database(migrated_engine)
+    journal = str(tmp_path / 'journal.jsonl')
+    assert run_child(migrated_engine, journal, "os._exit(3)") == 3
+    assert counts(migrated_engine) == (0, None)
+
+    buffer = restart(migrated_engine, journal)
+    assert buffer.stats()['recovered'] == 3
+    buffer.close()  # 背景執行緒可能已經先寫回了
+    assert counts(migrated_engine) == (3, (3, 2))
+    assert restart(migrated_engine, journal).stats()['recovered'] == 0
+
+def test_bulk_batch_is_one_journal_line(migrated_engine, tmp_path):
+    seed_database(migrated_engine)
+    journal = str(tmp_path / 'journal.jsonl')
+    buffer = restart(migrated_engine, journal)
+    attempts = [{'slug': SKILL, 'is_correct': correct, 'seed': i} for i, correct in enumerate((True, True, False))]
+    results = buffer.record_attempts(1, attempts + [{'slug': 'unknown', 'is_correct': True}])
+    assert [(r['total_attempted'], r['total_correct']) for r in results[:3]] == [(1, 1), (2, 2), (3, 2)]
+    assert results[3] is None
+    with open(journal, encoding='utf-8') as f:
+        lines = f.readlines()
+    assert len(lines) == 1
+
+    # 第二批寫到一半就當掉：整批都不算，第一批完整重播
+    replay = str(tmp_path / 'replay.jsonl')
+    with open(replay, 'w', encoding='utf-8') as f:
+        f.write(lines[0] + lines[0][:len(lines[0]) // 2])
+    recovered = restart(migrated_engine, replay)
+    assert recovered.stats()['recovered'] == 3
+    recovered.close()
+    assert counts(migrated_engine) == (3, (3, 2))
+
+def test_fold_results_matches_sequential_rules():
+    folded = fold_results([1, 1, 0, 0, 0, 0], can_demote=True, threshold=3)
+    assert (folded['n'], folded['n_correct'], folded['trailing_correct'], folded['trailing_incorrect']) == (6, 2, 0, 1)
+    assert fold_results([0, 1, 1], can_demote=False, threshold=3)['trailing_correct'] == 2
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from knowledge_graph import KnowledgeGraph
+from mastery_vector import read_mastery
+from progress_service import ProgressService
+
+SKILLS = {1: 'basic', 2: 'middle', 3: 'advanced', 4: 'alone'}
+PREREQUISITES = {'basic': None, 'middle': 'basic', 'advanced': 'middle', 'alone': None}
+
+@pytest.fixture
+def session_factory(migrated_engine):
+    with migrated_engine.begin() as conn:
+        conn.execute(text("INSERT INTO user (id, username, password_hash) VALUES (1, 'student', 'x')"))
+        for skill_id, name in SKILLS.items():
+            conn.execute(text("INSERT INTO skill (id, name, display_name) VALUES (:id, :name, :name)"),
+                         {'id': skill_id, 'name': name})
+    factory = scoped_session(sessionmaker(bind=migrated_engine))
+    yield factory
+    factory.remove()
+
+def record(service, slug, results):
+    return [service.record_attempt(1, slug, correct) for correct in results]
+
+def test_upsert_counters(session_factory):
+    service = ProgressService(session_factory, PREREQUISITES)
+    rows = record(service, 'basic', [True, True, False, True])
+    assert {key: rows[-1][key] for key in ('consecutive_correct', 'total_correct', 'total_attempted',
+                                           'consecutive_incorrect')} == \
+        {'consecutive_correct': 1, 'total_correct': 3, 'total_attempted': 4, 'consecutive_incorrect': 0}
+    session = session_factory()
+    assert session.execute(text("SELECT COUNT(*) FROM attempt")).scalar() == 4
+    assert session.execute(text("SELECT attempted, correct FROM daily_activity")).one() == (4, 3)
+    assert service.record_attempt(1, 'no-such-skill', True) is None
+
+def test_demotion_resets_wrong_streak(session_factory):
+    service = ProgressService(session_factory, PREREQUISITES, demotion_threshold=3)
+    rows = record(service, 'middle', [False, False, False, False])
+    assert [row['consecutive_incorrect'] for row in rows] == [1, 2, 0, 1]
+    assert [row['demote_to_skill_id'] for row in rows] == [None, None, 'basic', None]
+
+def test_no_demotion_without_prerequisite(session_factory):
+    service = ProgressService(session_factory, PREREQUISITES, demotion_threshold=3)
+    rows = record(service, 'alone', [False] * 4)
+    assert [row['consecutive_incorrect'] for row in rows] == [1, 2, 3, 4]
+    assert all(row['demote_to_skill_id'] is None for row in rows)
+
+def test_demotion_skips_mastered_prerequisites(session_factory):
+    graph = KnowledgeGraph(SKILLS, [(1, 2), (2, 3)], names=SKILLS)
+    service = ProgressService(session_factory, PREREQUISITES, demotion_threshold=3, mastery=True,
+                              graph=lambda: graph, mastered_at=2)
+    record(service, 'middle', [True, True])
+    rows = record(service, 'advanced', [False] * 3)
+    assert rows[-1]['demote_to_skill_id'] == 'basic'
+    vector = read_mastery(session_factory(), 1)
+    assert vector[2].tolist() == [2, 2] and vector[3].tolist() == [3, 0]
+
+def test_record_attempts_matches_sequential(session_factory):
+    service = ProgressService(session_factory, PREREQUISITES, demotion_threshold=3)
+    attempts = [{'slug': 'middle', 'is_correct': False, 'seed': seed} for seed in range(3)]
+    rows = service.record_attempts(1, attempts + [{'slug': 'no-such-skill', 'is_correct': True}])
+    assert [row['demote_to_skill_id'] for row in rows[:3]] == [None, None, 'basic']
+    assert rows[3] is None
+    assert session_factory().execute(text("SELECT COUNT(*) FROM attempt WHERE seed IS NOT NULL")).scalar() == 3
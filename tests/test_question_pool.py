@@ -0,0 +1,42 @@
+import threading
+import time
+from question_pool import QuestionPool
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待逾時")
+        time.sleep(0.01)
+
+def test_miss_then_refill_then_hit():
+    release = threading.Event()
+    calls = []
+
+    def make_question(skill_id):
+        # 背景補充的執行緒先卡住，第一次 get() 一定是空的池子
+        if threading.current_thread().name == 'question-pool-refill':
+            release.wait(5)
+        calls.append(skill_id)
+        return len(calls), {'skill': skill_id}
+
+    pool = QuestionPool(['a'], make_question, capacity=3, low_watermark=1, refill_interval=0.01)
+    seed, question = pool.get('a')
+    assert question == {'skill': 'a'}
+    assert pool.stats()['a']['misses'] == 1
+
+    release.set()
+    wait_until(lambda: pool.stats()['a']['size'] == 3)
+    pool.get('a')
+    stats = pool.stats()['a']
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+    assert stats['generated'] >= 4
+
+def test_refill_stops_at_capacity_and_unknown_skill_falls_back():
+    pool = QuestionPool(['a'], lambda skill_id: (0, skill_id), capacity=5, low_watermark=2, refill_interval=0.01)
+    pool.start()
+    wait_until(lambda: pool.stats()['a']['size'] == 5)
+    time.sleep(0.05)
+    assert pool.stats()['a']['size'] == 5
+    assert pool.get('other') == (0, 'other')
+    assert 'other' not in pool.stats()
@@ -0,0 +1,38 @@
+import numpy as np
+from knowledge_graph import KnowledgeGraph
+from recommender import recommend, score_skills, top_skills
+
+NAMES = {1: 'a', 2: 'b', 3: 'c', 4: 'd', 5: 'e'}
+
+def matrix(*rows):
+    return np.array(rows, dtype=np.int32)
+
+def test_frontier():
+    # a -> b -> c、a -> d、e 沒有先備技能
+    graph = KnowledgeGraph(NAMES, [(1, 2), (2, 3), (1, 4)], names=NAMES)
+    consecutive = matrix([5, 2, 0, 0, 0], [0, 0, 0, 0, 0])
+    attempted = matrix([5, 4, 0, 0, 0], [0, 0, 0, 0, 0])
+    frontier = np.isfinite(score_skills(graph, consecutive, attempted, mastered_at=5))
+    assert graph.node_ids[frontier[0]].tolist() == [2, 4, 5]
+    assert graph.node_ids[frontier[1]].tolist() == [1, 5]
+    picks = recommend(graph, consecutive, attempted, mastered_at=5)
+    assert picks[0][0][0] == 2  # 練到一半的 b 最優先
+
+def test_fully_mastered_and_limit_larger_than_frontier():
+    graph = KnowledgeGraph(NAMES, [(1, 2), (2, 3)], names=NAMES)
+    mastered = matrix([5, 5, 5, 5, 5])
+    assert recommend(graph, mastered, mastered, mastered_at=5) == [[]]
+    picks = recommend(graph, matrix([0, 0, 0, 0, 0]), matrix([0, 0, 0, 0, 0]), mastered_at=5, limit=50)
+    assert sorted(skill_id for skill_id, _ in picks[0]) == [1, 4, 5]
+    indices, scores = top_skills(np.array([[1.0, -np.inf, 3.0]]), 10)
+    assert indices.tolist() == [[2, 0, 1]] and np.isneginf(scores[0, 2])
+
+def test_non_practicable_skills_do_not_block_and_rank_last():
+    # b 沒有題目：不會精熟，但不能擋住 c；推薦時可以練習的 c、d 排在 b 前面
+    graph = KnowledgeGraph(NAMES, [(1, 2), (2, 3), (1, 4)], names=NAMES, practicable={'a', 'c', 'd'})
+    consecutive = matrix([5, 0, 0, 0, 5])
+    attempted = matrix([5, 0, 0, 0, 5])
+    picks = [skill_id for skill_id, _ in recommend(graph, consecutive, attempted, mastered_at=5, limit=2)[0]]
+    assert sorted(picks) == [3, 4]
+    picks = [skill_id for skill_id, _ in recommend(graph, consecutive, attempted, mastered_at=5)[0]]
+    assert picks[-1] == 2 and len(picks) == 3
@@ -0,0 +1,77 @@
+import math
+from PIL import Image, ImageDraw
+from region_grader import grade_region_drawing
+
+GRID = {'origin_x': 220, 'origin_y': 220, 'unit': 20, 'range': 10}
+MIN_CONFIDENCE = 0.8  # 和 app.REGION_GRADER_MIN_CONFIDENCE 相同
+
+def to_px(x, y):
+    return GRID['origin_x'] + x * GRID['unit'], GRID['origin_y'] - y * GRID['unit']
+
+def draw_line(draw, start, end, dashed=False):
+    """從 start 到 end 畫邊界線 (數學座標)；虛線每 0.5 單位畫、0.5 單位空"""
+    if not dashed:
+        draw.line([to_px(*start), to_px(*end)], fill=0, width=3)
+        return
+    length = math.dist(start, end)
+    steps = int(length / 0.5)
+    for i in range(0, steps, 2):
+        t0, t1 = i / steps, (i + 1) / steps
+        p0 = (start[0] + (end[0] - start[0]) * t0, start[1] + (end[1] - start[1]) * t0)
+        p1 = (start[0] + (end[0] - start[0]) * t1, start[1] + (end[1] - start[1]) * t1)
+        draw.line([to_px(*p0), to_px(*p1)], fill=0, width=3)
+
+def shade(draw, inside):
+    """在 inside(x, y) 為真、且離邊界有點距離的地方點上陰影"""
+    for i in range(-19, 20):
+        for j in range(-19, 20):
+            x, y = i / 2, j / 2
+            if inside(x, y):
+                px, py = to_px(x, y)
+                draw.rectangle([px - 2, py - 2, px + 2, py + 2], fill=0)
+
+def canvas(line, shading, dashed=False):
+    image = Image.new('L', (440, 440), 255)
+    draw = ImageDraw.Draw(image)
+    draw_line(draw, *line, dashed=dashed)
+    shade(draw, shading)
+    return image
+
+# 正確答案: x + y - 2 >= 0 (實線，陰影在右上)
+ABOVE = lambda x, y: x + y - 2 > 1
+BELOW = lambda x, y: x + y - 2 < -1
+
+def test_full_line_with_correct_shading():
+    grading = grade_region_drawing(canvas(((-8, 10), (10, -8)), ABOVE), GRID, 1, 1, -2, '>=')
+    assert grading['verdict'] == 'correct'
+    assert grading['confidence'] >= MIN_CONFIDENCE
+
+def test_short_correct_line_is_not_failed():
+    grading = grade_region_drawing(canvas(((-1, 3), (3, -1)), ABOVE), GRID, 1, 1, -2, '>=')
+    assert grading['verdict'] == 'correct'
+    assert grading['confidence'] >= MIN_CONFIDENCE
+    assert grading['checks']['line']['coverage'] > 0.9
+
+def test_tiny_line_is_left_to_the_vision_model():
+    grading = grade_region_drawing(canvas(((0.5, 1.5), (1.5, 0.5)), ABOVE), GRID, 1, 1, -2, '>=')
+    assert grading['confidence'] < MIN_CONFIDENCE
+
+def test_wrong_side_shading():
+    grading = grade_region_drawing(canvas(((-8, 10), (10, -8)), BELOW), GRID, 1, 1, -2, '>=')
+    assert grading['verdict'] == 'incorrect'
+    assert grading['confidence'] >= MIN_CONFIDENCE
+    assert '陰影' in grading['reply']
+
+def test_wrong_slope_is_never_a_confident_verdict():
+    # 學生畫成 x - y - 2 = 0，陰影畫在自己那條線的一側
+    grading = grade_region_drawing(canvas(((-8, -10), (10, 8)), lambda x, y: x - y - 2 > 1), GRID, 1, 1, -2, '>=')
+    assert grading['confidence'] < MIN_CONFIDENCE
+
+def test_dashed_versus_solid():
+    solid = canvas(((-8, 10), (10, -8)), ABOVE)
+    dashed = canvas(((-8, 10), (10, -8)), ABOVE, dashed=True)
+    assert grade_region_drawing(dashed, GRID, 1, 1, -2, '>')['verdict'] == 'correct'
+    grading = grade_region_drawing(solid, GRID, 1, 1, -2, '>')
+    assert grading['verdict'] == 'incorrect' and '虛線' in grading['reply']
+    grading = grade_region_drawing(dashed, GRID, 1, 1, -2, '>=')
+    assert grading['verdict'] == 'incorrect' and '實線' in grading['reply']
@@ -0,0 +1,67 @@
+import time
+from flask import Flask, session
+from kv_store import LRUStore, SQLiteStore
+from session_store import ServerSideSessionInterface
+
+def make_app(memory, disk=None):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = ServerSideSessionInterface(memory, disk)
+
+    @app.route('/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return session.get('value', '')
+
+    return app
+
+def cookie(client):
+    return client.get_cookie('session').value
+
+def test_version_bumps_only_when_modified():
+    client = make_app(LRUStore()).test_client()
+    client.get('/set/a')
+    sid, version = cookie(client).split('.')
+    assert version == '1'
+    assert client.get('/get').text == 'a'
+    assert cookie(client) == f"{sid}.1"
+    client.get('/set/b')
+    assert cookie(client) == f"{sid}.2"
+    assert client.get('/get').text == 'b'
+
+def test_memory_keeps_only_latest_version():
+    memory = LRUStore()
+    client = make_app(memory).test_client()
+    for value in 'abc':
+        client.get(f'/set/{value}')
+    sid, version = cookie(client).split('.')
+    assert memory.stats()['size'] == 1
+    assert memory.get(sid)[0] == int(version) == 3
+    # 舊版本號的 cookie 對不上記憶體裡的版本，不會讀到舊內容
+    client.set_cookie('session', f"{sid}.2")
+    assert client.get('/get').text == ''
+
+def test_other_worker_sees_latest_version(tmp_path):
+    disk = SQLiteStore(str(tmp_path / 'sessions.db'), table='sessions')
+    worker_a = make_app(LRUStore(), disk).test_client()
+    worker_b = make_app(LRUStore(), disk).test_client()
+    worker_a.get('/set/a')
+    worker_b.set_cookie('session', cookie(worker_a))
+    assert worker_b.get('/get').text == 'a'
+    worker_b.get('/set/b')
+    # worker_a 的記憶體裡還有舊版本；新的 cookie 版本號對不上，改從 SQLite 讀最新的
+    worker_a.set_cookie('session', cookie(worker_b))
+    assert worker_a.get('/get').text == 'b'
+
+def test_expired_session_starts_over():
+    client = make_app(LRUStore(ttl=0.05)).test_client()
+    client.get('/set/a')
+    old = cookie(client)
+    time.sleep(0.1)
+    assert client.get('/get').text == ''
+    client.get('/set/b')
+    assert cookie(client).split('.')[0] != old.split('.')[0]
@@ -0,0 +1,88 @@
+import threading
+import pytest
+from ai_cache import ResponseCache
+from kv_store import LRUStore
+from single_flight import SingleFlight
+
+def run_concurrently(flights, fn, count=8):
+    results, errors = [], []
+    started = threading.Barrier(count)
+
+    def call():
+        started.wait()
+        try:
+            results.append(flights.do('key', fn, timeout=5))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+def test_concurrent_calls_are_collapsed():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait(0.2)  # leader 慢一點，其他人都會排到同一個 flight
+        return 'reply'
+
+    results, errors = run_concurrently(flights, fn)
+    assert errors == [] and results == ['reply'] * 8
+    assert len(calls) == 1
+    stats = flights.stats()
+    assert (stats['leaders'], stats['collapsed'], stats['in_flight']) == (1, 7, 0)
+
+def test_followers_get_the_leaders_error():
+    flights = SingleFlight()
+
+    def fn():
+        threading.Event().wait(0.2)
+        raise RuntimeError('boom')
+
+    results, errors = run_concurrently(flights, fn)
+    assert results == [] and len(errors) == 8
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert flights.stats()['errors'] == 1
+
+def test_later_calls_start_a_new_flight():
+    flights = SingleFlight()
+    assert flights.do('key', lambda: 1) == 1
+    assert flights.do('key', lambda: 2) == 2
+
+def test_follower_timeout():
+    flights = SingleFlight()
+    flight, leader = flights.begin('key')
+    assert leader
+    with pytest.raises(TimeoutError):
+        flights.do('key', lambda: None, timeout=0.01)
+    flights.finish('key', flight, result='late')
+
+def test_questions_differing_only_by_sign_do_not_coalesce():
+    cache = ResponseCache(LRUStore())
+    keys = [cache.make_key('二元一次聯立方程式', question, '第一步要做什麼？')
+            for question in ('-x + 2y = 5', 'x + 2y = 5')]
+    flights = SingleFlight()
+    both_running = threading.Barrier(2, timeout=5)  # 兩題各自呼叫模型，才會同時在這裡等到對方
+    results = {}
+
+    def ask(key, question):
+        def fn():
+            both_running.wait()
+            return f'reply to {question}'
+        results[question] = flights.do(key, fn, timeout=5)
+
+    threads = [threading.Thread(target=ask, args=(key, question))
+               for key, question in zip(keys, ('-x', 'x'))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {'-x': 'reply to -x', 'x': 'reply to x'}
+    stats = flights.stats()
+    assert (stats['leaders'], stats['collapsed']) == (2, 0)
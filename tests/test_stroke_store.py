@@ -0,0 +1,61 @@
+import pytest
+from kv_store import LRUStore
+from stroke_store import MAX_CANVAS_SIZE, MAX_POINTS, StrokeFormatError, StrokeStore, decode_points, parse_strokes, \
+    quantize_scale, rasterize
+
+def payload(strokes, width=200, height=100, **extra):
+    return dict({'v': 1, 'width': width, 'height': height, 'strokes': strokes}, **extra)
+
+def test_parse_strokes_limits():
+    strokes = parse_strokes(payload([{'p': ['10', 20, 5, 0], 'w': 3, 'e': True}],
+                                    grid={'origin_x': 100, 'origin_y': 50, 'unit': '10', 'range': 4}))
+    assert strokes['strokes'] == [{'c': '#000000', 'w': 3.0, 'e': 1, 'p': [10, 20, 5, 0]}]
+    assert strokes['grid']['unit'] == 10.0
+    for bad in (payload([], width=MAX_CANVAS_SIZE + 1),
+                payload([{'p': [1, 2, 3]}]),                        # 座標要成對
+                payload([{'p': [1, 2], 'w': 1000}]),                # 筆太粗
+                payload([{'p': [1, 2], 'c': 'not-a-color'}]),
+                payload([{'p': [0, 0] * (MAX_POINTS + 1)}]),
+                payload([], grid={'origin_x': 1}),
+                dict(payload([]), v=2)):
+        with pytest.raises(StrokeFormatError):
+            parse_strokes(bad)
+
+def test_decode_points_is_cumulative():
+    assert decode_points([10, 20, 5, -5, 0, 3]) == [(10, 20), (15, 15), (15, 18)]
+    assert decode_points([10, 20, 5, -5], scale=2.0) == [(20, 40), (30, 30)]
+
+def test_rasterize_draws_ink_eraser_and_a_light_grid():
+    strokes = parse_strokes(payload([
+        {'p': [20, 50, 160, 0], 'w': 4},
+        {'p': [100, 40, 0, 20], 'w': 6, 'e': 1},   # 橡皮擦把中間擦掉
+    ], grid={'origin_x': 100, 'origin_y': 50, 'unit': 10, 'range': 4}))
+    image = rasterize(strokes, scale=2.0)
+    assert image.size == (400, 200) and image.mode == 'L'
+    assert image.getpixel((100, 100)) == 0           # 筆跡
+    assert image.getpixel((200, 100)) == 255         # 被擦掉
+    assert 170 < image.getpixel((200, 20)) < 255     # 座標格線比批改的筆跡門檻淺
+
+def test_store_quantizes_and_clamps_scale():
+    assert [quantize_scale(value) for value in (0.1, 0.7, 1.5, 3.9, 100, float('nan'))] == \
+        [0.5, 0.5, 1.0, 2.0, 4.0, 0.5]
+    store = StrokeStore(LRUStore(), max_pixels=400 * 200)
+    strokes = parse_strokes(payload([{'p': [20, 50, 160, 0], 'w': 4}]))
+    stroke_id = store.save(strokes)
+    assert store.scale_for(strokes, 4.0) == 2.0      # 4 倍是 800x400，超過像素上限
+    assert store.rasterize(stroke_id, 4.0).size == (400, 200)
+    assert store.rasterize(stroke_id, 1.7).size == (200, 100)
+    store.rasterize(stroke_id, 1.2)                  # 和 1.7 一樣取到 1 倍，用快取
+    assert store.stats()['rasterized'] == 2
+    huge = StrokeStore(LRUStore(), max_pixels=1000)
+    assert huge.rasterize(huge.save(strokes), 4.0).size == (45, 22)  # 連 0.5 倍都太大：剛好 1000 px 左右
+
+def test_raster_cache_is_bounded_by_bytes():
+    store = StrokeStore(LRUStore(), raster_cache_bytes=200 * 100 * 2)
+    ids = [store.save(parse_strokes(payload([{'p': [i, 50, 10, 0]}]))) for i in range(3)]
+    for stroke_id in ids:
+        store.rasterize(stroke_id, 1.0)
+    cache = store.stats()['raster_cache']
+    assert cache['size'] == 2 and cache['bytes'] == 200 * 100 * 2
+    store.rasterize(ids[0], 1.0)                     # 最舊的已經被丟掉，要重新轉
+    assert store.stats()['rasterized'] == 4